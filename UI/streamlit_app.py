@@ -1,3 +1,5 @@
+import json
+
 import requests
 import streamlit as st
 
@@ -15,6 +17,7 @@ API_URL = "http://localhost:8000"
 st.sidebar.header("🛠️ Debug Controls")
 
 DEBUG_MODE = st.sidebar.checkbox("Enable Debug Mode", value=False)
+STREAM_MODE = st.sidebar.checkbox("Stream answer", value=True)
 
 TOP_K = st.sidebar.slider("Top-K Retrieved Chunks", 1, 10, 3)
 SIMILARITY_THRESHOLD = st.sidebar.slider(
@@ -57,6 +60,42 @@ if documents:
 else:
     st.sidebar.write("No documents available.")
 
+# ==============================
+# Streaming helper
+# ==============================
+def stream_query(payload, placeholder):
+    """
+    Reads the SSE stream from /query/stream, rendering tokens as they
+    arrive. Returns the final response (same shape as /query).
+    """
+    answer = ""
+    event = None
+    final = None
+
+    with requests.post(
+        f"{API_URL}/query/stream", json=payload, stream=True, timeout=30
+    ) as resp:
+        resp.raise_for_status()
+
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+
+                if event == "retrieval":
+                    placeholder.caption(
+                        f"Retrieved {data['retrieval']['retrieved_chunks']} chunks, generating…"
+                    )
+                elif event == "token":
+                    answer += data["text"]
+                    placeholder.markdown(answer + "▌")
+                elif event == "done":
+                    final = data
+
+    placeholder.empty()
+    return final
+
 # ==============================
 # User Input
 # ==============================
@@ -73,11 +112,14 @@ if question:
     }
 
     try:
-        response = requests.post(
-            f"{API_URL}/query",
-            json=payload,
-            timeout=30
-        ).json()
+        if STREAM_MODE:
+            response = stream_query(payload, st.empty())
+        else:
+            response = requests.post(
+                f"{API_URL}/query",
+                json=payload,
+                timeout=30
+            ).json()
     except Exception:
         st.error("❌ Backend API is not reachable")
         st.stop()
@@ -158,25 +200,46 @@ if response and response.get("answer"):
     st.divider()
     st.subheader("📊 Evaluation Metrics")
 
+    metrics = response.get("metrics") or {}
+    evaluation = response.get("evaluation") or {}
+    status = evaluation.get("status", "done")
+    # Metrics not computed (yet): deferred, skipped or not requested
+    missing = "pending" if status == "pending" else "skipped"
+
+    recall = metrics.get("recall_at_k")
+    coverage = metrics.get("context_coverage")
+    faithful = metrics.get("faithful")
+
     c1, c2, c3 = st.columns(3)
-    c1.metric("Recall@K", response["metrics"]["recall_at_k"])
-    c2.metric("Context Coverage", f"{response['metrics']['context_coverage']:.2f}")
+    c1.metric("Recall@K", recall if recall is not None else missing)
+    c2.metric("Context Coverage", f"{coverage:.2f}" if coverage is not None else missing)
     c3.metric(
         "Faithful Answer",
-        "Yes" if response["metrics"]["faithful"] else "No"
+        missing if faithful is None else ("Yes" if faithful else "No")
     )
 
-    st.subheader("🧠 Hallucination Check")
-    grounding = response["metrics"]["grounding_score"]
+    if status == "pending":
+        st.caption(
+            f"Evaluation is running in the background: "
+            f"GET /evaluations/{evaluation.get('request_id')}"
+        )
+    elif status in ("skipped", "dropped"):
+        st.caption(f"Evaluation {status} for this query.")
 
-    st.write(f"Grounding Score: **{grounding:.3f}**")
+    st.subheader("🧠 Hallucination Check")
+    grounding = metrics.get("grounding_score")
 
-    if grounding < 0.6:
-        st.error("⚠️ High hallucination risk")
-    elif grounding < 0.75:
-        st.warning("⚠️ Partial grounding")
+    if grounding is None:
+        st.write(f"Grounding Score: **{missing}**")
     else:
-        st.success("✅ Well grounded")
+        st.write(f"Grounding Score: **{grounding:.3f}**")
+
+        if grounding < 0.6:
+            st.error("⚠️ High hallucination risk")
+        elif grounding < 0.75:
+            st.warning("⚠️ Partial grounding")
+        else:
+            st.success("✅ Well grounded")
 
 # ==============================
 # FAILURE PATH
@@ -245,8 +308,11 @@ else:
     total_sec = latency.get("total_sec", 0.0)
     retrieval_sec = latency.get("retrieval_sec", 0.0)
     llm_sec = latency.get("llm_sec", 0.0)
+    ttft_sec = latency.get("time_to_first_token_sec")
 
     st.metric("Total Latency (sec)", round(total_sec, 3))
+    if ttft_sec is not None:
+        st.metric("Time to First Token (sec)", round(ttft_sec, 3))
     st.caption(
         f"Retrieval: {retrieval_sec}s | LLM: {llm_sec}s"
     )
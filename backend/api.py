@@ -1,30 +1,99 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+import json
 import os
+import uuid
 from pydantic import BaseModel
 
-from backend.schemas import QueryRequest, QueryResponse
-from backend.rag_service import answer_question
-from backend.state import state, DATA_DIR
+from backend.schemas import (
+    QueryRequest, QueryResponse, BatchQueryRequest, ReindexRequest
+)
+from backend.rag_service import answer_question, answer_questions, stream_question
+from backend.executor import ModelExecutor, Overloaded
+from backend.evaluator import EvaluationWorker, MetricsStore
+from backend.lifecycle import resources, LLM_BATCH_SIZE
 
-from retrieval.similarity import retrieve_top_k
-from llm.llm_model import LLM
-from rag_core.pipeline import RAGPipeline
+from llm.batcher import BatchingLLM
+from rag_core.answer_cache import SemanticAnswerCache
+from rag_core.telemetry import telemetry
 
 # ------------------------------
 # App
 # ------------------------------
-app = FastAPI(title="RAG API")
+@asynccontextmanager
+async def lifespan(app):
+    # RAG_WARMUP: "background" (default) | "blocking" | "off" (load on first use)
+    mode = os.getenv("RAG_WARMUP", "background")
+    if mode != "off":
+        resources.warmup(background=(mode != "blocking"))
+    yield
+    model_executor.shutdown()
+
+app = FastAPI(title="RAG API", lifespan=lifespan)
 
 # ------------------------------
-# Pipeline (no document loading here)
+# Pipeline (models load lazily, see backend.lifecycle)
 # ------------------------------
-llm = LLM()
-pipeline = RAGPipeline(
-    embedding_model=state.embedding_model,
-    llm=llm,
-    retriever=retrieve_top_k
+answer_cache = SemanticAnswerCache(
+    max_distance=float(os.getenv("RAG_ANSWER_CACHE_DISTANCE", "0.05")),
+    maxsize=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1024"))
+)
+
+# Model calls run on their own sized pool, never on the event loop.
+# Enough workers to fill an LLM batch; the batcher serializes generation.
+model_workers = int(os.getenv("RAG_MODEL_WORKERS", str(max(2, LLM_BATCH_SIZE))))
+model_executor = ModelExecutor(
+    max_workers=model_workers,
+    max_in_flight=int(os.getenv("RAG_MAX_IN_FLIGHT", str(model_workers))),
+    max_queue=int(os.getenv("RAG_MAX_QUEUE", "32"))
+)
+
+# Deferred evaluation metrics are computed here, off the request path
+EVALUATION_MODE = os.getenv("RAG_EVALUATION", "sync")
+evaluator = EvaluationWorker(
+    MetricsStore(maxsize=int(os.getenv("RAG_EVAL_STORE_SIZE", "10000"))),
+    max_queue=int(os.getenv("RAG_EVAL_QUEUE", "1024"))
 )
 
+
+def busy(exc):
+    telemetry.inc("rag_rejected_total", help="Requests rejected with 503 (overloaded)")
+    return HTTPException(
+        status_code=503,
+        detail=f"Server busy: {exc}",
+        headers={"Retry-After": "1"}
+    )
+
+# ------------------------------
+# Gauges sampled at scrape time
+# ------------------------------
+def _index_gauges():
+    if not resources.loaded("state"):
+        return {}
+    snapshot = resources.state.snapshot
+    return {
+        "chunks": snapshot.chunk_count,
+        "documents": len(snapshot.manifest),
+        "version": snapshot.version
+    }
+
+telemetry.register_gauges("rag_executor", model_executor.stats)
+telemetry.register_gauges("rag_answer_cache", answer_cache.stats)
+telemetry.register_gauges("rag_query_cache", lambda: (
+    resources.pipeline.query_cache.stats() if resources.loaded("pipeline") else {}
+))
+telemetry.register_gauges("rag_llm_batch", lambda: (
+    resources.llm.stats()
+    if resources.loaded("llm") and isinstance(resources.llm, BatchingLLM) else {}
+))
+telemetry.register_gauges("rag_index", _index_gauges)
+telemetry.register_gauges("rag_reranker", lambda: (
+    resources.pipeline.reranker.stats()
+    if resources.loaded("pipeline") and resources.pipeline.reranker is not None else {}
+))
+telemetry.register_gauges("rag_evaluator", evaluator.stats)
+
 # ------------------------------
 # Root
 # ------------------------------
@@ -32,17 +101,79 @@ pipeline = RAGPipeline(
 def root():
     return {"message": "RAG API is running", "docs": "/docs"}
 
+# ------------------------------
+# Liveness / readiness
+# ------------------------------
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    info = resources.describe()
+    return JSONResponse(info, status_code=200 if resources.is_ready() else 503)
+
+# ------------------------------
+# Cache stats
+# ------------------------------
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "query_embeddings": (
+            resources.pipeline.query_cache.stats()
+            if resources.loaded("pipeline") else None
+        ),
+        "answers": answer_cache.stats()
+    }
+
+# ------------------------------
+# LLM batching stats
+# ------------------------------
+@app.get("/llm/stats")
+def llm_stats():
+    return {
+        "batching": (
+            resources.llm.stats()
+            if resources.loaded("llm") and isinstance(resources.llm, BatchingLLM)
+            else None
+        ),
+        "executor": model_executor.stats()
+    }
+
+# ------------------------------
+# Metrics (Prometheus text format) / stage percentiles (JSON)
+# ------------------------------
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/latency")
+def latency_metrics():
+    return telemetry.snapshot()
+
+# ------------------------------
+# Deferred evaluation results
+# ------------------------------
+@app.get("/evaluations/{request_id}")
+def get_evaluation(request_id: str):
+    entry = evaluator.store.get(request_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown request id")
+    return {"request_id": request_id, **entry}
+
 # ------------------------------
 # Upload document
 # ------------------------------
 @app.post("/upload")
-def upload_document(file: UploadFile = File(...)):
-    file_path = os.path.join(DATA_DIR, file.filename)
+def upload_document(file: UploadFile = File(...), tags: str = Form("")):
+    file_path = os.path.join(resources.state.data_dir, file.filename)
 
     with open(file_path, "wb") as f:
         f.write(file.file.read())
 
-    state.reload()  # rebuild chunks + embeddings
+    # Comma-separated tags, matched by QueryFilters.tags
+    tag_list = [t.strip() for t in tags.split(",") if t.strip()]
+    resources.state.index_document(file.filename, tags=tag_list)  # embeds only this file
     return {"message": f"{file.filename} uploaded and indexed successfully"}
 
 # ------------------------------
@@ -50,7 +181,14 @@ def upload_document(file: UploadFile = File(...)):
 # ------------------------------
 @app.get("/documents")
 def list_documents():
-    return {"documents": os.listdir(DATA_DIR)}
+    state = resources.state
+    return {
+        "documents": os.listdir(state.data_dir),
+        "metadata": {
+            source: {"uploaded": entry.get("uploaded"), "tags": entry.get("tags", [])}
+            for source, entry in state.snapshot.manifest.items()
+        }
+    }
 
 # ------------------------------
 # Delete document
@@ -60,33 +198,186 @@ class DeleteRequest(BaseModel):
 
 @app.delete("/documents")
 def delete_document(req: DeleteRequest):
-    file_path = os.path.join(DATA_DIR, req.filename)
+    file_path = os.path.join(resources.state.data_dir, req.filename)
 
     if not os.path.exists(file_path):
         return {"error": "File not found"}
 
     os.remove(file_path)
-    state.reload()
+    resources.state.remove_document(req.filename)
     return {"message": f"{req.filename} deleted successfully"}
 
+# ------------------------------
+# Full re-index
+# ------------------------------
+@app.post("/reindex")
+def reindex(req: ReindexRequest):
+    state = resources.state
+    state.reload(workers=max(1, req.workers))
+    snapshot = state.snapshot
+    return {
+        "message": "Index rebuilt",
+        "documents": len(snapshot.manifest),
+        "chunks": snapshot.chunk_count
+    }
+
 # ------------------------------
 # Query endpoint (FINAL)
 # ------------------------------
+# These run on the model executor, so a first request that triggers
+# lazy model loading never blocks the event loop. Each takes the index
+# snapshot once, so an upload mid-request can't mix two versions.
+def _retrieval_options(request, state, snapshot):
+    return {
+        "lexical_index": snapshot.lexical,
+        "retrieval_mode": request.retrieval_mode,
+        "fusion": request.fusion,
+        "alpha": request.alpha,
+        "row_filter": _row_filter(request, state, snapshot),
+        "snapshot": snapshot
+    }
+
+
+def _row_filter(request, state, snapshot):
+    filters = request.filters.dict() if request.filters is not None else None
+    return state.row_filter(filters, snapshot)
+
+
+def _evaluation_options(request, request_id):
+    return {
+        "metrics": request.metrics,
+        "evaluation": request.evaluation or EVALUATION_MODE,
+        "evaluator": evaluator,
+        "request_id": request_id
+    }
+
+
+def _answer(request, request_id):
+    state = resources.state
+    snapshot = state.snapshot
+    return answer_question(
+        request.question,
+        request.top_k,
+        request.threshold,
+        resources.pipeline,
+        snapshot.chunk_embeddings,
+        snapshot.chunks,
+        state.embedding_model,
+        answer_cache=answer_cache,
+        index_version=snapshot.version,
+        **_evaluation_options(request, request_id),
+        **_retrieval_options(request, state, snapshot)
+    )
+
+
+def _answer_batch(request):
+    state = resources.state
+    snapshot = state.snapshot
+    return answer_questions(
+        request.questions,
+        request.top_k,
+        request.threshold,
+        resources.pipeline,
+        snapshot.chunk_embeddings,
+        snapshot.chunks,
+        state.embedding_model,
+        batch_size=max(1, request.batch_size),
+        metrics=request.metrics,
+        row_filter=_row_filter(request, state, snapshot),
+        snapshot=snapshot
+    )
+
+
+def _stream(request, request_id):
+    state = resources.state
+    snapshot = state.snapshot
+    yield from stream_question(
+        request.question,
+        request.top_k,
+        request.threshold,
+        resources.pipeline,
+        snapshot.chunk_embeddings,
+        snapshot.chunks,
+        state.embedding_model,
+        **_evaluation_options(request, request_id),
+        **_retrieval_options(request, state, snapshot)
+    )
+
+
 @app.post("/query", response_model=QueryResponse)
-def query_rag(request: QueryRequest):
+async def query_rag(request: QueryRequest):
     """
     Thin API layer.
     All logic lives inside rag_service.answer_question
     """
 
-    result = answer_question(
-        request.question,
-        request.top_k,
-        request.threshold,
-        pipeline,
-        state.chunk_embeddings,
-        state.chunks,
-        state.embedding_model
-    )
+    request_id = uuid.uuid4().hex
+    try:
+        result, waits = await model_executor.run(_answer, request, request_id)
+    except Overloaded as exc:
+        raise busy(exc)
 
+    result["request_id"] = request_id
+    result["performance"]["queue"] = waits
     return result
+
+# ------------------------------
+# Batch query endpoint
+# ------------------------------
+@app.post("/query/batch")
+async def query_rag_batch(request: BatchQueryRequest):
+    """
+    Answers many questions in one call: one embedding batch, one
+    retrieval matmul, batched generation. Generation goes through the
+    shared micro-batcher, so `batch_size` is capped at
+    $RAG_LLM_BATCH_SIZE prompts per forward pass.
+    """
+
+    try:
+        results, waits = await model_executor.run(_answer_batch, request)
+    except Overloaded as exc:
+        raise busy(exc)
+
+    total_sec = max((r["performance"]["latency"]["total_sec"] for r in results), default=0.0)
+    return {
+        "results": results,
+        "performance": {
+            "questions": len(results),
+            "total_sec": total_sec,
+            "questions_per_sec": round(len(results) / total_sec, 3) if total_sec else 0.0,
+            "queue": waits
+        }
+    }
+
+# ------------------------------
+# Streaming query endpoint (SSE)
+# ------------------------------
+@app.post("/query/stream")
+async def query_rag_stream(request: QueryRequest):
+    """
+    Server-sent events: `retrieval` first, then one `token` event per
+    decoded piece, then `done` with the full /query response.
+    """
+
+    request_id = uuid.uuid4().hex
+    try:
+        events, waits = await model_executor.stream(_stream, request, request_id)
+    except Overloaded as exc:
+        raise busy(exc)
+
+    async def sse():
+        try:
+            async for event, payload in events:
+                if event == "done":
+                    payload["request_id"] = request_id
+                    payload["performance"]["queue"] = waits
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            # Frees the executor slot as soon as the client goes away
+            await events.aclose()
+
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,100 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("rag.evaluator")
+
+
+class MetricsStore:
+    """
+    Evaluation results keyed by request id.
+
+    Each entry is {"status": "pending" | "done" | "failed" | "dropped",
+    "metrics": {...}}. The oldest entries are evicted beyond `maxsize`.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, request_id, status, metrics=None, error=None):
+        entry = {"status": status, "metrics": metrics, "updated": time.time()}
+        if error is not None:
+            entry["error"] = error
+
+        with self._lock:
+            self._data[request_id] = entry
+            self._data.move_to_end(request_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, request_id):
+        with self._lock:
+            return self._data.get(request_id)
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for entry in self._data.values():
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return {"size": len(self._data), "maxsize": self.maxsize, **counts}
+
+
+class EvaluationWorker:
+    """
+    Runs evaluation jobs off the request path.
+
+    `submit(request_id, job)` queues a callable returning a metrics dict;
+    one background thread runs jobs in order and posts each result to
+    `store`. When the queue is full the job is dropped (recorded as
+    "dropped") rather than slowing the request down.
+    """
+
+    def __init__(self, store=None, max_queue=1024):
+        self.store = store or MetricsStore()
+        self._queue = queue.Queue(maxsize=max_queue)
+
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self._worker = threading.Thread(
+            target=self._run, name="rag-evaluator", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, request_id, job):
+        # Marked pending first so a fast worker's result is never overwritten
+        self.store.put(request_id, "pending")
+        try:
+            self._queue.put_nowait((request_id, job))
+        except queue.Full:
+            self.dropped += 1
+            self.store.put(request_id, "dropped")
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            request_id, job = self._queue.get()
+            try:
+                metrics = job()
+            except Exception as exc:
+                logger.exception("evaluation for %s failed", request_id)
+                self.failed += 1
+                self.store.put(request_id, "failed", error=repr(exc))
+                continue
+
+            self.completed += 1
+            self.store.put(request_id, "done", metrics)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped
+        }
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+_END = object()
+
+
+def _timed_next(items):
+    return time.perf_counter(), next(items, _END)
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full; maps to HTTP 503."""
+
+
+class ModelExecutor:
+    """
+    Runs blocking model work (embedding, retrieval, generation) off the
+    event loop on a dedicated, sized thread pool.
+
+    - At most `max_in_flight` calls run at once (asyncio semaphore), so
+      concurrent generations cannot oversubscribe the CPU.
+    - At most `max_queue` callers may wait for a slot; beyond that new
+      requests are rejected immediately instead of growing tail latency.
+    """
+
+    def __init__(self, max_workers=2, max_in_flight=None, max_queue=32):
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight or max_workers
+        self.max_queue = max_queue
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="model"
+        )
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def _admit(self):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(
+                f"{self.waiting} requests already queued (limit {self.max_queue})"
+            )
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        return time.perf_counter() - queued_at
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Returns:
+            (result, waits): fn's result and the seconds spent waiting
+            for admission and for a free executor thread.
+        """
+        admission_wait = await self._admit()
+        admitted_at = time.perf_counter()
+
+        try:
+            def call():
+                started_at = time.perf_counter()
+                return fn(*args, **kwargs), started_at
+
+            loop = asyncio.get_running_loop()
+            result, started_at = await loop.run_in_executor(self._pool, call)
+            self.completed += 1
+        finally:
+            self._release()
+
+        return result, {
+            "admission_wait_sec": round(admission_wait, 4),
+            "executor_wait_sec": round(started_at - admitted_at, 4)
+        }
+
+    async def stream(self, fn, *args, **kwargs):
+        """
+        Steps the blocking generator `fn(*args, **kwargs)` on the pool.
+
+        Admission and the first step run before this returns, so
+        Overloaded, or an error before the first item, reaches the
+        caller before any response has started. The slot is held until
+        the iterator is exhausted or closed; one that is dropped without
+        being iterated is closed by asyncio's async generator finalizer.
+
+        Returns:
+            (items, waits): async iterator over every item, and the
+            same waits as run().
+        """
+        waits = {}
+        steps = self._iterate(fn, args, kwargs, waits)
+        try:
+            first = await steps.__anext__()
+        except StopAsyncIteration:
+            first = _END
+        return self._resume(first, steps), waits
+
+    async def _iterate(self, fn, args, kwargs, waits):
+        admission_wait = await self._admit()
+        admitted_at = time.perf_counter()
+
+        items = fn(*args, **kwargs)
+        step = None
+        try:
+            while True:
+                step = self._pool.submit(_timed_next, items)
+                started_at, item = await asyncio.wrap_future(step)
+                if not waits:
+                    waits["admission_wait_sec"] = round(admission_wait, 4)
+                    waits["executor_wait_sec"] = round(started_at - admitted_at, 4)
+                if item is _END:
+                    break
+                yield item
+            self.completed += 1
+        finally:
+            # A cancelled await leaves the step running on the pool;
+            # the generator can only be closed once it returns
+            if step is not None and not step.done():
+                await asyncio.wait([asyncio.wrap_future(step)])
+            items.close()
+            self._release()
+
+    async def _resume(self, first, steps):
+        try:
+            if first is _END:
+                return
+            yield first
+            async for item in steps:
+                yield item
+        finally:
+            await steps.aclose()
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
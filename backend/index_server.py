@@ -0,0 +1,263 @@
+"""
+One process per host owns the document index.
+
+    python -m backend.index_server --socket /tmp/rag-index.sock
+    RAG_INDEX_SERVER=/tmp/rag-index.sock uvicorn backend.api:app --workers 4
+
+The server runs ingestion and every write (upload, delete, reindex),
+and saves each index version with its chunks, BM25 segments and the
+quantized codes $RAG_RETRIEVER calls for. API workers map all of it
+read-only, so the page cache holds one copy for all of them and no
+worker rebuilds or writes anything. Writes are forwarded over a Unix
+socket. Each write bumps a generation counter in shared memory;
+workers compare it on every request and, when it moved, map the new
+version in the background: only the log records added since the
+version they hold are read. An upload handled by one worker is
+visible to all of them moments later, and no request waits for it.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from backend.state import DATA_DIR, DocumentState
+from embeddings.index_store import INDEX_DIR
+
+logger = logging.getLogger(__name__)
+
+WRITE_OPS = ("index_document", "remove_document", "reload", "refresh")
+LOAD_ATTEMPTS = 5
+
+
+class IndexServer:
+    """
+    Serves a DocumentState to API workers over a Unix socket.
+
+    Requests are (op, kwargs) tuples answered with ("ok", result) or
+    ("error", message); each connection gets its own thread and the
+    state's lock serializes writes.
+    """
+
+    def __init__(self, address, state):
+        self.address = address
+        self.state = state
+
+        self._shm = shared_memory.SharedMemory(create=True, size=8)
+        self._generation = np.ndarray((1,), dtype=np.int64, buffer=self._shm.buf)
+        self._generation[0] = 1
+        self._lock = threading.Lock()
+        self._listener = None
+        # Compactions publish a version of their own
+        state.on_compacted = self._broadcast
+
+    @property
+    def generation(self):
+        return int(self._generation[0])
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)  # left behind by a server that died
+
+        self._listener = Listener(self.address, family="AF_UNIX")
+        # Requests are unpickled: only this user may connect
+        os.chmod(self.address, 0o600)
+        logger.info("Index server on %s (%d chunks)", self.address, self.state.snapshot.chunk_count)
+
+        try:
+            while True:
+                conn = self._listener.accept()
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()  # also removes the socket file
+            self._listener = None
+        self._shm.close()
+        self._shm.unlink()
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    reply = ("ok", self.handle(op, kwargs))
+                except Exception as exc:
+                    logger.exception("Index server op %s failed", op)
+                    reply = ("error", repr(exc))
+                conn.send(reply)
+
+    def handle(self, op, kwargs):
+        state = self.state
+
+        if op == "hello":
+            return {
+                "shm": self._shm.name,
+                "data_dir": state.data_dir,
+                "index_dir": state.index_dir,
+                "fingerprint": state.fingerprint
+            }
+        if op == "stats":
+            snapshot = state.snapshot
+            return {
+                "generation": self.generation,
+                "chunks": snapshot.chunk_count,
+                "documents": len(snapshot.manifest)
+            }
+        if op not in WRITE_OPS:
+            raise ValueError(f"Unknown op: {op}")
+
+        result = getattr(state, op)(**kwargs)
+        if result is not False:
+            self._broadcast()
+        return result
+
+    def _broadcast(self):
+        # Workers re-map on their next request
+        with self._lock:
+            self._generation[0] += 1
+
+
+class RemoteDocumentState(DocumentState):
+    """
+    DocumentState of an API worker in index-server mode.
+
+    Reads come from the server's index files, mapped read-only; writes
+    are sent to the server. `sync` re-maps the index whenever the
+    server's generation counter has moved.
+    """
+
+    def __init__(self, address, batch_size=256, embedding_model=None):
+        self.address = address
+        self._conn = Client(address, family="AF_UNIX")
+        self._conn_lock = threading.Lock()
+        self._hello = self._call("hello")
+
+        self._shm = shared_memory.SharedMemory(name=self._hello["shm"])
+        # Before Python 3.13 attaching also registers the segment with
+        # this process's resource tracker, which would unlink it on exit
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._generation = np.ndarray((1,), dtype=np.int64, buffer=self._shm.buf)
+        self.generation = None
+        self._syncing = None
+        self._syncing_lock = threading.Lock()
+
+        super().__init__(
+            self._hello["data_dir"], self._hello["index_dir"], batch_size, embedding_model
+        )
+
+    def _call(self, op, **kwargs):
+        with self._conn_lock:
+            self._conn.send((op, kwargs))
+            status, result = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Index server {op} failed: {result}")
+        return result
+
+    def open(self):
+        if self.fingerprint != self._hello["fingerprint"]:
+            raise RuntimeError(
+                "Index server uses a different embedding model or chunker: "
+                f"{self._hello['fingerprint']} != {self.fingerprint}"
+            )
+        self.sync()
+
+    def sync(self, wait=True):
+        # Read before mapping: a write racing the load re-maps next time
+        generation = int(self._generation[0])
+        if generation == self.generation:
+            return False
+
+        # Requests pass wait=False: they go on with the snapshot already
+        # published while a background thread maps the new one
+        if not wait:
+            self._sync_in_background()
+            return False
+
+        with self._lock:
+            if generation == self.generation:
+                return False
+            for attempt in range(LOAD_ATTEMPTS):
+                if self.load():
+                    break
+                # The version we read was pruned as newer ones landed
+                time.sleep(0.05 * (attempt + 1))
+            else:
+                raise RuntimeError(f"No index at {self.index_dir}")
+            self.generation = generation
+            return True
+
+    def _sync_in_background(self):
+        with self._syncing_lock:
+            if self._syncing is not None and self._syncing.is_alive():
+                return
+            self._syncing = threading.Thread(
+                target=self._sync_logged, name="index-sync", daemon=True
+            )
+            self._syncing.start()
+
+    def _sync_logged(self):
+        try:
+            self.sync()
+        except Exception:
+            logger.exception("Index sync failed")
+
+    def index_document(self, filename, tags=None):
+        changed = self._call("index_document", filename=filename, tags=tags)
+        self.sync()
+        return changed
+
+    def remove_document(self, filename):
+        removed = self._call("remove_document", filename=filename)
+        self.sync()
+        return removed
+
+    def reload(self, workers=1, queue_size=8):
+        self._call("reload", workers=workers, queue_size=queue_size)
+        self.sync()
+
+    def refresh(self):
+        changed = self._call("refresh")
+        self.sync()
+        return changed
+
+    def save(self, draft):
+        raise RuntimeError("Workers in index-server mode never write the index")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local RAG index server")
+    parser.add_argument(
+        "--socket", default=os.getenv("RAG_INDEX_SERVER", "/tmp/rag-index.sock"),
+        help="Unix socket path (default: $RAG_INDEX_SERVER)"
+    )
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Unwind through serve_forever so the shared memory is released
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    # Absolute, so workers started from another directory agree
+    state = DocumentState(
+        os.path.abspath(args.data_dir), os.path.abspath(args.index_dir), args.batch_size
+    )
+    IndexServer(args.socket, state).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+
+from backend.state import DocumentState
+from retrieval.retrievers import build_retriever
+from retrieval.reranker import build_reranker
+from rag_core.pipeline import RAGPipeline
+from rag_core.cache import LRUCache
+
+LLM_BATCH_SIZE = int(os.getenv("RAG_LLM_BATCH_SIZE", "8"))
+# Unix socket of a backend.index_server process; unset = own index
+INDEX_SERVER = os.getenv("RAG_INDEX_SERVER")
+
+
+def _build_state():
+    if INDEX_SERVER:
+        from backend.index_server import RemoteDocumentState
+
+        return RemoteDocumentState(INDEX_SERVER)
+    return DocumentState()
+
+
+def _build_llm():
+    # Backend from $RAG_LLM_BACKEND; transformers/torch are only
+    # imported by the model backends, and that is most of the cold start
+    from llm.llm_model import build_llm
+
+    return _batched(build_llm())
+
+
+def _batched(llm):
+    from llm.batcher import BatchingLLM
+
+    # Concurrent generations are micro-batched into one forward pass
+    if LLM_BATCH_SIZE > 1:
+        llm = BatchingLLM(
+            llm,
+            max_batch_size=LLM_BATCH_SIZE,
+            max_wait_ms=float(os.getenv("RAG_LLM_BATCH_WAIT_MS", "10"))
+        )
+    return llm
+
+
+class Resources:
+    """
+    Lazily loads the heavy objects behind the API: the document index
+    (embedding model + corpus) and the LLM.
+
+    Nothing is loaded at import time. Each resource is built on first
+    access, or ahead of time by `warmup`, which can run in a background
+    thread so the server answers liveness checks while models load.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._llm = None
+        self._pipeline = None
+
+        self._state_lock = threading.Lock()
+        self._llm_lock = threading.Lock()
+        self._pipeline_lock = threading.Lock()
+
+        self.status = "cold"  # cold -> warming -> ready | failed
+        self.error = None
+        self.load_times = {}
+
+    def _load(self, name, lock, build):
+        value = getattr(self, name)
+        if value is not None:
+            return value
+
+        with lock:
+            value = getattr(self, name)
+            if value is None:
+                t0 = time.perf_counter()
+                value = build()
+                self.load_times[name.lstrip("_")] = round(time.perf_counter() - t0, 3)
+                setattr(self, name, value)
+        return value
+
+    @property
+    def state(self):
+        state = self._load("_state", self._state_lock, _build_state)
+        state.sync(wait=False)  # one shared-memory read unless another worker wrote
+        return state
+
+    @property
+    def llm(self):
+        return self._load("_llm", self._llm_lock, _build_llm)
+
+    @property
+    def pipeline(self):
+        return self._load("_pipeline", self._pipeline_lock, lambda: RAGPipeline(
+            embedding_model=self.state.embedding_model,
+            llm=self.llm,
+            retriever=build_retriever(),
+            query_cache=LRUCache(maxsize=int(os.getenv("RAG_QUERY_CACHE_SIZE", "4096"))),
+            reranker=build_reranker()
+        ))
+
+    def provide(self, state=None, llm=None):
+        """
+        Installs prebuilt resources in place of the defaults, e.g. a
+        stand-in LLM for benchmarks. The pipeline is rebuilt on next use.
+        """
+        if state is not None:
+            self._state = state
+        if llm is not None:
+            self._llm = _batched(llm)
+        self._pipeline = None
+
+    def loaded(self, name):
+        return getattr(self, "_" + name) is not None
+
+    def is_ready(self):
+        return self.loaded("pipeline")
+
+    def warmup(self, background=True):
+        def run():
+            self.status = "warming"
+            try:
+                self.pipeline
+                self.status = "ready"
+            except Exception as exc:
+                self.status = "failed"
+                self.error = repr(exc)
+
+        if not background:
+            run()
+            return None
+
+        thread = threading.Thread(target=run, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def describe(self):
+        return {
+            "status": "ready" if self.is_ready() else self.status,
+            "loaded": {
+                name: self.loaded(name) for name in ("state", "llm", "pipeline")
+            },
+            "load_sec": self.load_times,
+            "error": self.error
+        }
+
+
+resources = Resources()
@@ -1,44 +1,81 @@
 import time
+import uuid
+from contextlib import nullcontext
+
+import numpy as np
 
 from evaluation.retrieval_metrics import recall_at_k
 from evaluation.context_coverage import context_coverage
 from evaluation.faithfulness import is_faithful
 from evaluation.hallucination import grounding_score
 from llm.utils import estimate_tokens
+from rag_core.answer_cache import chunk_set_key
+from rag_core.telemetry import Trace, telemetry
 
+METRICS = ("recall_at_k", "context_coverage", "grounding_score")
 
-def answer_question(
-    question,
-    top_k,
-    threshold,
-    pipeline,
-    chunk_embeddings,
-    chunks,
-    embedding_model
-):
-    start_time = time.time()
 
+def _retrieve(question, top_k, threshold, pipeline, chunk_embeddings, chunks, trace,
+              lexical_index=None, retrieval_mode="dense", fusion="rrf", alpha=0.5,
+              row_filter=None, snapshot=None):
     # ------------------------------
     # Query rewriting
     # ------------------------------
-    rewritten = pipeline.rewrite_query(question)
+    with trace.span("rewrite"):
+        rewritten = pipeline.rewrite_query(question)
 
     # ------------------------------
     # Retrieval
     # ------------------------------
-    t0 = time.time()
-    retrieved = pipeline.retrieve(
-        rewritten,
-        chunk_embeddings,
-        chunks,
-        top_k
-    )
-    retrieval_time = time.time() - t0
+    t0 = time.perf_counter()
+    with trace.span("embed"):
+        query_emb = pipeline.embed_query(rewritten)
+
+    # A re-ranker, if configured, picks top_k from a wider candidate set
+    candidates = pipeline.candidates(top_k)
+    with trace.span("search"):
+        if retrieval_mode == "dense" or lexical_index is None:
+            retrieved = pipeline.search(
+                query_emb,
+                chunk_embeddings,
+                chunks,
+                candidates,
+                row_filter=row_filter,
+                snapshot=snapshot
+            )
+        else:
+            retrieved = pipeline.search_hybrid(
+                rewritten,
+                query_emb,
+                chunk_embeddings,
+                chunks,
+                lexical_index,
+                candidates,
+                mode=retrieval_mode,
+                fusion=fusion,
+                alpha=alpha,
+                row_filter=row_filter,
+                snapshot=snapshot
+            )
+    if pipeline.reranker is not None:
+        with trace.span("rerank"):
+            retrieved = pipeline.rerank(rewritten, retrieved, top_k)
+    retrieval_time = time.perf_counter() - t0
+
+    return {
+        "rewritten": rewritten,
+        "query_emb": query_emb,
+        "retrieval_time": retrieval_time,
+        **_select(retrieved, top_k, threshold, chunks, retrieval_mode, row_filter)
+    }
+
 
-    used_chunks = []
+def _select(retrieved, top_k, threshold, chunks, retrieval_mode="dense", row_filter=None):
+    used_hits = []
     retrieval_debug = []
 
-    for idx, (score, text, source) in enumerate(retrieved, start=1):
+    for idx, hit in enumerate(retrieved, start=1):
+        score, text, source = hit
         used = bool(score >= threshold)
 
         retrieval_debug.append({
@@ -48,35 +85,63 @@ def answer_question(
             "source": source,
             "used": used
         })
+        if hasattr(hit, "rerank_score"):
+            retrieval_debug[-1]["rerank_score"] = hit.rerank_score
 
         if used:
-            used_chunks.append(text)
+            used_hits.append(hit)
 
-    # ------------------------------
-    # If nothing usable retrieved
-    # ------------------------------
-    if not used_chunks:
-        
-
-        return {
-            "query": {
-                "original": question,
-                "rewritten": rewritten
-            },
-            "answer": "",
-        "sources": [],
+    return {
+        "retrieved": retrieved,
+        "used_hits": used_hits,
+        "used_chunks": [hit[1] for hit in used_hits],
+        "used_rows": [getattr(hit, "row", None) for hit in used_hits],
         "retrieval": {
-            "top_k": top_k,
-            "threshold": threshold,
-            "total_chunks": len(chunks),
-            "retrieved_chunks": len(retrieved),
-            "used_chunks": 0,
+            "top_k": int(top_k),
+            "threshold": float(threshold),
+            "mode": retrieval_mode,
+            "total_chunks": int(len(chunks)),
+            "searched_chunks": int(len(chunks) if row_filter is None else len(row_filter)),
+            "retrieved_chunks": int(len(retrieved)),
+            "used_chunks": int(len(used_hits)),
             "chunks": retrieval_debug
+        }
+    }
+
+
+def _pack(question, r, pipeline, trace):
+    """
+    Builds the prompt from the chunks that passed the threshold, within
+    the LLM's input-token budget; packing stats go in the response.
+    """
+    with trace.span("prompt"):
+        context = pipeline.assemble(question, r["used_hits"], r["retrieval"]["threshold"])
+
+    r["retrieval"]["context"] = {
+        "packed_chunks": len(context["hits"]),
+        "duplicates_dropped": context["duplicates"],
+        "over_budget_dropped": context["over_budget"],
+        "prompt_tokens": context["prompt_tokens"],
+        "max_input_tokens": context["budget"]
+    }
+    return context
+
+
+def _failure_response(question, r, trace):
+    retrieval_debug = r["retrieval"]["chunks"]
+
+    return {
+        "query": {
+            "original": question,
+            "rewritten": r["rewritten"]
         },
+        "answer": "",
+        "sources": [],
+        "retrieval": r["retrieval"],
         "failure": {
             "type": "BELOW_THRESHOLD",
             "reason": "No retrieved chunks passed the similarity threshold",
-            "threshold": threshold,
+            "threshold": r["retrieval"]["threshold"],
             "max_score": max([c["score"] for c in retrieval_debug], default=0.0)
         },
         "metrics": {
@@ -87,8 +152,9 @@ def answer_question(
         },
         "performance": {
             "latency": {
-                "total_sec": round(time.time() - start_time, 3)
+                "total_sec": round(trace.elapsed(), 3)
             },
+            "answer_cache": "miss",
             "cost": {
                 "total_tokens": 0,
                 "estimated_cost_usd": 0.0
@@ -96,28 +162,93 @@ def answer_question(
         }
     }
 
-    # ------------------------------
-    # LLM Answering
-    # ------------------------------
-    t1 = time.time()
-    answer = pipeline.answer(question, retrieved)
-    llm_time = time.time() - t1
 
-    total_latency = time.time() - start_time
+def _context_embeddings(r, chunk_embeddings):
+    # Index rows of the used chunks; None when a retriever didn't report them
+    rows = r["used_rows"]
+    if chunk_embeddings is None or not rows or None in rows:
+        return None
+    return np.asarray(chunk_embeddings)[rows]
+
+
+def compute_metrics(answer, r, embedding_model, context_embeddings=None, names=METRICS,
+                    trace=None):
+    """
+    Runs the evaluation metrics listed in `names`.
+
+    With `context_embeddings` (the used chunks' rows from the index),
+    grounding_score only has to encode the answer.
+    """
+    used_chunks = r["used_chunks"]
+    span = trace.span if trace is not None else lambda name: nullcontext()
+    metrics = {}
 
     # ------------------------------
     # Metrics (FORCE Python types)
     # ------------------------------
-    recall = float(recall_at_k(retrieved))
-    coverage = float(context_coverage(answer, used_chunks))
-    faithful = bool(is_faithful(coverage))
-    grounding = float(grounding_score(answer, used_chunks, embedding_model))
+    if "recall_at_k" in names:
+        with span("eval_recall"):
+            metrics["recall_at_k"] = float(recall_at_k(r["retrieved"]))
+    if "context_coverage" in names:
+        with span("eval_coverage"):
+            coverage = float(context_coverage(answer, used_chunks))
+            metrics["context_coverage"] = coverage
+            metrics["faithful"] = bool(is_faithful(coverage))
+    if "grounding_score" in names:
+        with span("eval_grounding"):
+            metrics["grounding_score"] = float(
+                grounding_score(answer, used_chunks, embedding_model, context_embeddings)
+            )
+
+    return metrics
 
+
+def _evaluate(answer, r, embedding_model, chunk_embeddings, trace, metrics=None,
+              evaluation="sync", evaluator=None, request_id=None):
+    """
+    evaluation:
+        "sync"     compute `metrics` (default: all) before responding
+        "deferred" hand them to `evaluator`, results land in its store
+                   under `request_id`
+        "off"      skip evaluation
+    Returns (metrics, evaluation info for the response).
+    """
+    names = METRICS if metrics is None else tuple(metrics)
+
+    if evaluation == "off" or not names:
+        return {}, {"mode": "off", "status": "skipped"}
+
+    # Copied now: a reindex may move rows before a deferred job runs
+    context = _context_embeddings(r, chunk_embeddings) if "grounding_score" in names else None
+
+    if evaluation == "deferred" and evaluator is not None:
+        request_id = request_id or uuid.uuid4().hex
+        accepted = evaluator.submit(request_id, lambda: compute_metrics(
+            answer, r, embedding_model, context, names
+        ))
+        return {}, {
+            "mode": "deferred",
+            "status": "pending" if accepted else "dropped",
+            "request_id": request_id
+        }
+
+    return (
+        compute_metrics(answer, r, embedding_model, context, names, trace),
+        {"mode": "sync", "status": "done"}
+    )
+
+
+def _answer_response(question, r, answer, latency, metrics, evaluation, tokens=None):
+    """
+    tokens: (prompt, completion) counts from the LLM's tokenizer;
+    estimated from the used chunks when not given.
+    """
     # ------------------------------
     # Cost estimation
     # ------------------------------
-    prompt_tokens = int(estimate_tokens(" ".join(used_chunks)))
-    completion_tokens = int(estimate_tokens(answer))
+    if tokens is None:
+        tokens = estimate_tokens(" ".join(r["used_chunks"])), estimate_tokens(answer)
+    prompt_tokens, completion_tokens = int(tokens[0]), int(tokens[1])
     total_tokens = int(prompt_tokens + completion_tokens)
     estimated_cost = float(total_tokens * 0.000002)
 
@@ -127,32 +258,17 @@ def answer_question(
     return {
         "query": {
             "original": question,
-            "rewritten": rewritten
+            "rewritten": r["rewritten"]
         },
         "answer": answer,
         "sources": list(
-            set(c["source"] for c in retrieval_debug if c["used"])
+            set(c["source"] for c in r["retrieval"]["chunks"] if c["used"])
         ),
-        "retrieval": {
-            "top_k": int(top_k),
-            "threshold": float(threshold),
-            "total_chunks": int(len(chunks)),
-            "retrieved_chunks": int(len(retrieved)),
-            "used_chunks": int(len(used_chunks)),
-            "chunks": retrieval_debug
-        },
-        "metrics": {
-            "recall_at_k": recall,
-            "context_coverage": coverage,
-            "faithful": faithful,
-            "grounding_score": grounding
-        },
+        "retrieval": r["retrieval"],
+        "metrics": metrics,
+        "evaluation": evaluation,
         "performance": {
-            "latency": {
-                "retrieval_sec": float(round(retrieval_time, 3)),
-                "llm_sec": float(round(llm_time, 3)),
-                "total_sec": float(round(total_latency, 3))
-            },
+            "latency": latency,
             "cost": {
                 "prompt_tokens": prompt_tokens,
                 "completion_tokens": completion_tokens,
@@ -161,3 +277,254 @@ def answer_question(
             }
         }
     }
+
+
+def answer_question(
+    question,
+    top_k,
+    threshold,
+    pipeline,
+    chunk_embeddings,
+    chunks,
+    embedding_model,
+    answer_cache=None,
+    index_version=None,
+    metrics=None,
+    evaluation="sync",
+    evaluator=None,
+    request_id=None,
+    **retrieval_options
+):
+    """
+    retrieval_options: lexical_index, retrieval_mode ("dense" | "bm25" |
+    "hybrid"), fusion ("rrf" | "weighted"), alpha, row_filter and the
+    index snapshot the embeddings come from; see _retrieve.
+    metrics / evaluation / evaluator / request_id: see _evaluate.
+    """
+    trace = Trace("query")
+    try:
+        r = _retrieve(
+            question, top_k, threshold, pipeline, chunk_embeddings, chunks, trace,
+            **retrieval_options
+        )
+
+        # ------------------------------
+        # If nothing usable retrieved
+        # ------------------------------
+        if not r["used_chunks"]:
+            response = _failure_response(question, r, trace)
+            response["performance"]["latency"]["stages"] = trace.finish("refused")
+            return response
+
+        # ------------------------------
+        # LLM Answering
+        # ------------------------------
+        # Near-duplicate questions over the same chunks reuse a cached answer
+        t1 = time.perf_counter()
+        answer = None
+        if answer_cache is not None:
+            with trace.span("answer_cache"):
+                cache_key = chunk_set_key(r["used_hits"])
+                answer = answer_cache.lookup(r["query_emb"], cache_key, index_version)
+
+        cache_status = "hit" if answer is not None else "miss"
+        tokens = (0, 0)  # a cached answer costs no generation
+        if answer is None:
+            context = _pack(question, r, pipeline, trace)
+            with trace.span("generate"):
+                answer = pipeline.generate(context["prompt"])
+            tokens = (context["prompt_tokens"], pipeline.count_tokens(answer))
+            if answer_cache is not None:
+                answer_cache.store(r["query_emb"], cache_key, answer, index_version)
+        llm_time = time.perf_counter() - t1
+
+        scores, evaluated = _evaluate(
+            answer, r, embedding_model, chunk_embeddings, trace,
+            metrics, evaluation, evaluator, request_id
+        )
+
+        response = _answer_response(question, r, answer, {
+            "retrieval_sec": float(round(r["retrieval_time"], 3)),
+            "llm_sec": float(round(llm_time, 3)),
+            "total_sec": float(round(trace.elapsed(), 3))
+        }, scores, evaluated, tokens)
+        response["performance"]["answer_cache"] = cache_status
+        response["performance"]["latency"]["stages"] = trace.finish("answered")
+        return response
+    finally:
+        trace.close()
+
+
+def stream_question(
+    question,
+    top_k,
+    threshold,
+    pipeline,
+    chunk_embeddings,
+    chunks,
+    embedding_model,
+    metrics=None,
+    evaluation="sync",
+    evaluator=None,
+    request_id=None,
+    **retrieval_options
+):
+    """
+    Streaming variant of answer_question.
+
+    Yields (event, payload) pairs:
+        ("retrieval", {...})  as soon as retrieval finishes
+        ("token", {"text"})   for every decoded piece of the answer
+        ("done", response)    the same payload answer_question returns
+    """
+    trace = Trace("stream")
+    try:
+        r = _retrieve(
+            question, top_k, threshold, pipeline, chunk_embeddings, chunks, trace,
+            **retrieval_options
+        )
+
+        # Each step may run on another executor thread
+        with trace.paused():
+            yield "retrieval", {
+                "query": {
+                    "original": question,
+                    "rewritten": r["rewritten"]
+                },
+                "retrieval": r["retrieval"]
+            }
+
+        if not r["used_chunks"]:
+            response = _failure_response(question, r, trace)
+            response["performance"]["latency"]["stages"] = trace.finish("refused")
+            yield "done", response
+            return
+
+        context = _pack(question, r, pipeline, trace)
+
+        t1 = time.perf_counter()
+        first_token_time = None
+        pieces = []
+
+        for piece in pipeline.stream(context["prompt"]):
+            if first_token_time is None:
+                first_token_time = trace.elapsed()
+                telemetry.observe(
+                    "rag_time_to_first_token_seconds", first_token_time,
+                    help="Request start to first streamed token"
+                )
+            pieces.append(piece)
+            with trace.paused():
+                yield "token", {"text": piece}
+
+        llm_time = time.perf_counter() - t1
+        trace.add("generate", llm_time)
+        answer = "".join(pieces).strip()
+
+        scores, evaluated = _evaluate(
+            answer, r, embedding_model, chunk_embeddings, trace,
+            metrics, evaluation, evaluator, request_id
+        )
+
+        response = _answer_response(question, r, answer, {
+            "retrieval_sec": float(round(r["retrieval_time"], 3)),
+            "time_to_first_token_sec": float(round(first_token_time or llm_time, 3)),
+            "llm_sec": float(round(llm_time, 3)),
+            "total_sec": float(round(trace.elapsed(), 3))
+        }, scores, evaluated, (context["prompt_tokens"], pipeline.count_tokens(answer)))
+        response["performance"]["latency"]["stages"] = trace.finish("answered")
+        yield "done", response
+    except GeneratorExit:
+        # Client went away mid-stream
+        trace.close("cancelled")
+        raise
+    finally:
+        trace.close()
+
+
+def answer_questions(
+    questions,
+    top_k,
+    threshold,
+    pipeline,
+    chunk_embeddings,
+    chunks,
+    embedding_model,
+    batch_size=16,
+    metrics=None,
+    row_filter=None,
+    snapshot=None
+):
+    """
+    Bulk variant of answer_question for large question sets.
+
+    All queries are embedded in one batch and scored with one
+    matrix-matrix product; answers are generated `batch_size` prompts
+    at a time. Returns one answer_question-shaped response per question.
+    """
+    if not questions:
+        return []
+
+    trace = Trace("batch")
+    try:
+        with trace.span("rewrite"):
+            rewritten = [pipeline.rewrite_query(q) for q in questions]
+
+        t0 = time.perf_counter()
+        with trace.span("embed"):
+            query_embs = pipeline.embed_queries(rewritten)
+        with trace.span("search"):
+            retrieved_lists = pipeline.search_batch(
+                query_embs, chunk_embeddings, chunks, pipeline.candidates(top_k),
+                row_filter=row_filter, snapshot=snapshot
+            )
+        if pipeline.reranker is not None:
+            with trace.span("rerank"):
+                retrieved_lists = pipeline.rerank_batch(rewritten, retrieved_lists, top_k)
+        retrieval_time = time.perf_counter() - t0
+
+        results = []
+        for question, rw, emb, retrieved in zip(questions, rewritten, query_embs, retrieved_lists):
+            results.append({
+                "rewritten": rw,
+                "query_emb": emb,
+                "retrieval_time": retrieval_time / max(1, len(questions)),
+                **_select(retrieved, top_k, threshold, chunks, row_filter=row_filter)
+            })
+
+        answerable = [i for i, r in enumerate(results) if r["used_chunks"]]
+
+        contexts = {i: _pack(questions[i], results[i], pipeline, trace) for i in answerable}
+
+        t1 = time.perf_counter()
+        answers = {}
+        with trace.span("generate"):
+            for start in range(0, len(answerable), batch_size):
+                rows = answerable[start:start + batch_size]
+                generated = pipeline.generate_batch([contexts[i]["prompt"] for i in rows])
+                answers.update(zip(rows, generated))
+        llm_time = time.perf_counter() - t1
+
+        responses = []
+        for i, (question, r) in enumerate(zip(questions, results)):
+            if i not in answers:
+                responses.append(_failure_response(question, r, trace))
+                continue
+
+            scores, evaluated = _evaluate(
+                answers[i], r, embedding_model, chunk_embeddings, trace, metrics
+            )
+            responses.append(_answer_response(question, r, answers[i], {
+                "retrieval_sec": float(round(r["retrieval_time"], 3)),
+                "llm_sec": float(round(llm_time / len(answerable), 3)),
+                "total_sec": float(round(trace.elapsed(), 3))
+            }, scores, evaluated, (contexts[i]["prompt_tokens"], pipeline.count_tokens(answers[i]))))
+
+        telemetry.inc(
+            "rag_batch_questions_total", len(questions),
+            help="Questions answered through the batch path"
+        )
+        trace.finish()
+        return responses
+    finally:
+        trace.close()
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Dict, List, Any
+from pydantic import BaseModel, Field
+from typing import Dict, List, Any, Optional, Literal
 
 
 class RetrievedChunk(BaseModel):
@@ -17,16 +17,52 @@ class Metrics(BaseModel):
     grounding_score: float
 
 
+class QueryFilters(BaseModel):
+    # Conditions are ANDed; sources and globs match if either does
+    sources: Optional[List[str]] = None
+    globs: Optional[List[str]] = None  # fnmatch patterns, e.g. "reports/*.txt"
+    uploaded_after: Optional[float] = None  # unix seconds
+    uploaded_before: Optional[float] = None
+    tags: Optional[List[str]] = None  # any of these
+
+
 class QueryRequest(BaseModel):
     question: str
     top_k: int = 3
     threshold: float = 0.3
     debug: bool = False
+    retrieval_mode: Literal["dense", "bm25", "hybrid"] = "dense"
+    fusion: Literal["rrf", "weighted"] = "rrf"
+    alpha: float = 0.5  # dense weight for fusion="weighted"
+    filters: Optional[QueryFilters] = None  # only matching documents are searched
+    # Metrics to compute (default: all); "deferred" computes them in the
+    # background, fetch with GET /evaluations/{request_id}
+    metrics: Optional[List[Literal["recall_at_k", "context_coverage", "grounding_score"]]] = None
+    evaluation: Optional[Literal["sync", "deferred", "off"]] = None  # default: $RAG_EVALUATION
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str] = Field(min_length=1)
+    top_k: int = 3
+    threshold: float = 0.3
+    # Prompts handed to the LLM per call; the server's micro-batcher
+    # runs at most $RAG_LLM_BATCH_SIZE (default 8) of them per forward pass
+    batch_size: int = 16
+    filters: Optional[QueryFilters] = None
+    metrics: Optional[List[Literal["recall_at_k", "context_coverage", "grounding_score"]]] = None
+
+
+class ReindexRequest(BaseModel):
+    workers: int = 1
 
 
 class QueryResponse(BaseModel):
+    request_id: Optional[str] = None
     query: Dict[str, str]
     answer: str
     sources: List[str]
     retrieval: Dict[str, Any]
     metrics: Dict[str, Any]
+    evaluation: Dict[str, Any] = {}
+    performance: Dict[str, Any] = {}
+    failure: Optional[Dict[str, Any]] = None
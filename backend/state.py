@@ -1,21 +1,581 @@
-from ingestion.load_documents import load_documents
-from ingestion.chunking import process_documents
-from embeddings.generate_embeddings import embed_texts
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+from ingestion.load_documents import iter_documents, load_document
+from ingestion.chunking import chunk_document, chunker_id, content_hash, tokenizer_id, CHUNK_TOKENS
+from ingestion.parallel import iter_chunked_documents, prefetch
+from retrieval.bm25 import BM25Index, remove_segments
+from retrieval.filters import build_row_filter, dead_ranges, live_filter
+from rag_core.cache import LRUCache
+from embeddings.generate_embeddings import embed_texts, embed_stream
 from embeddings.embedding_model import EmbeddingModel
+from embeddings.index_store import (
+    INDEX_DIR, CODES_FILES, KEEP_VERSIONS, IndexWriter, current_version, index_fingerprint,
+    index_lock, load_index
+)
+from embeddings.quantization import BLOCK_ROWS
 
 DATA_DIR = "data/documents"
+# Share of dead rows at which the index is compacted in the background
+COMPACT_RATIO = 0.25
+
+logger = logging.getLogger(__name__)
+
+
+def _code_kinds():
+    # Quantized codes the configured retriever maps (see retrieval.retrievers)
+    kind = os.getenv("RAG_RETRIEVER", "dense")
+    return [kind] if kind in CODES_FILES else []
+
+# One consistent view of the index. Writers publish a new snapshot with
+# a single assignment; a request takes `state.snapshot` once and reads
+# everything from it, so an upload can't swap chunks under its embeddings.
+# Rows are only appended: a removed document's rows stay in place, dead,
+# until the next compaction. `live` is the RowFilter of the rows searches
+# may return (None: all of them).
+# `delta` is (previous version, row edits) when the snapshot came from an
+# incremental update, so retrievers can patch their structures instead
+# of rebuilding them (see retrieval.versioned.row_origins)
+class IndexSnapshot(namedtuple(
+    "IndexSnapshot",
+    ["version", "chunks", "chunk_embeddings", "lexical", "manifest", "delta", "live"],
+    defaults=(None, None)
+)):
+    __slots__ = ()
+
+    @property
+    def chunk_count(self):
+        # Chunks of the indexed documents, dead rows left out
+        return len(self.chunks) if self.live is None else len(self.live)
+
+
+class _Draft:
+    """
+    Private working copy of the index for one write. Every step of an
+    update lands here; the published snapshot is only replaced once the
+    whole update has succeeded. New rows are collected in `chunks` /
+    `embeddings` and removed ones in `dead`, so nothing the snapshot
+    holds is copied. Manifest entries are shared with the published
+    manifest, so they are replaced, never edited.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.manifest = dict(snapshot.manifest)
+        self.count = len(snapshot.chunks)  # rows, appended ones included
+        self.chunks = []
+        self.embeddings = []
+        self.dead = []  # [start, stop) ranges
+        self._lexical = None
+
+    @property
+    def lexical(self):
+        # Copied on first change; the copy shares the snapshot's segments
+        if self._lexical is None:
+            self._lexical = self.snapshot.lexical.copy()
+        return self._lexical
+
+    def changes(self):
+        # Manifest entries added or replaced, None for removed ones
+        old = self.snapshot.manifest
+        changed = {s: e for s, e in self.manifest.items() if old.get(s) is not e}
+        changed.update((s, None) for s in old if s not in self.manifest)
+        return changed
+
 
 class DocumentState:
-    def __init__(self):
-        self.embedding_model = EmbeddingModel()
-        self.reload()
-
-    def reload(self):
-        self.docs = load_documents(DATA_DIR)
-        self.chunks = process_documents(self.docs)
-        self.chunk_embeddings = embed_texts(
-            self.chunks, self.embedding_model
+    """
+    Chunks + embeddings for every file in DATA_DIR.
+
+    `manifest` maps each source file to its content hash, the
+    [start, stop) rows its chunks occupy in `chunks` /
+    `chunk_embeddings`, its upload time and its tags. Rows of one
+    document are contiguous, so single files can be added, replaced or
+    dropped without re-embedding the rest of the corpus.
+
+    Rows are append-only: an added or edited file gets new rows at the
+    end, and the rows of a removed or replaced one are only marked dead,
+    so an update costs O(changed rows), never O(corpus). Once dead rows
+    reach `compact_ratio` of the index, `compact` rewrites it without
+    them in a background thread.
+
+    The index, chunk text included, is persisted to `index_dir` after
+    every change and memory-mapped on startup, so a restart only re-embeds files that
+    changed while the process was down. `version` increases every time
+    the index is (re)mapped, so caches built on top of it can invalidate.
+
+    All of it lives in the immutable `snapshot`; the attributes of the
+    same names read the current one.
+
+    Each saved version also carries everything derived from it: the
+    BM25 segments and the quantized codes of `code_kinds` (default: the
+    kind named by $RAG_RETRIEVER), written along with its rows. Loading
+    only maps them, so processes that read the index never rebuild or
+    write anything.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, index_dir=INDEX_DIR, batch_size=256,
+                 embedding_model=None, code_kinds=None, compact_ratio=COMPACT_RATIO):
+        self.data_dir = data_dir
+        self.index_dir = index_dir
+        self.batch_size = batch_size
+        self.embedding_model = embedding_model or EmbeddingModel()
+        self.code_kinds = _code_kinds() if code_kinds is None else list(code_kinds)
+        self.compact_ratio = compact_ratio
+        # Called after a background compaction published a new version
+        self.on_compacted = None
+
+        # Chunks are sized in the embedding model's own tokens ([CLS] and
+        # [SEP] excluded); models without a tokenizer use an estimate.
+        # Pool workers load the tokenizer by name / path
+        tokenizer = getattr(self.embedding_model, "tokenizer", None)
+        max_seq_length = getattr(self.embedding_model, "max_seq_length", None)
+        self.chunk_options = {
+            "max_tokens": min(CHUNK_TOKENS, max_seq_length - 2) if max_seq_length else CHUNK_TOKENS,
+            "tokenizer": getattr(tokenizer, "name_or_path", None)
+        }
+
+        self.fingerprint = index_fingerprint(
+            self.embedding_model.model_name,
+            self.embedding_model.dim,
+            chunker_id(self.chunk_options["max_tokens"], tokenizer_id(tokenizer))
+        )
+        self._lock = threading.RLock()
+        self.snapshot = IndexSnapshot(
+            0, [], np.empty((0, self.embedding_model.dim), dtype=np.float32), BM25Index(), {}
         )
+        self._filters = LRUCache(maxsize=256)
+        self._loaded_from = None  # (generation, log offset) behind `snapshot`
+        self._stored = None       # StoredIndex a writer resumes from
+        self._writer = None
+        self._retired = []        # BM25 segments dropped by recent versions
+        self._compactor = None
+        self.open()
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    @property
+    def chunks(self):
+        return self.snapshot.chunks
+
+    @property
+    def chunk_embeddings(self):
+        return self.snapshot.chunk_embeddings
+
+    @property
+    def lexical(self):
+        return self.snapshot.lexical
+
+    @property
+    def manifest(self):
+        return self.snapshot.manifest
+
+    def open(self):
+        if self.load():
+            self.refresh()
+        else:
+            self.reload()
+
+    def sync(self, wait=True):
+        """
+        Picks up index changes made by another process. This process
+        makes every change itself, so there is nothing to do; see
+        backend.index_server.RemoteDocumentState.
+        """
+        return False
+
+    # ------------------------------
+    # Persistence
+    # ------------------------------
+    def load(self):
+        """
+        Maps a persisted index instead of re-embedding the corpus.
+        Returns False when no compatible index exists.
+        """
+        with self._lock:
+            stored = load_index(self.index_dir, self.fingerprint, self._stored)
+            if stored is None:
+                return False
+
+            # Segments the held version maps already are reused
+            held = {seg.name: seg for seg in self.snapshot.lexical.segments if seg.name}
+            lexical = BM25Index.load(stored.path, stored.lexical, stored.dead, held)
+            if lexical is None:
+                return False  # a segment was pruned as newer versions landed
+
+            self.snapshot = IndexSnapshot(
+                self.snapshot.version + 1, stored.chunks, stored.chunk_embeddings, lexical,
+                stored.manifest, self._delta(stored), live_filter(stored.dead, stored.count)
+            )
+            self._loaded_from = stored.version
+            self._stored, self._writer = stored, None
+            return True
+
+    def _delta(self, stored):
+        # Row edits from the version this process holds, when known.
+        # Within a generation rows are only appended; a compacted one
+        # records the rows it dropped from the version it came from
+        held = self._loaded_from
+        if held is None:
+            return None
+        if held[0] == stored.version[0]:
+            start, ops = len(self.snapshot.chunks), ()
+        elif stored.origin and tuple(stored.origin["base"]) == held:
+            start, ops = stored.origin["count"], tuple(tuple(op) for op in stored.origin["ops"])
+        else:
+            return None
+
+        if stored.count > start:
+            ops += (("add", start, stored.count),)
+        return self.snapshot.version, ops
+
+    def save(self, draft):
+        with self._lock:
+            snapshot = self.snapshot
+            if self._writer is None:
+                self._writer = IndexWriter(
+                    self.index_dir, self.embedding_model.dim, self.code_kinds, resume=self._stored
+                )
+                self._stored, self._retired = None, []
+            writer = self._writer
+            lexical = draft.lexical
+
+            # Only the new rows, the new BM25 segments and one log
+            # record are written
+            try:
+                if draft.chunks:
+                    writer.append(np.concatenate(draft.embeddings), draft.chunks)
+                writer.commit({
+                    "manifest": draft.changes(),
+                    "dead": draft.dead,
+                    "lexical": lexical.save(writer.path)
+                })
+            except BaseException:
+                writer.abort()
+                raise
+
+            self._retire(snapshot.lexical, lexical, writer.path)
+            ops = (("add", len(snapshot.chunks), writer.count),) if draft.chunks else ()
+            dead = dead_ranges(snapshot.live, len(snapshot.chunks)) + draft.dead
+            self._publish(
+                writer, lexical, draft.manifest, (snapshot.version, ops),
+                live_filter(dead, writer.count)
+            )
+
+            if self._should_compact():
+                self._compact_in_background()
+
+    def _publish(self, writer, lexical, manifest, delta=None, live=None):
+        # The version `writer` just committed, mapped like a loaded one
+        if writer is not self._writer:
+            self._writer, self._stored, self._retired = writer, None, []
+        self.snapshot = IndexSnapshot(
+            self.snapshot.version + 1, writer.chunks(), writer.matrix(), lexical, manifest,
+            delta, live
+        )
+        self._loaded_from = (writer.generation, writer.offset)
+
+    def _retire(self, old, new, path):
+        # Segments merged away are deleted KEEP_VERSIONS versions later,
+        # so readers still loading a version that uses them find them
+        self._retired.append({seg.name for seg in old.segments} - {seg.name for seg in new.segments})
+        while len(self._retired) > KEEP_VERSIONS:
+            remove_segments(path, self._retired.pop(0))
+
+    @contextmanager
+    def _writing(self):
+        # One writing process per index directory. A version another
+        # process published meanwhile is loaded first, so every write
+        # appends to the newest one
+        with self._lock, index_lock(self.index_dir):
+            if current_version(self.index_dir) != self._loaded_from:
+                self.load()
+            yield
+
+    # ------------------------------
+    # Full rebuild
+    # ------------------------------
+    def reload(self, workers=1, queue_size=8):
+        """
+        Rebuilds the index from scratch as a streaming pipeline:
+        documents -> chunks -> fixed-size embedding batches -> rows on
+        disk. Peak memory depends on `batch_size`, not corpus size.
+
+        With workers > 1, reading and chunking fan out over a process
+        pool, and embedding runs as its own stage; stages are joined by
+        bounded queues. Chunk order is the same either way.
+        """
+        with self._writing():
+            manifest = {}
+            lexical = BM25Index()
+            writer = IndexWriter(self.index_dir, self.embedding_model.dim, self.code_kinds)
+
+            if workers > 1:
+                records = prefetch(
+                    iter_chunked_documents(self.data_dir, workers, **self.chunk_options),
+                    queue_size
+                )
+            else:
+                records = (
+                    chunk_document(doc, **self.chunk_options)
+                    for doc in iter_documents(self.data_dir)
+                )
+
+            def stream_chunks():
+                row = 0
+                for record in records:
+                    doc_chunks = record["chunks"]
+                    source = record["source"]
+                    manifest[source] = {
+                        "hash": record["hash"],
+                        "rows": [row, row + len(doc_chunks)],
+                        "uploaded": self._uploaded(source),
+                        "tags": self.manifest.get(source, {}).get("tags", [])
+                    }
+                    row += len(doc_chunks)
+                    yield from doc_chunks
+
+            batches = embed_stream(stream_chunks(), self.embedding_model, self.batch_size)
+            if workers > 1:
+                batches = prefetch(batches, queue_size)
+
+            try:
+                for batch, embeddings in batches:
+                    writer.append(embeddings, batch)
+                    lexical.add(batch)
+                writer.commit({
+                    "fingerprint": self.fingerprint,
+                    "origin": None,
+                    "manifest": manifest,
+                    "dead": [],
+                    "lexical": lexical.save(writer.path)
+                })
+            except BaseException:
+                writer.abort()
+                raise
+
+            self._publish(writer, lexical, manifest)
+
+    # ------------------------------
+    # Compaction
+    # ------------------------------
+    def compact(self):
+        """
+        Rewrites the index without its dead rows, as a new generation.
+        Rows are renumbered; nothing is re-embedded or re-tokenized.
+        Queries keep their snapshot meanwhile, and retrievers patch
+        their structures from the recorded drops. Returns False when
+        there is nothing to drop.
+        """
+        with self._writing():
+            snapshot = self.snapshot
+            if snapshot.live is None:
+                return False
+
+            keep = snapshot.live.rows()
+            # Dropped last to first, so each range keeps its row ids
+            ops = tuple(
+                ("drop", a, b) for a, b in reversed(dead_ranges(snapshot.live, len(snapshot.chunks)))
+            )
+            # A document's new first row: the kept rows before it
+            starts = np.searchsorted(keep, [e["rows"][0] for e in snapshot.manifest.values()])
+            manifest = {
+                source: {**entry, "rows": [int(s), int(s) + entry["rows"][1] - entry["rows"][0]]}
+                for (source, entry), s in zip(snapshot.manifest.items(), starts)
+            }
+            lexical = snapshot.lexical.compacted(keep)
+
+            writer = IndexWriter(self.index_dir, self.embedding_model.dim, self.code_kinds)
+            try:
+                for start in range(0, len(keep), BLOCK_ROWS):
+                    rows = keep[start:start + BLOCK_ROWS]
+                    writer.append(
+                        snapshot.chunk_embeddings[rows], [snapshot.chunks[row] for row in rows]
+                    )
+                writer.commit({
+                    "fingerprint": self.fingerprint,
+                    "origin": {"base": list(self._loaded_from), "ops": ops, "count": len(keep)},
+                    "manifest": manifest,
+                    "dead": [],
+                    "lexical": lexical.save(writer.path)
+                })
+            except BaseException:
+                writer.abort()
+                raise
+
+            self._publish(writer, lexical, manifest, (snapshot.version, ops))
+            return True
+
+    def _should_compact(self):
+        snapshot = self.snapshot
+        n = len(snapshot.chunks)
+        return self.compact_ratio is not None and snapshot.live is not None \
+            and n - snapshot.chunk_count >= self.compact_ratio * n
+
+    def _compact_in_background(self):
+        # Started under the lock, so it runs once the current write is done
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+
+        def run():
+            try:
+                if self.compact() and self.on_compacted is not None:
+                    self.on_compacted()
+            except Exception:
+                logger.exception("Index compaction failed")
+
+        self._compactor = threading.Thread(target=run, name="index-compaction", daemon=True)
+        self._compactor.start()
+
+    # ------------------------------
+    # Incremental updates
+    # ------------------------------
+    def index_document(self, filename, tags=None):
+        """
+        Adds or updates one file. Unchanged files are a no-op and only
+        chunks whose text changed are re-embedded. `tags` replaces the
+        file's tags; None keeps the current ones.
+        """
+        with self._writing():
+            draft = self._draft()
+            changed = self._index_document(draft, filename, tags)
+            if changed:
+                self.save(draft)
+            return changed
+
+    def remove_document(self, filename):
+        with self._writing():
+            if filename not in self.manifest:
+                return False
+            draft = self._draft()
+            self._drop_rows(draft, filename)
+            self.save(draft)
+            return True
+
+    def refresh(self):
+        """
+        Syncs the index with DATA_DIR, touching only files that were
+        added, changed or deleted since the last update.
+        """
+        with self._writing():
+            on_disk = {
+                f for f in os.listdir(self.data_dir)
+                if os.path.isfile(os.path.join(self.data_dir, f))
+            }
+            draft = self._draft()
+            changed = False
+
+            for filename in set(draft.manifest) - on_disk:
+                self._drop_rows(draft, filename)
+                changed = True
+            for filename in sorted(on_disk):
+                changed |= self._index_document(draft, filename)
+
+            if changed:
+                self.save(draft)
+            return changed
+
+    # ------------------------------
+    # Metadata filters
+    # ------------------------------
+    def row_filter(self, filters, snapshot=None):
+        """
+        RowFilter for a filter dict (see retrieval.filters). With no
+        condition set, the snapshot's live rows (None when no row is
+        dead). Rows refer to `snapshot` (default: the current one);
+        cached per index version.
+        """
+        snapshot = snapshot or self.snapshot
+        if not filters or all(v is None for v in filters.values()):
+            return snapshot.live
+
+        key = (snapshot.version, json.dumps(filters, sort_keys=True))
+        row_filter = self._filters.get(key)
+        if row_filter is None:
+            row_filter = build_row_filter(snapshot.manifest, len(snapshot.chunks), filters)
+            self._filters.put(key, row_filter)
+        return row_filter
+
+    # ------------------------------
+    # Helpers
+    # ------------------------------
+    def _uploaded(self, filename):
+        return os.path.getmtime(os.path.join(self.data_dir, filename))
+
+    def _draft(self):
+        return _Draft(self.snapshot)
+
+    def _index_document(self, draft, filename, tags=None):
+        doc = load_document(self.data_dir, filename)
+        doc_hash = content_hash(doc["text"])
+
+        entry = draft.manifest.get(filename)
+        if tags is not None:
+            tags = sorted(set(tags))
+        elif entry:
+            tags = entry.get("tags", [])
+        else:
+            tags = []
+
+        if entry and entry["hash"] == doc_hash:
+            if entry.get("tags", []) == tags:
+                return False
+            draft.manifest[filename] = {**entry, "tags": tags}
+            return True
+
+        record = chunk_document(doc, **self.chunk_options)
+        doc_chunks = record["chunks"]
+        chunk_hashes = record["chunk_hashes"]
+
+        # Reuse embeddings of chunks that survived the edit
+        reusable = {}
+        if entry:
+            start, stop = entry["rows"]
+            for offset, h in enumerate(draft.snapshot.chunks.hashes(slice(start, stop))):
+                reusable.setdefault(h, start + offset)
+
+        embeddings = np.empty(
+            (len(doc_chunks), self.embedding_model.dim), dtype=np.float32
+        )
+        missing = []
+        for i, h in enumerate(chunk_hashes):
+            if h in reusable:
+                embeddings[i] = draft.snapshot.chunk_embeddings[reusable[h]]
+            else:
+                missing.append(i)
+
+        if missing:
+            embeddings[missing] = embed_texts(
+                [doc_chunks[i] for i in missing], self.embedding_model
+            )
+
+        if entry:
+            self._drop_rows(draft, filename)
 
-state = DocumentState()
+        row = draft.count
+        draft.count += len(doc_chunks)
+        draft.chunks.extend(doc_chunks)
+        draft.embeddings.append(embeddings)
+        draft.lexical.add(doc_chunks)
+        draft.manifest[filename] = {
+            "hash": doc_hash,
+            "rows": [row, row + len(doc_chunks)],
+            "uploaded": self._uploaded(filename),
+            "tags": tags
+        }
+        return True
 
+    def _drop_rows(self, draft, filename):
+        # The rows stay; they are dead until the next compaction
+        start, stop = draft.manifest.pop(filename)["rows"]
+        if stop > start:
+            draft.dead.append((start, stop))
+            draft.lexical.remove_range(start, stop)
@@ -0,0 +1,129 @@
+"""
+Recall@k, latency and memory of IVFIndex and QuantizedIndex against
+exact DenseIndex search.
+
+    python -m benchmarks.ann_benchmark --n 200000 --dim 384 --k 10
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from retrieval.dense_index import DenseIndex
+from retrieval.ivf_index import IVFIndex
+from retrieval.quantized_index import QuantizedIndex
+
+
+def clustered_vectors(n, dim, n_clusters=256, noise=0.35, seed=0):
+    """
+    Unit vectors drawn around random centres, closer to real embedding
+    distributions than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    x = centres[rng.integers(0, n_clusters, n)]
+    x += noise * rng.normal(size=(n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def recall_at_k(approx, exact):
+    hits = sum(len({t for _, t, _ in a} & {t for _, t, _ in e}) for a, e in zip(approx, exact))
+    return hits / sum(len(e) for e in exact)
+
+
+def timed_search(index, queries, k, **kwargs):
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(index.search(q, k, **kwargs))
+        latencies.append(time.perf_counter() - t0)
+    latencies = np.array(latencies) * 1000
+    return results, {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3)
+    }
+
+
+def run(n, dim, k, n_queries, nlist, nprobes, quantizations=("float16", "int8"),
+        rescores=(1, 4), seed=0):
+    data = clustered_vectors(n + n_queries, dim, seed=seed)
+    vectors, queries = data[:n], data[n:]
+    chunks = [{"text": str(i), "source": "synthetic"} for i in range(n)]
+
+    exact_index = DenseIndex(vectors, chunks)
+    exact, exact_latency = timed_search(exact_index, queries, k)
+
+    t0 = time.perf_counter()
+    ivf = IVFIndex(nlist=nlist, seed=seed)
+    ivf.build(vectors, chunks)
+    build_sec = time.perf_counter() - t0
+
+    report = {
+        "n": n,
+        "dim": dim,
+        "k": k,
+        "queries": n_queries,
+        "exact": {**exact_latency, "memory_mb": round(vectors.nbytes / 2**20, 2)},
+        "ivf": {"nlist": len(ivf.centroids), "build_sec": round(build_sec, 3), "runs": []}
+    }
+    for nprobe in nprobes:
+        approx, latency = timed_search(ivf, queries, k, nprobe=nprobe)
+        report["ivf"]["runs"].append({
+            "nprobe": nprobe,
+            "recall_at_k": round(recall_at_k(approx, exact), 4),
+            **latency
+        })
+
+    report["quantized"] = []
+    for kind in quantizations:
+        for rescore in rescores:
+            index = QuantizedIndex(kind, rescore=rescore)
+            t0 = time.perf_counter()
+            index.build(vectors, chunks)
+            build_sec = time.perf_counter() - t0
+
+            approx, latency = timed_search(index, queries, k)
+            report["quantized"].append({
+                "kind": kind,
+                "rescore": rescore,
+                "build_sec": round(build_sec, 3),
+                "memory_mb": round(index.memory_bytes() / 2**20, 2),
+                "compression": round(vectors.nbytes / index.memory_bytes(), 2),
+                "recall_at_k": round(recall_at_k(approx, exact), 4),
+                **latency
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF vs exact retrieval benchmark")
+    parser.add_argument("--n", type=int, default=100000, help="Indexed vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--k", type=int, default=10, help="Top-k")
+    parser.add_argument("--queries", type=int, default=200, help="Query count")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cells (default 4*sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--quantization", nargs="*", default=["float16", "int8"],
+                        choices=["float16", "int8"])
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 4],
+                        help="Candidates rescored in float32, as a multiple of k")
+    parser.add_argument("--out", type=str, default=None, help="Write JSON report here")
+    args = parser.parse_args()
+
+    report = run(
+        args.n, args.dim, args.k, args.queries, args.nlist, args.nprobe,
+        args.quantization, args.rescore
+    )
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Synthetic corpora for the benchmark suite.
+
+Text is drawn from a fixed pseudo-word vocabulary with Zipf-like word
+frequencies, so BM25 postings and chunk lengths look like real prose
+while every run with the same seed produces the same files. Each
+paragraph fills about 3/4 of the default chunk token budget, so it
+becomes exactly one chunk.
+"""
+import os
+import string
+
+import numpy as np
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def synthetic_vocabulary(size=20_000, seed=0):
+    rng = np.random.default_rng(seed)
+    letters = np.array(list(string.ascii_lowercase))
+    lengths = rng.integers(3, 11, size)
+    return ["".join(rng.choice(letters, n)) for n in lengths]
+
+
+def word_weights(vocab_size, exponent=1.1):
+    weights = 1.0 / np.arange(1, vocab_size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def synthetic_paragraph(rng, vocab, weights, sentences=10, words=13):
+    # ~143 words + full stops: ~190 estimated tokens, 3/4 of CHUNK_TOKENS
+    ids = rng.choice(len(vocab), (sentences, words), p=weights)
+    return " ".join(
+        " ".join(vocab[i] for i in row).capitalize() + "." for row in ids
+    )
+
+
+def write_corpus(folder, n_chunks, chunks_per_doc=100, seed=0):
+    """
+    Writes text files to `folder` that chunk into exactly `n_chunks`
+    chunks with the default chunker and estimated token counts (a real
+    tokenizer splits pseudo-words into more pieces, so counts vary).
+
+    Returns:
+        int: number of files written.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    vocab = synthetic_vocabulary(seed=seed)
+    weights = word_weights(len(vocab))
+
+    n_docs = 0
+    remaining = n_chunks
+    while remaining > 0:
+        doc_chunks = min(chunks_per_doc, remaining)
+        text = "\n\n".join(
+            synthetic_paragraph(rng, vocab, weights) for _ in range(doc_chunks)
+        )
+
+        with open(os.path.join(folder, f"doc_{n_docs:07d}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+        n_docs += 1
+        remaining -= doc_chunks
+    return n_docs
+
+
+def synthetic_questions(n, seed=0, words=(4, 9)):
+    """
+    Unique questions over the corpus vocabulary, so every one misses
+    the query and answer caches.
+    """
+    rng = np.random.default_rng(seed + 1)
+    vocab = synthetic_vocabulary(seed=seed)
+    weights = word_weights(len(vocab))
+    return [
+        "what about " + " ".join(vocab[i] for i in rng.choice(len(vocab), rng.integers(*words), p=weights)) + f" {q}?"
+        for q in range(n)
+    ]
@@ -0,0 +1,130 @@
+"""
+Generation throughput of each LLM backend on RAG-shaped prompts.
+
+    python -m benchmarks.llm_benchmark --backends stub hf int8 onnx --prompts 32
+
+Prompts are synthetic context paragraphs packed to the backend's input
+budget, as llm.context does for real queries. Tokens are counted with
+each backend's own tokenizer (the stub's are estimated). A backend that
+fails to load (e.g. optimum missing for onnx) is reported with its
+error and the rest still run.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.corpus import synthetic_paragraph, synthetic_questions, synthetic_vocabulary, word_weights
+from benchmarks.suite import environment, latency_summary, peak_rss_mb
+from llm.context import ContextAssembler
+from llm.llm_model import LLM_BACKENDS, build_llm
+from llm.utils import estimate_tokens
+
+
+def rag_prompts(n, assembler, chunks_per_prompt=4, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = synthetic_vocabulary(seed=seed)
+    weights = word_weights(len(vocab))
+
+    prompts = []
+    for question in synthetic_questions(n, seed=seed):
+        hits = [
+            (1.0, synthetic_paragraph(rng, vocab, weights), "synthetic")
+            for _ in range(chunks_per_prompt)
+        ]
+        prompts.append(assembler.assemble(question, hits))
+    return prompts
+
+
+def _throughput(tokens, seconds):
+    return round(tokens / seconds, 2) if seconds > 0 else 0.0
+
+
+def bench_backend(name, n_prompts, batch_size, max_new_tokens, seed):
+    t0 = time.perf_counter()
+    llm = build_llm(name, max_new_tokens=max_new_tokens)
+    report = {"load_sec": round(time.perf_counter() - t0, 3)}
+
+    tokenizer = getattr(llm, "tokenizer", None)
+    prompts = rag_prompts(n_prompts, ContextAssembler(tokenizer), seed=seed)
+    texts = [p["prompt"] for p in prompts]
+    report["prompt_tokens_mean"] = round(float(np.mean([p["prompt_tokens"] for p in prompts])), 1)
+
+    llm(texts[0])  # warm-up: lazy init, first-call allocations
+
+    # One prompt at a time: the latency a single /query sees
+    latencies, generated = [], 0
+    for text in texts:
+        t0 = time.perf_counter()
+        answer = llm(text)
+        latencies.append(time.perf_counter() - t0)
+        generated += estimate_tokens(answer, tokenizer)
+    report["single"] = {
+        **latency_summary(latencies),
+        "generated_tokens": int(generated),
+        "decode_tokens_per_sec": _throughput(generated, sum(latencies))
+    }
+
+    # Padded batches, as BatchingLLM and /query/batch run them
+    t0 = time.perf_counter()
+    generated = 0
+    for start in range(0, len(texts), batch_size):
+        for answer in llm.generate_batch(texts[start:start + batch_size]):
+            generated += estimate_tokens(answer, tokenizer)
+    elapsed = time.perf_counter() - t0
+    report["batch"] = {
+        "batch_size": batch_size,
+        "prompts_per_sec": _throughput(len(texts), elapsed),
+        "decode_tokens_per_sec": _throughput(generated, elapsed)
+    }
+
+    # Streaming: time to the first piece and steady decode rate
+    first, totals = [], []
+    for text in texts[:max(1, n_prompts // 4)]:
+        t0 = time.perf_counter()
+        pieces = []
+        for piece in llm.stream(text):
+            if not pieces:
+                first.append(time.perf_counter() - t0)
+            pieces.append(piece)
+        totals.append((time.perf_counter() - t0, estimate_tokens("".join(pieces), tokenizer)))
+    report["stream"] = {
+        "time_to_first_token": latency_summary(first or [0.0]),
+        "decode_tokens_per_sec": _throughput(sum(n for _, n in totals), sum(s for s, _ in totals))
+    }
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM backend decode throughput")
+    parser.add_argument("--backends", nargs="+", default=["stub", "hf", "int8", "onnx"],
+                        choices=sorted(LLM_BACKENDS))
+    parser.add_argument("--prompts", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default=None, help="Write JSON report here")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "config": vars(args), "backends": {}}
+    for name in args.backends:
+        try:
+            report["backends"][name] = bench_backend(
+                name, args.prompts, args.batch_size, args.max_new_tokens, args.seed
+            )
+        except Exception as exc:
+            report["backends"][name] = {"error": repr(exc)}
+
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
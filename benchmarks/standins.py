@@ -0,0 +1,58 @@
+"""
+Cheap, deterministic stand-ins for the embedding model and the LLM, so
+benchmarks measure the serving path rather than model downloads.
+"""
+import zlib
+
+import numpy as np
+
+from llm.llm_model import StubLLM
+
+
+class HashEmbedder:
+    """
+    Signed feature hashing of words into `dim` buckets, L2-normalised.
+    Same interface as EmbeddingModel.
+    """
+
+    def __init__(self, dim=384):
+        self.model_name = f"hash-{dim}"
+        self.dim = dim
+        self._buckets = {}
+
+    def _bucket(self, word):
+        b = self._buckets.get(word)
+        if b is None:
+            h = zlib.crc32(word.encode("utf-8"))
+            b = self._buckets[word] = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+        return b
+
+    def _embed_into(self, out, text):
+        for word in text.lower().split():
+            i, sign = self._bucket(word)
+            out[i] += sign
+        norm = np.linalg.norm(out)
+        if norm > 0:
+            out /= norm
+
+    def __call__(self, text):
+        out = np.zeros(self.dim, dtype=np.float32)
+        self._embed_into(out, text)
+        return out
+
+    def encode_batch(self, texts, batch_size=64):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in zip(out, texts):
+            self._embed_into(row, text)
+        return out
+
+
+class StandInLLM(StubLLM):
+    """
+    llm.llm_model.StubLLM with a delay: a call costs `latency_ms` plus
+    `per_item_ms` per prompt in the batch, roughly how a batched
+    forward pass scales.
+    """
+
+    def __init__(self, latency_ms=20.0, per_item_ms=2.0, answer_words=40):
+        super().__init__(latency_ms, per_item_ms, answer_words)
@@ -0,0 +1,344 @@
+"""
+Performance benchmark suite: ingestion, embedding, retrieval and
+end-to-end /query throughput on a synthetic corpus.
+
+    python -m benchmarks.suite --size 100k --out results.json
+    python -m benchmarks.suite --size 1k --embedder model --concurrency 1 4 16
+
+The default embedder and LLM are deterministic stand-ins (see
+benchmarks.standins), so runs are comparable across commits and
+machines without downloading models. Every phase records the process
+peak RSS reached so far.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.corpus import SIZES, write_corpus, synthetic_questions
+from benchmarks.standins import HashEmbedder, StandInLLM
+from embeddings.generate_embeddings import embed_texts
+from llm.llm_model import LLM_BACKENDS, build_llm
+from retrieval.hybrid import hybrid_search
+from retrieval.retrievers import build_retriever
+
+
+# ------------------------------
+# Helpers
+# ------------------------------
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    usage = {
+        who: resource.getrusage(getattr(resource, who)).ru_maxrss * scale / 2**20
+        for who in ("RUSAGE_SELF", "RUSAGE_CHILDREN")
+    }
+    return {"self": round(usage["RUSAGE_SELF"], 1), "children": round(usage["RUSAGE_CHILDREN"], 1)}
+
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3)
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+def make_embedder(name):
+    if name == "hash":
+        return HashEmbedder()
+    from embeddings.embedding_model import EmbeddingModel
+    return EmbeddingModel()
+
+
+# ------------------------------
+# Phases
+# ------------------------------
+def bench_ingest(data_dir, index_dir, embedder, workers, batch_size):
+    from backend.state import DocumentState
+
+    t0 = time.perf_counter()
+    state = DocumentState(data_dir, index_dir, batch_size=batch_size, embedding_model=embedder)
+    ingest_sec = time.perf_counter() - t0
+
+    # Restart path: the persisted index is memory-mapped, nothing re-embedded
+    t0 = time.perf_counter()
+    DocumentState(data_dir, index_dir, batch_size=batch_size, embedding_model=embedder)
+    load_sec = time.perf_counter() - t0
+
+    # Parallel chunking is only exercised by an explicit rebuild
+    parallel = None
+    if workers > 1:
+        t0 = time.perf_counter()
+        state.reload(workers=workers)
+        parallel_sec = time.perf_counter() - t0
+        parallel = {
+            "workers": workers,
+            "sec": round(parallel_sec, 3),
+            "chunks_per_sec": round(len(state.chunks) / parallel_sec, 1)
+        }
+
+    return state, {
+        "chunks": len(state.chunks),
+        "documents": len(state.manifest),
+        "sec": round(ingest_sec, 3),
+        "chunks_per_sec": round(len(state.chunks) / ingest_sec, 1),
+        "load_sec": round(load_sec, 3),
+        "parallel": parallel,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def bench_embedding(chunks, embedder, sample, batch_size):
+    texts = [chunks[i]["text"] for i in range(min(sample, len(chunks)))]
+    batch = [{"text": t} for t in texts]
+
+    t0 = time.perf_counter()
+    embed_texts(batch, embedder, batch_size=batch_size)
+    sec = time.perf_counter() - t0
+
+    return {
+        "model": embedder.model_name,
+        "texts": len(texts),
+        "batch_size": batch_size,
+        "sec": round(sec, 3),
+        "texts_per_sec": round(len(texts) / sec, 1),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def bench_retrieval(state, questions, k, retrievers):
+    embedder = state.embedding_model
+    query_embs = [embedder(q) for q in questions]
+    matrix, chunks, lexical = state.chunk_embeddings, state.chunks, state.lexical
+
+    indexes = {}
+
+    def vector_search(name):
+        index = indexes[name] = build_retriever(name)
+        return lambda q, emb: index(emb, matrix, chunks, k)
+
+    def lexical_search(mode):
+        return lambda q, emb: hybrid_search(q, emb, matrix, chunks, lexical, k, mode=mode)
+
+    searches = {
+        "dense": vector_search("dense"),
+        "ivf": vector_search("ivf"),
+        "float16": vector_search("float16"),
+        "int8": vector_search("int8"),
+        "bm25": lexical_search("bm25"),
+        "hybrid": lexical_search("hybrid")
+    }
+
+    report = {}
+    for name in retrievers:
+        search = searches[name]
+
+        # First call builds dense / IVF structures; report it separately
+        t0 = time.perf_counter()
+        search(questions[0], query_embs[0])
+        warmup_sec = time.perf_counter() - t0
+
+        latencies = []
+        for q, emb in zip(questions, query_embs):
+            t0 = time.perf_counter()
+            search(q, emb)
+            latencies.append(time.perf_counter() - t0)
+
+        report[name] = {
+            "queries": len(questions),
+            "build_sec": round(warmup_sec, 3),
+            **latency_summary(latencies),
+            "peak_rss_mb": peak_rss_mb()
+        }
+
+        # Compressed indexes: resident size and overlap with exact top-k
+        index = indexes.get(name)
+        if hasattr(index, "memory_bytes"):
+            exact = build_retriever("dense")
+            overlap = [
+                len({h.row for h in index(emb, matrix, chunks, k)}
+                    & {h.row for h in exact(emb, matrix, chunks, k)}) / k
+                for emb in query_embs
+            ]
+            report[name]["memory_mb"] = round(index.memory_bytes() / 2**20, 2)
+            report[name]["float32_mb"] = round(matrix.shape[0] * matrix.shape[1] * 4 / 2**20, 2)
+            report[name]["recall_at_k"] = round(float(np.mean(overlap)), 4)
+    return report
+
+
+def bench_query(state, llm, questions, concurrency_levels, k, port):
+    """
+    Serves backend.api over HTTP with the given index and stand-in LLM,
+    then measures /query QPS and latency at each concurrency level.
+    """
+    import uvicorn
+    from backend.lifecycle import resources
+
+    os.environ.setdefault("RAG_WARMUP", "off")
+    import backend.api as api
+
+    resources.provide(state=state, llm=llm)
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    url = f"http://127.0.0.1:{port}/query"
+
+    def post(question):
+        body = json.dumps({"question": question, "top_k": k, "threshold": 0.0}).encode()
+        request = urllib.request.Request(url, body, {"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                ok = True
+        except urllib.error.HTTPError:
+            ok = False
+        return ok, time.perf_counter() - t0
+
+    report = []
+    offset = 0
+    try:
+        for concurrency in concurrency_levels:
+            batch = questions[offset:offset + max(len(questions) // len(concurrency_levels), concurrency)]
+            offset += len(batch)
+
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                results = list(pool.map(post, batch))
+            wall = time.perf_counter() - t0
+
+            latencies = [sec for ok, sec in results if ok]
+            report.append({
+                "concurrency": concurrency,
+                "requests": len(results),
+                "errors": len(results) - len(latencies),
+                "qps": round(len(latencies) / wall, 2),
+                **(latency_summary(latencies) if latencies else {}),
+                "peak_rss_mb": peak_rss_mb()
+            })
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    from rag_core.telemetry import telemetry
+    return {"runs": report, "stages": telemetry.snapshot().get("rag_stage_seconds", {})}
+
+
+def run(args):
+    n_chunks = SIZES[args.size] if args.size in SIZES else int(args.size)
+    embedder = make_embedder(args.embedder)
+    report = {"environment": environment(), "config": vars(args)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "documents")
+        index_dir = os.path.join(tmp, "index")
+
+        t0 = time.perf_counter()
+        files = write_corpus(data_dir, n_chunks, seed=args.seed)
+        report["corpus"] = {
+            "chunks": n_chunks,
+            "files": files,
+            "generate_sec": round(time.perf_counter() - t0, 3)
+        }
+
+        state, report["ingest"] = bench_ingest(
+            data_dir, index_dir, embedder, args.workers, args.batch_size
+        )
+        report["embedding"] = bench_embedding(
+            state.chunks, embedder, args.embed_sample, args.batch_size
+        )
+
+        questions = synthetic_questions(args.queries + args.requests, seed=args.seed)
+        report["retrieval"] = bench_retrieval(
+            state, questions[:args.queries], args.k, args.retrievers
+        )
+
+        if args.requests:
+            report["query"] = bench_query(
+                state,
+                StandInLLM(args.llm_latency_ms, args.llm_per_item_ms)
+                if args.llm_backend is None else build_llm(args.llm_backend),
+                questions[args.queries:],
+                args.concurrency,
+                args.k,
+                args.port
+            )
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG performance benchmark suite")
+    parser.add_argument("--size", type=str, default="1k",
+                        help="Corpus size in chunks: 1k, 100k, 1m or an integer")
+    parser.add_argument("--embedder", choices=["hash", "model"], default="hash",
+                        help="hash: deterministic stand-in; model: the real EmbeddingModel")
+    parser.add_argument("--workers", type=int, default=1, help="Also time a parallel rebuild")
+    parser.add_argument("--batch-size", type=int, default=256, help="Embedding batch size")
+    parser.add_argument("--embed-sample", type=int, default=10000, help="Texts for the embedding phase")
+    parser.add_argument("--k", type=int, default=3, help="Top-k")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per retriever")
+    parser.add_argument("--retrievers", nargs="+",
+                        default=["dense", "ivf", "float16", "int8", "bm25", "hybrid"],
+                        choices=["dense", "ivf", "float16", "int8", "bm25", "hybrid"])
+    parser.add_argument("--requests", type=int, default=400,
+                        help="Total /query requests (0 skips the end-to-end phase)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--llm-backend", choices=sorted(LLM_BACKENDS), default=None,
+                        help="Real LLM backend for /query (default: the delayed stand-in)")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0, help="Stand-in LLM per-call delay")
+    parser.add_argument("--llm-per-item-ms", type=float, default=2.0, help="Stand-in LLM per-prompt delay")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default=None, help="Write JSON report here")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
 
@@ -13,7 +12,16 @@ class EmbeddingModel:
         assert isinstance(model_name, str) and len(model_name.split()) == 1, \
             "model_name must be a valid HuggingFace model id"
         
+        # torch loads on first use, not on import
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+        # Used by the chunker to size chunks to what the model embeds
+        self.tokenizer = self.model.tokenizer
+        self.max_seq_length = self.model.max_seq_length
 
     def __call__(self, text):
         """
@@ -27,3 +35,31 @@ class EmbeddingModel:
         """
         embedding = self.model.encode(text, normalize_embeddings=True)
         return np.array(embedding)
+
+    def encode_batch(self, texts, batch_size=64):
+        """
+        Generates embeddings for many texts in batched forward passes.
+
+        Texts are sorted by length so each batch pads to a similar size,
+        then written back into their original rows.
+
+        Args:
+            texts (list[str]): Input texts.
+            batch_size (int): Texts per forward pass.
+
+        Returns:
+            np.ndarray: float32 matrix of shape (len(texts), dim).
+        """
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        order = np.argsort([len(t) for t in texts], kind="stable")
+
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self.model.encode(
+                [texts[i] for i in rows],
+                batch_size=batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True
+            )
+
+        return out
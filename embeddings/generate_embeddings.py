@@ -1,10 +1,33 @@
 import numpy as np
 
-def embed_texts(chunks, embedding_model):
-    embeddings = []
+def embed_texts(chunks, embedding_model, batch_size=64):
+    texts = [chunk["text"] for chunk in chunks]
+
+    # embedding_model is already an instance
+    # Identical texts (e.g. shared boilerplate across files) are encoded once
+    unique = {}
+    rows = np.array([unique.setdefault(t, len(unique)) for t in texts], dtype=np.intp)
+    if len(unique) == len(texts):
+        return embedding_model.encode_batch(texts, batch_size=batch_size)
+
+    return embedding_model.encode_batch(list(unique), batch_size=batch_size)[rows]
+
+
+def embed_stream(chunks, embedding_model, batch_size=256):
+    """
+    Embeds an iterable of chunks in fixed-size batches.
+
+    Yields:
+        (list[dict], np.ndarray): the batch's chunks and their
+        (len(batch), dim) float32 embeddings.
+    """
+    batch = []
 
     for chunk in chunks:
-        vector = embedding_model(chunk["text"])  # embedding_model is already an instance
-        embeddings.append(vector)
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield batch, embed_texts(batch, embedding_model)
+            batch = []
 
-    return embeddings
+    if batch:
+        yield batch, embed_texts(batch, embedding_model)
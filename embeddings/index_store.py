@@ -0,0 +1,446 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+import numpy as np
+
+from embeddings.quantization import quantize_blocks
+
+try:
+    import fcntl
+except ImportError:  # Windows: keep to one writing process per index
+    fcntl = None
+
+INDEX_DIR = "data/index"
+INDEX_VERSION = 6
+
+EMBEDDINGS_FILE = "embeddings.f32"
+# Chunk text, concatenated, and one fixed-size record per row locating
+# it. Both are mapped, so no process parses chunk text into its heap
+CHUNK_TEXT_FILE = "chunks.txt"
+CHUNK_ROWS_FILE = "chunks.rows"
+CHUNK_DTYPE = np.dtype([
+    ("offset", "<i8"), ("length", "<i4"), ("source", "<i4"),
+    ("start", "<i8"), ("end", "<i8"),  # -1: None
+    ("hash", "u1", 32)                 # sha256 of the text
+])
+# One JSON record per version of a generation, appended on commit
+LOG_FILE = "log.jsonl"
+# Names the generation and log offset readers should map
+CURRENT_FILE = "CURRENT"
+# Held by the process writing to the index
+LOCK_FILE = "LOCK"
+# Superseded generations (and BM25 segments) kept for readers still
+# mapping them
+KEEP_VERSIONS = 2
+
+# Compressed copies of embeddings.f32 (see embeddings.quantization)
+CODES_FILES = {"float16": "embeddings.f16", "int8": "embeddings.i8"}
+SCALES_FILE = "scales.i8.f32"
+CODE_DTYPES = {"float16": np.float16, "int8": np.int8}
+
+# One published version. `version` is (generation, log offset) and
+# `path` the generation directory, where derived data (BM25 segments,
+# quantized codes) lives. `chunks` is a ChunkStore, `dead` lists the
+# [start, stop) row ranges of removed documents, `lexical` is what
+# BM25Index.save returned, and `origin` is what the generation was
+# compacted from, if anything
+StoredIndex = namedtuple(
+    "StoredIndex",
+    ["version", "path", "count", "chunk_embeddings", "chunks", "manifest", "dead", "lexical",
+     "sources", "origin"]
+)
+
+
+class ChunkStore(Sequence):
+    """
+    The chunks of one index version, read from the mapped chunk files
+    on access: chunks[row] is a {"text", "source", "start", "end"} dict.
+    """
+
+    def __init__(self, rows, text, sources):
+        self._rows = rows
+        self._text = text
+        self._sources = sources
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+
+        record = self._rows[row]
+        offset = int(record["offset"])
+        return {
+            "text": bytes(self._text[offset:offset + int(record["length"])]).decode("utf-8"),
+            "source": self._sources[record["source"]],
+            "start": None if record["start"] < 0 else int(record["start"]),
+            "end": None if record["end"] < 0 else int(record["end"])
+        }
+
+    def hashes(self, rows):
+        """
+        Content hashes (as ingestion.chunking.content_hash) of `rows`,
+        a slice or an array of row ids.
+        """
+        return [digest.tobytes().hex() for digest in self._rows["hash"][rows]]
+
+
+def _map(path, dtype, shape):
+    if shape[0] == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def load_chunks(path, count, sources):
+    """
+    Maps the first `count` chunk rows of a generation directory.
+
+    Returns:
+        ChunkStore, or None when the chunk files are too short.
+    """
+    rows_path = os.path.join(path, CHUNK_ROWS_FILE)
+    text_path = os.path.join(path, CHUNK_TEXT_FILE)
+    try:
+        if os.path.getsize(rows_path) < count * CHUNK_DTYPE.itemsize:
+            return None
+        rows = _map(rows_path, CHUNK_DTYPE, (count,))
+        size = int(rows[-1]["offset"] + rows[-1]["length"]) if count else 0
+        if os.path.getsize(text_path) < size:
+            return None
+        text = _map(text_path, np.uint8, (size,))
+    except FileNotFoundError:
+        return None
+    return ChunkStore(rows, text, sources)
+
+
+def index_fingerprint(model_name, dim, chunker):
+    """
+    Identifies what produced a persisted index. A stored index is only
+    reused when every field matches.
+    """
+    return {
+        "version": INDEX_VERSION,
+        "model": model_name,
+        "dim": int(dim),
+        "chunker": chunker
+    }
+
+
+class IndexWriter:
+    """
+    Appends index rows to a generation directory and publishes versions.
+
+    A generation is a set of append-only row files (the float32
+    embeddings, the quantized codes of `code_kinds` and the chunks) and
+    a log. Every version is a prefix of the row files plus the log
+    records up to it, so an update only appends its new rows and one
+    small record: the manifest entries it changed, the rows it removed,
+    the new source names and the BM25 segments in use. Rows are never
+    rewritten in place; a full rebuild or a compaction starts a new
+    generation.
+
+    `commit` publishes a version by atomically replacing the CURRENT
+    pointer, so readers map either the old version or the new one, never
+    half of each. Superseded generations are pruned after a while.
+    """
+
+    def __init__(self, index_dir, dim, code_kinds=(), resume=None):
+        """
+        `resume` (a StoredIndex) continues the generation of that
+        version; anything written past it, e.g. by a writer that died
+        mid-commit, is cut off first.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.dim = int(dim)
+        self.code_kinds = list(code_kinds)
+
+        if resume is None:
+            # Names sort by creation time
+            self.path = tempfile.mkdtemp(prefix=f"g{time.time_ns()}-", dir=index_dir)
+            self.generation, self.offset = os.path.basename(self.path), 0
+            self.count, self.sources = 0, []
+        else:
+            self.path = resume.path
+            self.generation, self.offset = resume.version
+            self.count, self.sources = resume.count, list(resume.sources)
+
+        self._source_ids = {s: i for i, s in enumerate(self.sources)}
+        self._new_sources = []  # named by rows appended since the last commit
+        chunks = load_chunks(self.path, self.count, self.sources) if self.count else None
+        self.text_size = len(chunks._text) if chunks is not None else 0
+        self._committed = (self.offset, self.count, self.text_size)
+        self._truncate()
+        self._backfill_codes()
+
+    def _files(self):
+        # Row files with their bytes per row
+        files = [(EMBEDDINGS_FILE, self.dim * 4), (CHUNK_ROWS_FILE, CHUNK_DTYPE.itemsize)]
+        for kind in self.code_kinds:
+            files.append((CODES_FILES[kind], self.dim * np.dtype(CODE_DTYPES[kind]).itemsize))
+            if kind == "int8":
+                files.append((SCALES_FILE, 4))
+        return files
+
+    def _truncate(self):
+        offset, count, text_size = self._committed
+        sizes = [(name, count * width) for name, width in self._files()]
+        sizes += [(CHUNK_TEXT_FILE, text_size), (LOG_FILE, offset)]
+        for name, size in sizes:
+            with open(os.path.join(self.path, name), "ab") as f:
+                if f.tell() > size:
+                    f.truncate(size)
+
+    def _backfill_codes(self):
+        # Kinds enabled after the generation started lack older rows
+        for kind in self.code_kinds:
+            names = [CODES_FILES[kind]] + ([SCALES_FILE] if kind == "int8" else [])
+            have = min(
+                os.path.getsize(os.path.join(self.path, name)) // width
+                for name, width in self._files() if name in names
+            )
+            if have < self.count:
+                self._append_codes(kind, self.matrix()[have:], have)
+
+    def _append_file(self, name, array, row=None):
+        with open(os.path.join(self.path, name), "ab") as f:
+            if row is not None:
+                f.truncate(row * array[0].nbytes if len(array) else f.tell())
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    def _append_codes(self, kind, matrix, row=None):
+        codes, scales = quantize_blocks(matrix, kind)
+        self._append_file(CODES_FILES[kind], codes, row)
+        if scales is not None:
+            self._append_file(SCALES_FILE, scales, row)
+
+    def append(self, embeddings, chunks):
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.size and matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected dim {self.dim}, got {matrix.shape[1]}")
+        if matrix.shape[0] != len(chunks):
+            raise ValueError(f"{matrix.shape[0]} embeddings for {len(chunks)} chunks")
+
+        texts = [c["text"].encode("utf-8") for c in chunks]
+        rows = np.zeros(len(chunks), dtype=CHUNK_DTYPE)
+        rows["length"] = [len(t) for t in texts]
+        rows["offset"] = self.text_size + np.cumsum(rows["length"]) - rows["length"]
+        rows["source"] = [self._source_id(c["source"]) for c in chunks]
+        for field in ("start", "end"):
+            rows[field] = [-1 if c.get(field) is None else c[field] for c in chunks]
+        rows["hash"] = [np.frombuffer(hashlib.sha256(t).digest(), dtype=np.uint8) for t in texts]
+
+        self._append_file(EMBEDDINGS_FILE, matrix)
+        for kind in self.code_kinds:
+            self._append_codes(kind, matrix)
+        self._append_file(CHUNK_TEXT_FILE, np.frombuffer(b"".join(texts), dtype=np.uint8))
+        self._append_file(CHUNK_ROWS_FILE, rows)
+        self.text_size += int(rows["length"].sum())
+        self.count += matrix.shape[0]
+
+    def _source_id(self, source):
+        source_id = self._source_ids.get(source)
+        if source_id is None:
+            source_id = self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+            self._new_sources.append(source)
+        return source_id
+
+    def matrix(self):
+        """
+        The rows written so far, mapped read-only.
+        """
+        return _map(os.path.join(self.path, EMBEDDINGS_FILE), np.float32, (self.count, self.dim))
+
+    def chunks(self):
+        """
+        ChunkStore of the rows written so far.
+        """
+        return load_chunks(self.path, self.count, self.sources)
+
+    def commit(self, record):
+        """
+        Publishes the rows appended so far together with `record`
+        ("manifest": changed entries, None for removed sources; "dead":
+        rows removed; "lexical": BM25 segments; the first record of a
+        generation also has "fingerprint" and "origin").
+
+        Returns:
+            The new version, (generation, log offset).
+        """
+        line = json.dumps(
+            {**record, "count": self.count, "sources": self._new_sources},
+            separators=(",", ":")
+        ).encode("utf-8") + b"\n"
+        with open(os.path.join(self.path, LOG_FILE), "ab") as f:
+            f.write(line)
+
+        offset = self.offset + len(line)
+        current = os.path.join(self.index_dir, CURRENT_FILE)
+        with open(current + ".tmp", "w", encoding="utf-8") as f:
+            f.write(f"{self.generation} {offset}")
+        os.replace(current + ".tmp", current)
+
+        first = self.offset == 0
+        self.offset = offset
+        self._committed = (self.offset, self.count, self.text_size)
+        self._new_sources = []
+
+        if first:
+            self._prune()
+        return self.generation, self.offset
+
+    def abort(self):
+        """
+        Drops everything appended since the last commit; a generation
+        with no commit at all is removed.
+        """
+        if self._committed[0] == 0:
+            shutil.rmtree(self.path, ignore_errors=True)
+            return
+        self.offset, self.count, self.text_size = self._committed
+        for source in self._new_sources:
+            del self._source_ids[source]
+        del self.sources[len(self.sources) - len(self._new_sources):]
+        self._new_sources = []
+        self._truncate()
+
+    def _prune(self):
+        older = sorted(
+            name for name in os.listdir(self.index_dir)
+            if name.startswith("g") and name < self.generation
+            and os.path.isdir(os.path.join(self.index_dir, name))
+        )
+        # Unlinking is safe for processes that already mapped the files
+        for name in older[:max(0, len(older) - KEEP_VERSIONS)]:
+            shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+
+@contextmanager
+def index_lock(index_dir):
+    """
+    Exclusive lock on `index_dir` for one process's writes, so no two
+    writers append to the same generation.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, LOCK_FILE), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def current_version(index_dir):
+    """
+    The published (generation, log offset), or None.
+    """
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            generation, offset = f.read().split()
+    except (FileNotFoundError, ValueError):
+        return None
+    return generation, int(offset)
+
+
+def load_index(index_dir, fingerprint, held=None):
+    """
+    Memory-maps the published index version. With `held`, the
+    StoredIndex loaded last, a newer version of the same generation
+    only reads the log records added since.
+
+    Returns:
+        StoredIndex, or None when there is no index on disk or it was
+        built with a different fingerprint.
+    """
+    version = current_version(index_dir)
+    if version is None:
+        return None
+
+    generation, offset = version
+    if held is not None and (held.version[0] != generation or held.version[1] > offset):
+        held = None
+    start = held.version[1] if held is not None else 0
+
+    path = os.path.join(index_dir, generation)
+    try:
+        with open(os.path.join(path, LOG_FILE), "rb") as f:
+            f.seek(start)
+            records = [json.loads(line) for line in f.read(offset - start).splitlines()]
+    except FileNotFoundError:
+        return None  # pruned after CURRENT moved on; the caller may retry
+
+    if held is None:
+        if not records or records[0].get("fingerprint") != fingerprint:
+            return None
+        manifest, dead, sources = {}, [], []
+        count, lexical, origin = 0, None, records[0].get("origin")
+    else:
+        manifest, dead, sources = dict(held.manifest), list(held.dead), list(held.sources)
+        count, lexical, origin = held.count, held.lexical, held.origin
+
+    for record in records:
+        sources.extend(record["sources"])
+        for source, entry in record["manifest"].items():
+            if entry is None:
+                manifest.pop(source, None)
+            else:
+                manifest[source] = entry
+        dead.extend(tuple(rows) for rows in record["dead"])
+        count, lexical = record["count"], record["lexical"]
+
+    dim = fingerprint["dim"]
+    emb_path = os.path.join(path, EMBEDDINGS_FILE)
+    try:
+        # Later versions may have appended rows already
+        if os.path.getsize(emb_path) < count * dim * 4:
+            return None
+        chunk_embeddings = _map(emb_path, np.float32, (count, dim))
+    except FileNotFoundError:
+        return None
+
+    chunks = load_chunks(path, count, sources)
+    if chunks is None:
+        return None
+    return StoredIndex(
+        version, path, count, chunk_embeddings, chunks, manifest, dead, lexical, sources, origin
+    )
+
+
+# ------------------------------
+# Quantized codes
+# ------------------------------
+def load_codes(index_dir, kind, count, dim):
+    """
+    Maps the first `count` rows of the quantized codes IndexWriter
+    appends next to embeddings.f32.
+
+    Returns:
+        (codes, scales), or None when they are missing or too short.
+    """
+    codes_path = os.path.join(index_dir, CODES_FILES[kind])
+    scales_path = os.path.join(index_dir, SCALES_FILE) if kind == "int8" else None
+
+    dtype = CODE_DTYPES[kind]
+    try:
+        if os.path.getsize(codes_path) < count * dim * np.dtype(dtype).itemsize:
+            return None
+        if scales_path and os.path.getsize(scales_path) < count * 4:
+            return None
+    except FileNotFoundError:
+        return None
+
+    if count == 0:
+        return None
+
+    # Mapped like embeddings.f32, so processes sharing an index share
+    # one copy of the codes in the page cache
+    codes = _map(codes_path, dtype, (count, dim))
+    scales = _map(scales_path, np.float32, (count,)) if scales_path else None
+    return codes, scales
@@ -0,0 +1,80 @@
+import numpy as np
+
+QUANTIZATIONS = ("float16", "int8")
+
+# Rows converted per step when streaming a matrix through quantize/score;
+# small enough that a converted float32 block stays in cache
+BLOCK_ROWS = 2048
+
+
+def quantize(matrix, kind):
+    """
+    Compresses float32 rows.
+
+    "float16": half-precision copy, no scales.
+    "int8":    symmetric per-vector quantization, row ~= codes * scale
+               with scale = max(|row|) / 127.
+
+    Returns:
+        (codes, scales): scales is a float32 vector for int8, else None.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+
+    if kind == "float16":
+        return matrix.astype(np.float16), None
+    if kind == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0 if matrix.size else np.empty(0, np.float32)
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return codes, scales
+
+    raise ValueError(f"Unknown quantization: {kind}")
+
+
+def quantize_blocks(matrix, kind, block_rows=BLOCK_ROWS):
+    """
+    quantize() over a (possibly memory-mapped) matrix a block at a time,
+    so the float32 rows never need to be resident all at once.
+    """
+    n, dim = matrix.shape
+    codes = np.empty((n, dim), dtype=np.float16 if kind == "float16" else np.int8)
+    scales = np.empty(n, dtype=np.float32) if kind == "int8" else None
+
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        block_codes, block_scales = quantize(matrix[start:stop], kind)
+        codes[start:stop] = block_codes
+        if scales is not None:
+            scales[start:stop] = block_scales
+
+    return codes, scales
+
+
+def dequantize(codes, scales=None):
+    matrix = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        matrix = matrix * scales[:, None]
+    return matrix
+
+
+def score_blocks(codes, scales, queries, block_rows=BLOCK_ROWS):
+    """
+    Scores of one query (dim,) or a batch (q, dim) against every row,
+    computed in float32 without materializing a float32 copy of the
+    whole code matrix.
+
+    int8 scores at about float32 speed. numpy's float16 -> float32
+    conversion is slow, so float16 costs more per query; scoring
+    queries as a batch converts each block once for all of them.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    n = codes.shape[0]
+    scores = np.empty(queries.shape[:-1] + (n,), dtype=np.float32)
+
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        scores[..., start:stop] = queries @ codes[start:stop].astype(np.float32).T
+
+    if scales is not None:
+        scores *= scales
+    return scores
@@ -4,14 +4,21 @@ def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
-def grounding_score(answer, context_chunks, embedding_model):
+def grounding_score(answer, context_chunks, embedding_model, context_embeddings=None):
     """
     Measures how well the answer is supported by retrieved context.
+
+    When the chunks' index embeddings are passed as `context_embeddings`,
+    their mean stands in for the context embedding instead of encoding
+    the concatenated text again.
     """
     answer_emb = embedding_model(answer)
 
-    context_text = " ".join(context_chunks)
-    context_emb = embedding_model(context_text)
+    if context_embeddings is not None and len(context_embeddings):
+        context_emb = np.asarray(context_embeddings, dtype=np.float32).mean(axis=0)
+    else:
+        context_text = " ".join(context_chunks)
+        context_emb = embedding_model(context_text)
 
     score = cosine_similarity(answer_emb, context_emb)
     return score
@@ -1,38 +1,152 @@
+import argparse
+import json
+import time
+from functools import partial
+
+import numpy as np
+
+
+def _percentiles(ms):
+    ms = np.asarray(ms, dtype=np.float64)
+    if ms.size == 0:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0}
+    return {
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3)
+    }
+
+
 def evaluate_retrieval(
     eval_queries,
     embedding_model,
     chunk_embeddings,
     chunks,
     retrieve_fn,
-    k=3
+    k=3,
+    reranker=None
 ):
+    """
+    Hit@K, MRR and Precision@K of `retrieve_fn` over `eval_queries`,
+    plus per-query latency in ms.
+
+    With a `reranker` (retrieval.reranker.CrossEncoderReranker), its
+    `candidates` hits are retrieved and re-ranked down to k; the
+    re-ranking time is reported separately as well.
+    """
     hits = []
     reciprocal_ranks = []
+    precisions = []
+    latencies = []
+    rerank_latencies = []
 
     for item in eval_queries:
         question = item["question"]
         relevant_sources = item["relevant_sources"]
 
+        t0 = time.perf_counter()
         query_embedding = embedding_model(question)
-        retrieved = retrieve_fn(query_embedding, chunk_embeddings, chunks, k=k)
+        if reranker is None:
+            retrieved = retrieve_fn(query_embedding, chunk_embeddings, chunks, k=k)
+        else:
+            candidates = retrieve_fn(
+                query_embedding, chunk_embeddings, chunks, k=max(k, reranker.candidates)
+            )
+            t1 = time.perf_counter()
+            retrieved = reranker.rerank(question, candidates, k)
+            rerank_latencies.append((time.perf_counter() - t1) * 1000)
+        latencies.append((time.perf_counter() - t0) * 1000)
 
         hit = 0
         rr = 0
+        relevant = 0
 
         for rank, (_, _, source) in enumerate(retrieved, start=1):
             if any(rel in source for rel in relevant_sources):
-
-                hit = 1
-                rr = 1 / rank
-                break
+                relevant += 1
+                if not hit:
+                    hit = 1
+                    rr = 1 / rank
 
         hits.append(hit)
         reciprocal_ranks.append(rr)
+        precisions.append(relevant / k)
 
     hit_at_k = sum(hits) / len(hits)
     mrr = sum(reciprocal_ranks) / len(reciprocal_ranks)
 
-    return {
+    report = {
         "Hit@K": hit_at_k,
-        "MRR": mrr
+        "MRR": mrr,
+        "Precision@K": sum(precisions) / len(precisions),
+        "latency_ms": _percentiles(latencies)
+    }
+    if reranker is not None:
+        report["rerank_ms"] = _percentiles(rerank_latencies)
+    return report
+
+
+def compare_reranking(
+    eval_queries,
+    embedding_model,
+    chunk_embeddings,
+    chunks,
+    retrieve_fn,
+    reranker,
+    k=3
+):
+    """
+    Bi-encoder ranking vs. the same retriever followed by `reranker`.
+    """
+    return {
+        "bi_encoder": evaluate_retrieval(
+            eval_queries, embedding_model, chunk_embeddings, chunks, retrieve_fn, k
+        ),
+        "reranked": evaluate_retrieval(
+            eval_queries, embedding_model, chunk_embeddings, chunks, retrieve_fn, k,
+            reranker=reranker
+        )
     }
+
+
+def main():
+    from backend.state import DocumentState
+    from evaluation.eval_data import EVAL_QUERIES
+    from retrieval.reranker import build_reranker
+    from retrieval.retrievers import build_retriever
+
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency on the local index")
+    parser.add_argument("--queries", type=str, default=None,
+                        help="JSONL of {question, relevant_sources} (default: eval_data)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--retriever", type=str, default=None)
+    parser.add_argument("--reranker", type=str, default="default",
+                        help="Cross-encoder to compare against the bi-encoder ranking")
+    parser.add_argument("--candidates", type=int, default=None)
+    args = parser.parse_args()
+
+    eval_queries = EVAL_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            eval_queries = [json.loads(line) for line in f if line.strip()]
+
+    snapshot = DocumentState().snapshot
+    # Scoped to the snapshot's live rows
+    retriever = partial(build_retriever(args.retriever), snapshot=snapshot)
+    reranker = build_reranker(args.reranker, args.candidates)
+
+    if reranker is None:
+        report = evaluate_retrieval(
+            eval_queries, state.embedding_model, snapshot.chunk_embeddings, snapshot.chunks,
+            retriever, args.k
+        )
+    else:
+        report = compare_reranking(
+            eval_queries, state.embedding_model, snapshot.chunk_embeddings, snapshot.chunks,
+            retriever, reranker, args.k
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,243 @@
-def process_documents(documents, chunk_size=300, overlap=50):
-    chunks = []
+import hashlib
+import re
+
+import numpy as np
+
+# Token budget per chunk; all-MiniLM-L6-v2 embeds up to 256 tokens
+# including [CLS] / [SEP]
+CHUNK_TOKENS = 254
+# Sentences repeated at the start of the next chunk
+CHUNK_OVERLAP = 0
+
+# Sentence ends (punctuation, closing quotes/brackets, whitespace) and
+# paragraph breaks (blank lines)
+BOUNDARY_RE = re.compile(r"[.!?]+[\"')\]]*\s+|\n[ \t]*\n\s*")
+WORD_RE = re.compile(r"\S+\s*")
+ESTIMATE_RE = re.compile(r"\w+|[^\w\s]")
+
+_tokenizers = {}
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ------------------------------
+# Token counting
+# ------------------------------
+def _estimate_counts(texts):
+    # Word pieces run ~4/3 per word or punctuation mark for English
+    return np.array(
+        [-(-4 * len(ESTIMATE_RE.findall(t)) // 3) for t in texts], dtype=np.int64
+    )
+
+
+def token_counter(tokenizer=None):
+    """
+    Returns fn(texts) -> int array of token counts.
+
+    `tokenizer` is a Hugging Face tokenizer, its name / path (loaded once
+    per process, so pool workers can receive it by name), or None for a
+    regex estimate.
+    """
+    if tokenizer is None:
+        return _estimate_counts
+
+    if isinstance(tokenizer, str):
+        if tokenizer not in _tokenizers:
+            from transformers import AutoTokenizer
+            _tokenizers[tokenizer] = AutoTokenizer.from_pretrained(tokenizer)
+        tokenizer = _tokenizers[tokenizer]
+
+    def count(texts):
+        if not texts:
+            return np.empty(0, dtype=np.int64)
+        encoded = tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return np.array([len(ids) for ids in encoded], dtype=np.int64)
+
+    return count
+
+
+def tokenizer_id(tokenizer):
+    """
+    Identifies a tokenizer by its class and vocabulary, so the same
+    tokenizer loaded from another cache path or host still matches.
+    """
+    if tokenizer is None:
+        return None
+
+    digest = hashlib.sha256(type(tokenizer).__name__.encode("utf-8"))
+    get_vocab = getattr(tokenizer, "get_vocab", None)
+    if get_vocab is not None:
+        for token, token_id in sorted(get_vocab().items(), key=lambda item: item[1]):
+            digest.update(f"{token_id}\0{token}\0".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def chunker_id(max_tokens=CHUNK_TOKENS, tokenizer=None, overlap=CHUNK_OVERLAP):
+    """
+    Identifies the chunking configuration in index fingerprints.
+    `tokenizer` is a tokenizer_id().
+    """
+    return f"sentences-{max_tokens}-{overlap}-{tokenizer or 'estimate'}"
+
+
+# ------------------------------
+# Spans
+# ------------------------------
+def sentence_spans(text):
+    """
+    Splits `text` at sentence ends and paragraph breaks.
+
+    Returns:
+        (starts, ends, paragraph): int arrays of character offsets and a
+        bool array marking units that open a new paragraph.
+    """
+    matches = list(BOUNDARY_RE.finditer(text))
+    cuts = np.array([m.end() for m in matches], dtype=np.int64)
+    breaks = np.array([m.group().count("\n") >= 2 for m in matches], dtype=bool)
+
+    starts = np.concatenate([[0], cuts])
+    ends = np.concatenate([cuts, [len(text)]])
+    paragraph = np.concatenate([[True], breaks])
+
+    keep = ends > starts
+    return starts[keep], ends[keep], paragraph[keep]
+
+
+def _split_long(text, starts, ends, paragraph, counts, max_tokens, count_tokens):
+    """
+    Breaks units longer than the budget into word-sized units.
+    """
+    too_long = np.flatnonzero(counts > max_tokens)
+    if len(too_long) == 0:
+        return starts, ends, paragraph, counts
+
+    parts = []
+    prev = 0
+    for i in too_long:
+        parts.append((starts[prev:i], ends[prev:i], paragraph[prev:i], counts[prev:i]))
+
+        words = list(WORD_RE.finditer(text, starts[i], ends[i]))
+        w_starts = np.array([w.start() for w in words], dtype=np.int64)
+        w_ends = np.array([w.end() for w in words], dtype=np.int64)
+        w_para = np.zeros(len(words), dtype=bool)
+        if len(words):
+            w_para[0] = paragraph[i]
+        parts.append((w_starts, w_ends, w_para, count_tokens([w.group() for w in words])))
+        prev = i + 1
+    parts.append((starts[prev:], ends[prev:], paragraph[prev:], counts[prev:]))
+
+    return tuple(np.concatenate(columns) for columns in zip(*parts))
+
+
+def pack_spans(counts, paragraph, max_tokens, overlap=CHUNK_OVERLAP):
+    """
+    Greedily groups consecutive units into chunks of at most
+    `max_tokens`, using prefix sums to find each chunk's end. A chunk
+    that is at least half full ends early at a paragraph break.
+
+    Returns:
+        list of (first, stop) unit index ranges.
+    """
+    n = len(counts)
+    cum = np.concatenate([[0], np.cumsum(counts)])
+    groups = []
+
+    i = 0
+    while i < n:
+        # Largest stop with cum[stop] - cum[i] <= max_tokens, at least one unit
+        stop = max(i + 1, int(np.searchsorted(cum, cum[i] + max_tokens, side="right")) - 1)
+
+        if stop < n:
+            candidates = i + 1 + np.flatnonzero(paragraph[i + 1:stop])
+            candidates = candidates[cum[candidates] - cum[i] >= max_tokens // 2]
+            if len(candidates):
+                stop = int(candidates[-1])
+
+        groups.append((i, stop))
+        i = max(i + 1, stop - overlap) if stop < n else n
+
+    return groups
+
+
+def chunk_spans(text, max_tokens=CHUNK_TOKENS, count_tokens=None, overlap=CHUNK_OVERLAP):
+    """
+    Character (start, end) offsets of the chunks of `text`, cut at
+    sentence / paragraph boundaries and sized to `max_tokens`.
+    """
+    count_tokens = count_tokens or _estimate_counts
+
+    starts, ends, paragraph = sentence_spans(text)
+    if len(starts) == 0:
+        return []
+
+    counts = count_tokens([text[s:e] for s, e in zip(starts, ends)])
+    starts, ends, paragraph, counts = _split_long(
+        text, starts, ends, paragraph, counts, max_tokens, count_tokens
+    )
+
+    spans = []
+    for first, stop in pack_spans(counts, paragraph, max_tokens, overlap):
+        start, end = int(starts[first]), int(ends[stop - 1])
+
+        # Trim surrounding whitespace, keeping offsets exact
+        piece = text[start:end]
+        start += len(piece) - len(piece.lstrip())
+        end -= len(piece) - len(piece.rstrip())
+        if end > start:
+            spans.append((start, end))
+
+    return spans
+
+
+# ------------------------------
+# Chunking
+# ------------------------------
+def iter_chunks(documents, max_tokens=CHUNK_TOKENS, tokenizer=None, overlap=CHUNK_OVERLAP):
+    """
+    Lazily yields chunk dicts; `documents` may itself be a generator.
+
+    Each chunk records its [start, end) character offsets in the
+    source document.
+    """
+    count_tokens = token_counter(tokenizer)
 
     for doc in documents:
         text = doc["text"]
         source = doc["source"]
 
-        start = 0
-        while start < len(text):
-            chunk_text = text[start:start + chunk_size]
+        for start, end in chunk_spans(text, max_tokens, count_tokens, overlap):
+            yield {
+                "text": text[start:end],
+                "source": source,
+                "start": start,
+                "end": end
+            }
+
+
+def process_documents(documents, max_tokens=CHUNK_TOKENS, tokenizer=None, overlap=CHUNK_OVERLAP):
+    return list(iter_chunks(documents, max_tokens, tokenizer, overlap))
+
 
-            chunks.append({
-                "text": chunk_text,
-                "source": source
-            })
+def chunk_document(doc, max_tokens=CHUNK_TOKENS, tokenizer=None, overlap=CHUNK_OVERLAP):
+    """
+    Chunks one document and fingerprints it for the index manifest.
+    Repeated chunks (boilerplate headers, footers) are kept once.
+    """
+    chunks, hashes, seen = [], [], set()
 
-            start += chunk_size - overlap
+    for chunk in iter_chunks([doc], max_tokens, tokenizer, overlap):
+        h = content_hash(chunk["text"])
+        if h in seen:
+            continue
+        seen.add(h)
+        chunks.append(chunk)
+        hashes.append(h)
 
-    return chunks
+    return {
+        "source": doc["source"],
+        "hash": content_hash(doc["text"]),
+        "chunks": chunks,
+        "chunk_hashes": hashes
+    }
@@ -1,19 +1,29 @@
 import os
 
-def load_documents(folder_path):
-    documents = []
+def load_document(folder_path, filename):
+    file_path = os.path.join(folder_path, filename)
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    return {
+        "text": text,
+        "source": filename
+    }
 
-    for filename in os.listdir(folder_path):
+
+def iter_documents(folder_path):
+    """
+    Yields documents one at a time so only a single file's text is
+    held in memory.
+    """
+    for filename in sorted(os.listdir(folder_path)):
         file_path = os.path.join(folder_path, filename)
         if not os.path.isfile(file_path):
             continue
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            text = f.read()
+        yield load_document(folder_path, filename)
 
-        documents.append({
-            "text": text,
-            "source": filename
-        })
 
-    return documents
+def load_documents(folder_path):
+    return list(iter_documents(folder_path))
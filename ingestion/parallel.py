@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from ingestion.load_documents import load_document
+from ingestion.chunking import chunk_document
+
+_DONE = object()
+
+
+def load_and_chunk(folder_path, filename, chunk_options):
+    """
+    Worker task: read + chunk one file. Only the chunk records travel
+    back to the parent, not the full text.
+    """
+    return chunk_document(load_document(folder_path, filename), **chunk_options)
+
+
+def iter_chunked_documents(folder_path, workers, max_pending=None, **chunk_options):
+    """
+    Reads and chunks every file in `folder_path` over a process pool.
+
+    Results are yielded in filename order regardless of which worker
+    finishes first; at most `max_pending` files are in flight so memory
+    stays bounded for huge folders. `chunk_options` go to
+    chunk_document; a tokenizer must be passed by name.
+    """
+    filenames = sorted(
+        f for f in os.listdir(folder_path)
+        if os.path.isfile(os.path.join(folder_path, f))
+    )
+    max_pending = max_pending or workers * 4
+
+    # spawn: forking a process that already holds torch threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+
+        for filename in filenames:
+            pending.append(pool.submit(load_and_chunk, folder_path, filename, chunk_options))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def prefetch(iterable, maxsize=8):
+    """
+    Runs `iterable` in a background thread and yields its items through
+    a bounded queue, so consecutive stages overlap while back-pressure
+    keeps a fast producer from racing ahead. Exceptions are re-raised
+    in the consumer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as exc:
+            put(exc)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchingLLM:
+    """
+    Dynamic micro-batching in front of an LLM.
+
+    Concurrent callers enqueue prompts; a single worker thread collects
+    up to `max_batch_size` prompts or waits at most `max_wait_ms` after
+    the first one, runs them through `llm.generate_batch` as one padded
+    batch, and hands each caller its own result.
+
+    Drop-in for LLM: calling it with a prompt blocks until the answer
+    for that prompt is ready.
+    """
+
+    def __init__(self, llm, max_batch_size=8, max_wait_ms=10):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.queue_wait_sec = 0.0
+        self.max_queue_wait_sec = 0.0
+
+        self._worker = threading.Thread(
+            target=self._run, name="llm-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def __call__(self, prompt):
+        return self.submit(prompt).result()
+
+    def submit(self, prompt):
+        future = Future()
+        self._queue.put((prompt, future, time.perf_counter()))
+        return future
+
+    def generate_batch(self, prompts):
+        futures = [self.submit(p) for p in prompts]
+        return [f.result() for f in futures]
+
+    def __getattr__(self, name):
+        # Anything else (tokenizer, streaming, ...) goes to the wrapped LLM
+        return getattr(self.llm, name)
+
+    # ------------------------------
+    # Worker
+    # ------------------------------
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+
+            waits = [started - enqueued for _, _, enqueued in batch]
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.queue_wait_sec += sum(waits)
+                self.max_queue_wait_sec = max(self.max_queue_wait_sec, *waits)
+
+            try:
+                results = self.llm.generate_batch([p for p, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"LLM returned {len(results)} results for {len(batch)} prompts"
+                    )
+            except Exception as exc:
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "batches": self.batches,
+                "items": self.items,
+                "queued": self._queue.qsize(),
+                "avg_batch_size": round(self.items / self.batches, 3) if self.batches else 0.0,
+                "avg_batch_fill": round(
+                    self.items / (self.batches * self.max_batch_size), 4
+                ) if self.batches else 0.0,
+                "avg_queue_wait_ms": round(
+                    1000 * self.queue_wait_sec / self.items, 3
+                ) if self.items else 0.0,
+                "max_queue_wait_ms": round(1000 * self.max_queue_wait_sec, 3)
+            }
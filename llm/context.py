@@ -0,0 +1,104 @@
+import os
+import re
+
+from ingestion.chunking import token_counter
+from llm.prompt import build_prompt
+
+# flan-t5 was trained on 512-token inputs
+DEFAULT_INPUT_TOKENS = 512
+# Share of a chunk's word trigrams already in the context that marks it
+# as a near-duplicate (overlapping or boilerplate chunks)
+DUPLICATE_OVERLAP = 0.8
+
+SHINGLE_RE = re.compile(r"\w+")
+
+
+def shingles(text, n=3):
+    words = SHINGLE_RE.findall(text.lower())
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _input_budget(tokenizer):
+    env = os.getenv("RAG_MAX_INPUT_TOKENS")
+    if env:
+        return int(env)
+
+    # Tokenizers without a configured limit report a huge sentinel
+    limit = getattr(tokenizer, "model_max_length", None)
+    if limit and limit < 1_000_000:
+        return int(limit)
+    return DEFAULT_INPUT_TOKENS
+
+
+class ContextAssembler:
+    """
+    Packs retrieved chunks into a prompt that fits the LLM's input.
+
+    Chunks are taken best-first; a chunk is skipped when most of its
+    word trigrams are already in the context, or when it would push the
+    prompt past `max_input_tokens` (smaller ones further down may still
+    fit). Tokens are counted with the LLM's own tokenizer, or estimated
+    when it has none; the top chunk is always kept.
+    """
+
+    def __init__(self, tokenizer=None, max_input_tokens=None,
+                 duplicate_overlap=DUPLICATE_OVERLAP):
+        self.tokenizer = tokenizer
+        self.max_input_tokens = max_input_tokens or _input_budget(tokenizer)
+        self.duplicate_overlap = duplicate_overlap
+        self.count_tokens = token_counter(tokenizer)
+
+        # Tokens the tokenizer adds around the input (e.g. T5's </s>)
+        special = getattr(tokenizer, "num_special_tokens_to_add", None)
+        self.reserved = int(special()) if special is not None else 0
+
+    def count(self, text):
+        return int(self.count_tokens([text])[0])
+
+    def assemble(self, question, hits):
+        """
+        Returns a dict: prompt, prompt_tokens, budget, the packed `hits`
+        and how many chunks were dropped as duplicates / over budget.
+        """
+        budget = self.max_input_tokens - self.reserved
+        texts = [hit[1] for hit in hits]
+
+        # One tokenizer call for the template and every chunk; "\n\n"
+        # separators are counted through the template's own spacing
+        counts = self.count_tokens([build_prompt([], question)] + texts)
+        used = int(counts[0])
+
+        packed, seen = [], set()
+        duplicates = over_budget = 0
+        for hit, text, n in zip(hits, texts, counts[1:]):
+            grams = shingles(text)
+            if packed and grams and len(grams & seen) >= self.duplicate_overlap * len(grams):
+                duplicates += 1
+                continue
+            if packed and used + n > budget:
+                over_budget += 1
+                continue
+
+            packed.append(hit)
+            seen |= grams
+            used += int(n)
+
+        # Joined text can tokenize slightly differently at the seams
+        prompt = build_prompt([hit[1] for hit in packed], question)
+        prompt_tokens = self.count(prompt)
+        while len(packed) > 1 and prompt_tokens > budget:
+            packed.pop()
+            over_budget += 1
+            prompt = build_prompt([hit[1] for hit in packed], question)
+            prompt_tokens = self.count(prompt)
+
+        return {
+            "prompt": prompt,
+            "prompt_tokens": prompt_tokens,
+            "budget": int(self.max_input_tokens),
+            "hits": packed,
+            "duplicates": duplicates,
+            "over_budget": over_budget
+        }
@@ -1,2 +1,10 @@
 def generate_answer(prompt, llm):
     return llm(prompt)
+
+
+def stream_answer(prompt, llm):
+    # LLMs without a streaming API produce the answer in one piece
+    if hasattr(llm, "stream"):
+        yield from llm.stream(prompt)
+    else:
+        yield llm(prompt)
@@ -1,12 +1,221 @@
-from transformers import pipeline
+import os
+import re
+import threading
+import time
+
+DEFAULT_MODEL = "google/flan-t5-small"
+NO_ANSWER = "I cannot find the answer in the provided documents."
+
 
 class LLM:
-    def __init__(self, model_name="google/flan-t5-small"):
+    """
+    Hugging Face text2text-generation pipeline in full fp32 PyTorch.
+
+    Subclasses swap the model behind the same pipeline (`_load_model`),
+    so batching, streaming and the tokenizer work the same for every
+    backend.
+    """
+
+    backend = "hf"
+
+    def __init__(self, model_name=DEFAULT_MODEL, max_new_tokens=200):
+        from transformers import pipeline
+
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
         self.pipe = pipeline(
             "text2text-generation",
-            model=model_name
+            model=self._load_model(model_name),
+            tokenizer=model_name
         )
+        # Prompts are packed to this tokenizer's budget (llm.context)
+        self.tokenizer = self.pipe.tokenizer
+
+    def _load_model(self, model_name):
+        # The pipeline loads the weights itself
+        return model_name
 
     def __call__(self, prompt):
-        output = self.pipe(prompt, max_new_tokens=200)
+        output = self.pipe(prompt, max_new_tokens=self.max_new_tokens)
         return output[0]["generated_text"]
+
+    def generate_batch(self, prompts):
+        """
+        Runs several prompts through the pipeline as one padded batch.
+        """
+        outputs = self.pipe(
+            list(prompts),
+            max_new_tokens=self.max_new_tokens,
+            batch_size=len(prompts)
+        )
+        # A list input gives one dict per prompt; older pipelines wrap
+        # each in a list, as for a single prompt
+        return [
+            (output[0] if isinstance(output, list) else output)["generated_text"]
+            for output in outputs
+        ]
+
+    def stream(self, prompt):
+        """
+        Yields decoded text pieces as generation produces them.
+        """
+        from transformers import TextIteratorStreamer
+
+        tokenizer = self.pipe.tokenizer
+        model = self.pipe.model
+
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True).to(model.device)
+        streamer = TextIteratorStreamer(
+            tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+
+        thread = threading.Thread(
+            target=model.generate,
+            kwargs=dict(**inputs, streamer=streamer, max_new_tokens=self.max_new_tokens),
+            daemon=True
+        )
+        thread.start()
+
+        for piece in streamer:
+            if piece:
+                yield piece
+
+        thread.join()
+
+
+class QuantizedLLM(LLM):
+    """
+    The HF backend with every Linear layer dynamically quantized to
+    int8: weights are stored as int8 and activations quantized on the
+    fly, which speeds up CPU matmuls and quarters the weight memory.
+    """
+
+    backend = "int8"
+
+    def _load_model(self, model_name):
+        import torch
+        from transformers import AutoModelForSeq2SeqLM
+
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name).eval()
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+
+class ONNXLLM(LLM):
+    """
+    The model exported to ONNX and run by ONNX Runtime.
+
+    The export includes a decoder that takes the previous steps' key /
+    value tensors, so each decoding step only runs the newest token
+    instead of re-encoding the whole output. Exports are saved under
+    `onnx_dir` and reused on the next start.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, model_name=DEFAULT_MODEL, max_new_tokens=200, onnx_dir=None):
+        self.onnx_dir = onnx_dir or os.path.join(
+            os.getenv("RAG_ONNX_DIR", "data/onnx"), model_name.replace("/", "--")
+        )
+        super().__init__(model_name, max_new_tokens)
+
+    def _load_model(self, model_name):
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as exc:
+            raise ImportError(
+                "The onnx LLM backend needs optimum: pip install 'optimum[onnxruntime]'"
+            ) from exc
+
+        if os.path.isdir(self.onnx_dir):
+            return ORTModelForSeq2SeqLM.from_pretrained(self.onnx_dir, use_cache=True)
+
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, use_cache=True)
+        model.save_pretrained(self.onnx_dir)
+        return model
+
+
+class StubLLM:
+    """
+    Deterministic, model-free LLM for tests and benchmarks.
+
+    Answers with the context sentence sharing the most words with the
+    question (the first on ties), cut to `answer_words`, or the refusal
+    from the prompt when nothing overlaps. Optional delays imitate a
+    batched forward pass: `latency_ms` per call plus `per_item_ms` per
+    prompt, with calls serialized like one model on one device.
+    """
+
+    backend = "stub"
+
+    SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+    WORD_RE = re.compile(r"\w+")
+
+    def __init__(self, latency_ms=0.0, per_item_ms=0.0, answer_words=40, max_new_tokens=200):
+        self.model_name = "stub"
+        self.latency = latency_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.answer_words = min(answer_words, max_new_tokens)
+        self.max_new_tokens = max_new_tokens
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt):
+        head, _, question = prompt.rpartition("Question:")
+        context = head.partition("Context:")[2]
+        asked = set(self.WORD_RE.findall(question.lower()))
+
+        best, best_overlap = None, 0
+        for sentence in self.SENTENCE_RE.split(context):
+            overlap = len(asked & set(self.WORD_RE.findall(sentence.lower())))
+            if overlap > best_overlap:
+                best, best_overlap = sentence, overlap
+
+        if best is None:
+            return NO_ANSWER
+        return " ".join(best.split()[:self.answer_words])
+
+    def generate_batch(self, prompts):
+        if self.latency or self.per_item:
+            with self._lock:
+                time.sleep(self.latency + self.per_item * len(prompts))
+        return [self._answer(p) for p in prompts]
+
+    def __call__(self, prompt):
+        return self.generate_batch([prompt])[0]
+
+    def stream(self, prompt):
+        for word in self(prompt).split():
+            yield word + " "
+
+
+LLM_BACKENDS = {
+    "hf": LLM,
+    "int8": QuantizedLLM,
+    "onnx": ONNXLLM,
+    "stub": StubLLM
+}
+
+
+def build_llm(backend=None, model_name=None, max_new_tokens=None):
+    """
+    Creates the LLM backend named by `backend` (or $RAG_LLM_BACKEND).
+
+    "hf":   fp32 PyTorch pipeline (default).
+    "int8": dynamically int8-quantized PyTorch.
+    "onnx": ONNX Runtime export with KV-cache reuse (needs optimum).
+    "stub": deterministic extractive stand-in, no model download.
+
+    model_name / max_new_tokens default to $RAG_LLM_MODEL and
+    $RAG_LLM_MAX_NEW_TOKENS.
+    """
+    backend = backend or os.getenv("RAG_LLM_BACKEND", "hf")
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {backend}")
+
+    max_new_tokens = max_new_tokens or int(os.getenv("RAG_LLM_MAX_NEW_TOKENS", "200"))
+    if backend == "stub":
+        return StubLLM(max_new_tokens=max_new_tokens)
+
+    model_name = model_name or os.getenv("RAG_LLM_MODEL", DEFAULT_MODEL)
+    return LLM_BACKENDS[backend](model_name, max_new_tokens)
@@ -1,3 +1,6 @@
-def estimate_tokens(text: str) -> int:
-    # rough heuristic: 1 token ≈ 4 chars
-    return max(1, len(text) // 4)
+from ingestion.chunking import token_counter
+
+
+def estimate_tokens(text: str, tokenizer=None) -> int:
+    # Real count with a tokenizer (object or name), else a word-piece estimate
+    return max(1, int(token_counter(tokenizer)([text])[0]))
@@ -1,49 +1,139 @@
 import argparse
+import json
+import time
 
-from ingestion.load_documents import load_documents
-from ingestion.chunking import process_documents
-from embeddings.embedding_model import EmbeddingModel
-from embeddings.generate_embeddings import embed_texts
-from retrieval.similarity import retrieve_top_k
-from llm.llm_model import LLM
-from rag_core.pipeline import RAGPipeline
+from backend.state import DocumentState
+from backend.rag_service import answer_questions
+from retrieval.retrievers import build_retriever
+from retrieval.reranker import build_reranker
+from llm.llm_model import LLM_BACKENDS, build_llm
+from rag_core.pipeline import DEFAULT_THRESHOLD, RAGPipeline
 
 
 def main():
     parser = argparse.ArgumentParser(description="RAG CLI Interface")
-    parser.add_argument("--query", type=str, required=True, help="User query")
+    parser.add_argument("--query", type=str, default=None, help="User query")
     parser.add_argument("--k", type=int, default=3, help="Top-k retrieval")
+    parser.add_argument(
+        "--retriever", type=str, default=None, choices=["dense", "ivf", "float16", "int8"],
+        help="Retrieval engine (default: $RAG_RETRIEVER or dense)"
+    )
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF cells to probe")
+    parser.add_argument(
+        "--llm-backend", type=str, default=None, choices=sorted(LLM_BACKENDS),
+        help="LLM backend (default: $RAG_LLM_BACKEND or hf)"
+    )
+    parser.add_argument(
+        "--reranker", type=str, default=None,
+        help="Cross-encoder to re-rank candidates with, \"default\" or \"off\" (default: $RAG_RERANKER)"
+    )
+    parser.add_argument(
+        "--rerank-candidates", type=int, default=None,
+        help="Candidates retrieved per query for re-ranking"
+    )
+    parser.add_argument(
+        "--reindex", action="store_true",
+        help="Rebuild the persisted index from scratch"
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Print the answer token by token as it is generated"
+    )
+    parser.add_argument(
+        "--batch-input", type=str, default=None,
+        help="JSONL file of {\"question\": ...} lines to answer in bulk"
+    )
+    parser.add_argument(
+        "--batch-output", type=str, default="results.jsonl",
+        help="Where --batch-input results are written (JSONL)"
+    )
+    parser.add_argument("--batch-size", type=int, default=16, help="Prompts per generation batch")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="Minimum similarity for a chunk to be used as context"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Processes for reading + chunking during --reindex"
+    )
 
     args = parser.parse_args()
+    if not (args.query or args.reindex or args.batch_input):
+        parser.error("one of --query, --batch-input or --reindex is required")
 
-    # Load pipeline
-    docs = load_documents("data/documents")
-    chunks = process_documents(docs)
+    # Load pipeline (maps the persisted index, embeds only changed files)
+    state = DocumentState()
+    if args.reindex:
+        state.reload(workers=args.workers)
+        if not (args.query or args.batch_input):
+            print(f"Indexed {state.snapshot.chunk_count} chunks from {len(state.manifest)} documents")
+            return
 
-    embedding_model = EmbeddingModel()
-    chunk_embeddings = embed_texts(chunks, embedding_model)
-
-    llm = LLM()
+    llm = build_llm(args.llm_backend)
     pipeline = RAGPipeline(
-        embedding_model=embedding_model,
+        embedding_model=state.embedding_model,
         llm=llm,
-        retriever=retrieve_top_k
+        retriever=build_retriever(args.retriever, nprobe=args.nprobe),
+        reranker=build_reranker(args.reranker, args.rerank_candidates),
+        threshold=args.threshold
     )
 
+    if args.batch_input:
+        run_batch(args, pipeline, state)
+        return
+
+    snapshot = state.snapshot
     retrieved = pipeline.retrieve(
         args.query,
-        chunk_embeddings,
-        chunks,
-        args.k
+        snapshot.chunk_embeddings,
+        snapshot.chunks,
+        args.k,
+        snapshot=snapshot
     )
 
-    answer = pipeline.answer(args.query, retrieved)
-
-    print("\nAnswer:\n", answer)
+    if args.stream:
+        print("\nAnswer:\n", end=" ", flush=True)
+        for piece in pipeline.stream_answer(args.query, retrieved):
+            print(piece, end="", flush=True)
+        print()
+    else:
+        answer = pipeline.answer(args.query, retrieved)
+        print("\nAnswer:\n", answer)
     print("\nSources:")
-    for _, _, source in retrieved:
+    for _, _, source in pipeline.above_threshold(retrieved):
         print("-", source)
 
 
+def run_batch(args, pipeline, state):
+    with open(args.batch_input, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    snapshot = state.snapshot
+    start = time.time()
+    results = answer_questions(
+        [item["question"] for item in items],
+        args.k,
+        args.threshold,
+        pipeline,
+        snapshot.chunk_embeddings,
+        snapshot.chunks,
+        state.embedding_model,
+        batch_size=args.batch_size,
+        row_filter=snapshot.live,
+        snapshot=snapshot
+    )
+    elapsed = time.time() - start
+
+    with open(args.batch_output, "w", encoding="utf-8") as f:
+        for item, result in zip(items, results):
+            # Carry any extra input fields (ids, expected answers) through
+            f.write(json.dumps({**item, **result}) + "\n")
+
+    print(
+        f"Answered {len(results)} questions in {elapsed:.2f}s "
+        f"({len(results) / max(elapsed, 1e-9):.1f}/s) -> {args.batch_output}"
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def chunk_set_key(retrieved):
+    """
+    Order-independent key for a set of retrieved (score, text, source) chunks.
+    """
+    digest = hashlib.sha256()
+    for source, text in sorted((source, text) for _, text, source in retrieved):
+        digest.update(source.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Reuses generated answers for near-duplicate questions.
+
+    An answer is reused when a new query embedding lies within
+    `max_distance` cosine distance of a cached one AND the retrieved
+    chunk set is identical. Entries are keyed by index version too, so
+    requests still on an older snapshot (during an update, or across
+    workers) neither see newer answers nor evict them; entries of
+    superseded versions age out of the LRU.
+    """
+
+    def __init__(self, max_distance=0.05, maxsize=1024, per_key=8):
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        self.per_key = per_key
+
+        self._groups = OrderedDict()  # (chunk key, version) -> [(query_emb, answer)]
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, query_emb, chunk_key, version):
+        with self._lock:
+            key = (chunk_key, version)
+            group = self._groups.get(key)
+
+            if group:
+                cached = np.stack([emb for emb, _ in group])
+                sims = cached @ np.asarray(query_emb, dtype=np.float32)
+                best = int(np.argmax(sims))
+
+                if 1.0 - sims[best] <= self.max_distance:
+                    self._groups.move_to_end(key)
+                    self.hits += 1
+                    return group[best][1]
+
+            self.misses += 1
+            return None
+
+    def store(self, query_emb, chunk_key, answer, version):
+        with self._lock:
+            key = (chunk_key, version)
+            group = self._groups.setdefault(key, [])
+            group.append((np.asarray(query_emb, dtype=np.float32), answer))
+            self._size += 1
+
+            if len(group) > self.per_key:
+                group.pop(0)
+                self._size -= 1
+                self.evictions += 1
+            self._groups.move_to_end(key)
+
+            while self._size > self.maxsize:
+                _, dropped = self._groups.popitem(last=False)
+                self._size -= len(dropped)
+                self.evictions += len(dropped)
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+            self._size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "maxsize": self.maxsize,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
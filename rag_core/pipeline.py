@@ -1,13 +1,27 @@
 # rag_core/pipeline.py
 
-from llm.prompt import build_prompt
-from llm.inference import generate_answer
+import numpy as np
+
+from llm.context import ContextAssembler
+from retrieval.hybrid import hybrid_search
+from llm.inference import generate_answer, stream_answer
+from llm.llm_model import NO_ANSWER
+
+# Chunks scoring below this cosine similarity are never used as context
+DEFAULT_THRESHOLD = 0.3
 
 class RAGPipeline:
-    def __init__(self, embedding_model, llm, retriever):
+    def __init__(self, embedding_model, llm, retriever, query_cache=None, context=None,
+                 reranker=None, threshold=DEFAULT_THRESHOLD):
         self.embedding_model = embedding_model
         self.llm = llm
         self.retriever = retriever
+        self.query_cache = query_cache
+        self.threshold = threshold
+        # Optional retrieval.reranker.CrossEncoderReranker
+        self.reranker = reranker
+        # Prompt packing is measured in the LLM's own tokens
+        self.context = context or ContextAssembler(getattr(llm, "tokenizer", None))
         
     def rewrite_query(self, question: str) -> str:
         q = question.lower().strip()
@@ -20,12 +34,170 @@ class RAGPipeline:
             q = q.replace("tell me about", "explain")
 
         return q
+
+    def embed_query(self, query):
+        if self.query_cache is None:
+            return self.embedding_model(query)
+
+        key = (getattr(self.embedding_model, "model_name", None), query)
+        query_emb = self.query_cache.get(key)
+
+        if query_emb is None:
+            query_emb = self.embedding_model(query)
+            query_emb.setflags(write=False)  # shared between requests
+            self.query_cache.put(key, query_emb)
+
+        return query_emb
     
-    def retrieve(self, query, chunk_embeddings, chunks, k):
-        query_emb = self.embedding_model(query)
-        return self.retriever(query_emb, chunk_embeddings, chunks, k)
+    def embed_queries(self, queries):
+        """
+        Embeds many queries at once; cached ones skip the encoder and
+        the rest go through one batched forward pass.
+        """
+        if self.query_cache is None:
+            return self.embedding_model.encode_batch(queries)
+
+        model_name = getattr(self.embedding_model, "model_name", None)
+        cached = [self.query_cache.get((model_name, q)) for q in queries]
+        missing = [i for i, emb in enumerate(cached) if emb is None]
+
+        if missing:
+            fresh = self.embedding_model.encode_batch([queries[i] for i in missing])
+            for i, emb in zip(missing, fresh):
+                emb.setflags(write=False)
+                self.query_cache.put((model_name, queries[i]), emb)
+                cached[i] = emb
+
+        if not cached:
+            return np.empty((0, self.embedding_model.dim), dtype=np.float32)
+        return np.stack(cached)
+
+    def _retriever_options(self, row_filter, snapshot):
+        # row_filter (retrieval.filters.RowFilter) scopes the search to
+        # the rows of matching documents; snapshot (backend.state.
+        # IndexSnapshot) tells versioned retrievers which index version
+        # the embeddings are and which rows are live. Plain retriever
+        # functions take neither.
+        options = {}
+        if row_filter is not None:
+            options["row_filter"] = row_filter
+        if snapshot is not None:
+            options["snapshot"] = snapshot
+        return options
+
+    def search(self, query_emb, chunk_embeddings, chunks, k, row_filter=None, snapshot=None):
+        return self.retriever(
+            query_emb, chunk_embeddings, chunks, k, **self._retriever_options(row_filter, snapshot)
+        )
+
+    def search_hybrid(self, query, query_emb, chunk_embeddings, chunks, lexical, k,
+                      mode="hybrid", fusion="rrf", alpha=0.5, row_filter=None,
+                      snapshot=None):
+        if row_filter is None and snapshot is not None:
+            row_filter = snapshot.live  # leaves out removed rows
+
+        # The dense leg goes through the configured retriever
+        def dense_search(emb, shortlist, scope):
+            return self.search(emb, chunk_embeddings, chunks, shortlist, scope, snapshot)
+
+        return hybrid_search(
+            query, query_emb, chunk_embeddings, chunks, lexical, k,
+            mode=mode, fusion=fusion, alpha=alpha, row_filter=row_filter,
+            dense_search=dense_search
+        )
+
+    def search_batch(self, query_embs, chunk_embeddings, chunks, k, row_filter=None,
+                     snapshot=None):
+        # Retrievers with a batch path score every query in one matmul
+        batch = getattr(self.retriever, "batch", None)
+        if batch is not None:
+            return batch(
+                query_embs, chunk_embeddings, chunks, k,
+                **self._retriever_options(row_filter, snapshot)
+            )
+        return [
+            self.search(q, chunk_embeddings, chunks, k, row_filter, snapshot) for q in query_embs
+        ]
 
-    def answer(self, question, retrieved_chunks):
-        context = [text for _, text, _ in retrieved_chunks]
-        prompt = build_prompt(context, question)
+    def candidates(self, k):
+        """
+        How many hits to retrieve for a final top-k: the re-ranker
+        chooses k out of a wider candidate set.
+        """
+        if self.reranker is None:
+            return k
+        return max(k, self.reranker.candidates)
+
+    def rerank(self, query, retrieved, k):
+        if self.reranker is None:
+            return retrieved[:k]
+        return self.reranker.rerank(query, retrieved, k)
+
+    def rerank_batch(self, queries, retrieved_lists, k):
+        if self.reranker is None:
+            return [retrieved[:k] for retrieved in retrieved_lists]
+        return self.reranker.rerank_batch(queries, retrieved_lists, k)
+
+    def retrieve(self, query, chunk_embeddings, chunks, k, snapshot=None):
+        query_emb = self.embed_query(query)
+        retrieved = self.search(
+            query_emb, chunk_embeddings, chunks, self.candidates(k), snapshot=snapshot
+        )
+        return self.rerank(query, retrieved, k)
+
+    def above_threshold(self, retrieved, threshold=None):
+        threshold = self.threshold if threshold is None else threshold
+        return [hit for hit in retrieved if hit[0] >= threshold]
+
+    def assemble(self, question, retrieved_chunks, threshold=None):
+        """
+        Prompt plus packing details (see llm.context.ContextAssembler),
+        built from the chunks scoring at least `threshold` (default:
+        the pipeline's).
+        """
+        return self.context.assemble(question, self.above_threshold(retrieved_chunks, threshold))
+
+    def build_prompt(self, question, retrieved_chunks, threshold=None):
+        return self.assemble(question, retrieved_chunks, threshold)["prompt"]
+
+    def count_tokens(self, text):
+        return self.context.count(text)
+
+    def generate(self, prompt):
         return generate_answer(prompt, self.llm)
+
+    def generate_batch(self, prompts):
+        if hasattr(self.llm, "generate_batch"):
+            return self.llm.generate_batch(prompts)
+        return [generate_answer(p, self.llm) for p in prompts]
+
+    def stream(self, prompt):
+        return stream_answer(prompt, self.llm)
+
+    # Without a chunk above the threshold there is nothing to ground an
+    # answer in, so the LLM is not called
+    def answer(self, question, retrieved_chunks, threshold=None):
+        context = self.assemble(question, retrieved_chunks, threshold)
+        if not context["hits"]:
+            return NO_ANSWER
+        return self.generate(context["prompt"])
+
+    def answer_batch(self, questions, retrieved_lists, threshold=None):
+        contexts = [
+            self.assemble(question, retrieved, threshold)
+            for question, retrieved in zip(questions, retrieved_lists)
+        ]
+        answerable = [i for i, context in enumerate(contexts) if context["hits"]]
+
+        answers = [NO_ANSWER] * len(contexts)
+        if answerable:
+            generated = self.generate_batch([contexts[i]["prompt"] for i in answerable])
+            for i, answer in zip(answerable, generated):
+                answers[i] = answer
+        return answers
+
+    def stream_answer(self, question, retrieved_chunks, threshold=None):
+        context = self.assemble(question, retrieved_chunks, threshold)
+        if not context["hits"]:
+            return iter([NO_ANSWER])
+        return self.stream(context["prompt"])
@@ -0,0 +1,309 @@
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger("rag.telemetry")
+
+# Seconds; covers cache hits (sub-ms) up to slow CPU generations
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Prometheus-style cumulative histogram plus a sliding window of recent
+    observations for exact p50 / p95 / p99.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=2048):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def quantiles(self):
+        with self._lock:
+            recent = np.fromiter(self.recent, dtype=np.float64)
+        if recent.size == 0:
+            return {q: 0.0 for q in QUANTILES}
+        return dict(zip(QUANTILES, np.quantile(recent, QUANTILES).tolist()))
+
+
+class Registry:
+    """
+    Process-wide store of latency histograms, counters and gauges,
+    rendered in Prometheus text format by `render`.
+    """
+
+    def __init__(self):
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = Counter()  # (name, labels) -> value
+        self.gauge_sources = {}  # name -> callable returning {metric: value}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def observe(self, name, value, labels=None, help=""):
+        key = self._key(name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(key, Histogram())
+                self.help.setdefault(name, help)
+        hist.observe(value)
+
+    def inc(self, name, value=1, labels=None, help=""):
+        with self._lock:
+            self.counters[self._key(name, labels)] += value
+            self.help.setdefault(name, help)
+
+    def register_gauges(self, prefix, source):
+        """
+        `source()` returns a flat dict of numbers, exported as
+        `<prefix>_<key>` gauges at scrape time.
+        """
+        self.gauge_sources[prefix] = source
+
+    def snapshot(self):
+        """
+        Stage latency percentiles as plain JSON.
+        """
+        out = {}
+        for (name, labels), hist in list(self.histograms.items()):
+            q = hist.quantiles()
+            out.setdefault(name, {})[",".join(f"{k}={v}" for k, v in labels) or "all"] = {
+                "count": hist.count,
+                "p50": round(q[0.5], 6),
+                "p95": round(q[0.95], 6),
+                "p99": round(q[0.99], 6)
+            }
+        return out
+
+    def render(self):
+        lines = []
+
+        by_name = {}
+        for (name, labels), hist in list(self.histograms.items()):
+            by_name.setdefault(name, []).append((labels, hist))
+
+        for name, series in sorted(by_name.items()):
+            lines.append(f"# HELP {name} {self.help.get(name) or name}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                cumulative = 0
+                for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {hist.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+            # Recent-window quantiles as a companion gauge family
+            lines.append(f"# TYPE {name}_quantile gauge")
+            for labels, hist in series:
+                for q, value in hist.quantiles().items():
+                    lines.append(f"{name}_quantile{_labels(labels, quantile=q)} {value}")
+
+        counter_names = {}
+        for (name, labels), value in list(self.counters.items()):
+            counter_names.setdefault(name, []).append((labels, value))
+        for name, series in sorted(counter_names.items()):
+            lines.append(f"# HELP {name} {self.help.get(name) or name}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series:
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        for prefix, source in sorted(self.gauge_sources.items()):
+            try:
+                values = source() or {}
+            except Exception:
+                logger.exception("gauge source %s failed", prefix)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Trace:
+    """
+    Per-request stage timer on the monotonic clock.
+
+        trace = Trace("query")
+        with trace.span("embed"):
+            ...
+        trace.finish()  # -> {"embed": 0.012, ..., "total": 0.3}
+
+    Finished spans feed the `rag_stage_seconds` histograms. Handlers
+    call close() on the way out, so a request that never reached
+    finish() (an exception, a dropped stream) is still counted.
+    """
+
+    def __init__(self, endpoint="query", registry=None):
+        self.endpoint = endpoint
+        self.registry = registry or telemetry
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.outcome = None
+        self.profiler = SlowRequestProfiler.maybe_start()
+
+    @contextmanager
+    def span(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    @contextmanager
+    def paused(self):
+        """
+        Wraps each `yield` of a streaming handler. Its steps may run on
+        different executor threads: the profiler stops sampling while
+        the request is suspended and follows the thread that resumes it.
+        """
+        if self.profiler is not None:
+            self.profiler.detach()
+        try:
+            yield
+        finally:
+            if self.profiler is not None:
+                self.profiler.attach()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def finish(self, outcome="ok"):
+        total = self.elapsed()
+        self.outcome = outcome
+
+        for name, seconds in self.spans.items():
+            self.registry.observe(
+                "rag_stage_seconds", seconds,
+                {"endpoint": self.endpoint, "stage": name},
+                help="Per-stage latency of the query hot path"
+            )
+        self.registry.observe(
+            "rag_request_seconds", total, {"endpoint": self.endpoint},
+            help="End-to-end request latency"
+        )
+        self.registry.inc(
+            "rag_requests_total", labels={"endpoint": self.endpoint, "outcome": outcome},
+            help="Requests served"
+        )
+
+        if self.profiler is not None:
+            self.profiler.stop(total, self.endpoint)
+
+        return {name: round(s, 4) for name, s in self.spans.items()} | {"total": round(total, 4)}
+
+    def close(self, outcome="error"):
+        """
+        Finishes the trace as `outcome` unless finish() already ran.
+        """
+        if self.outcome is None:
+            self.finish(outcome)
+
+
+class SlowRequestProfiler:
+    """
+    Optional sampling profiler for slow requests.
+
+    Enabled by RAG_PROFILE_SLOW_MS. For a sampled fraction of requests
+    (RAG_PROFILE_SAMPLE_RATE, default 1.0) a helper thread snapshots the
+    request thread's stack every RAG_PROFILE_INTERVAL_MS; if the request
+    ends up slower than the threshold, the hottest stacks are logged.
+    The request thread is the one that created the profiler until
+    attach() / detach() move it (see Trace.paused).
+    """
+
+    @classmethod
+    def maybe_start(cls):
+        threshold_ms = os.getenv("RAG_PROFILE_SLOW_MS")
+        if not threshold_ms:
+            return None
+        if random.random() >= float(os.getenv("RAG_PROFILE_SAMPLE_RATE", "1.0")):
+            return None
+        return cls(
+            float(threshold_ms) / 1000,
+            float(os.getenv("RAG_PROFILE_INTERVAL_MS", "5")) / 1000
+        )
+
+    def __init__(self, threshold_sec, interval_sec):
+        self.threshold_sec = threshold_sec
+        self.interval_sec = interval_sec
+        self.samples = Counter()
+
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def attach(self):
+        self._target = threading.get_ident()
+
+    def detach(self):
+        self._target = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval_sec):
+            target = self._target
+            frame = sys._current_frames().get(target) if target is not None else None
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=12)
+            self.samples[tuple(f"{f.filename}:{f.lineno} {f.name}" for f in stack)] += 1
+
+    def stop(self, total_sec, endpoint):
+        self._stop.set()
+        self._thread.join()
+
+        if total_sec < self.threshold_sec or not self.samples:
+            return
+
+        lines = [f"slow {endpoint} request: {total_sec:.3f}s, {sum(self.samples.values())} samples"]
+        for stack, count in self.samples.most_common(3):
+            lines.append(f"  {count} samples:")
+            lines.extend(f"    {frame}" for frame in stack)
+        logger.warning("\n".join(lines))
+
+
+telemetry = Registry()
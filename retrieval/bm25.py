@@ -0,0 +1,414 @@
+import os
+import re
+import time
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+# Keeps identifiers and error codes whole: "err_conn_reset", "e1234", "v2.1-rc"
+TOKEN_RE = re.compile(r"\w+(?:[-.]\w+)*")
+
+# Each segment is saved as "bm25-<name>.<suffix>" files next to the
+# embeddings of its index generation: the terms, one per line, and
+# flat postings arrays
+TERMS_SUFFIX = "terms"
+SEGMENT_FILES = {
+    "offsets": ("offsets.i64", np.int64),
+    "rows": ("rows.i32", np.int32),
+    "tfs": ("tfs.i32", np.int32),
+    "doc_lens": ("lens.i32", np.int32)
+}
+# A new segment is merged into the one before it while that one spans
+# at most this many times its rows, which keeps O(log rows) segments
+MERGE_FACTOR = 2
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _in_ranges(ranges, rows):
+    # Which of `rows` fall in sorted, disjoint [start, stop) `ranges`
+    i = np.searchsorted(ranges[:, 0], rows, side="right") - 1
+    return (i >= 0) & (rows < ranges[np.maximum(i, 0), 1])
+
+
+# Postings of rows [start, stop). Term t (local id from `vocab`) occurs
+# in rows[offsets[t]:offsets[t + 1]] with the matching tfs; row ids are
+# global and doc_lens is indexed by row - start. Segments are never
+# modified; `name` is None until the segment is saved.
+_Segment = namedtuple(
+    "_Segment", ["name", "start", "stop", "vocab", "offsets", "rows", "tfs", "doc_lens"]
+)
+
+
+class _Tail:
+    """
+    Postings of rows being added, in growable arrays, until they are
+    sealed into a segment.
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.vocab = {}
+        self.postings = []  # term id -> (array rows, array tfs)
+        self.doc_lens = array("i")
+
+    def add(self, text):
+        row = self.start + len(self.doc_lens)
+        tokens = tokenize(text)
+
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+
+        for term, tf in counts.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                term_id = self.vocab[term] = len(self.postings)
+                self.postings.append((array("i"), array("i")))
+            rows, tfs = self.postings[term_id]
+            rows.append(row)
+            tfs.append(tf)
+
+        self.doc_lens.append(len(tokens))
+        return len(tokens)
+
+    def seal(self):
+        offsets = np.zeros(len(self.postings) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows, _ in self.postings], out=offsets[1:])
+
+        def flat(arrays):
+            if not arrays:
+                return np.empty(0, dtype=np.int32)
+            return np.concatenate([np.frombuffer(a, dtype=np.int32) for a in arrays])
+
+        return _Segment(
+            None, self.start, self.start + len(self.doc_lens), self.vocab, offsets,
+            flat([rows for rows, _ in self.postings]), flat([tfs for _, tfs in self.postings]),
+            np.frombuffer(self.doc_lens, dtype=np.int32)
+        )
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring.
+
+    Rows line up with the chunk rows of the embedding matrix and are
+    only ever appended. Postings live in immutable segments, one per
+    batch of added rows; a new segment is merged into the one before it
+    once they are about the same size, so there are O(log rows) of
+    them and a merge touches O(log rows) postings per row, amortized.
+
+    Removing rows only marks them dead. Scoring skips dead rows and
+    counts document frequencies and lengths over live rows only, so
+    scores equal those of an index built from the live rows alone;
+    DocumentState.compact renumbers the rows to drop them for good.
+
+    An index that queries may be using is never updated in place:
+    writers update a copy() and publish it whole. The copy shares every
+    segment, so it costs O(segments) and no postings are copied.
+
+    save() writes the segments not saved yet as flat arrays; load()
+    memory-maps them, so processes sharing an index share one copy and
+    nothing is re-tokenized on startup.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+
+        self.segments = ()
+        self.dead = np.empty((0, 2), dtype=np.intp)  # sorted [start, stop) ranges
+        self.n_rows = 0
+        self.n_dead = 0
+        self.total_len = 0    # tokens in live rows
+        self._tail = None
+
+    def __len__(self):
+        return self.n_rows
+
+    def copy(self):
+        self._seal()
+        other = BM25Index(self.k1, self.b)
+        other.segments = self.segments
+        other.dead = self.dead
+        other.n_rows, other.n_dead, other.total_len = self.n_rows, self.n_dead, self.total_len
+        return other
+
+    # ------------------------------
+    # Persistence
+    # ------------------------------
+    def save(self, path):
+        """
+        Writes the segments not saved yet to `path` and returns what
+        load() needs to map the index again.
+        """
+        self._seal()
+        self.segments = tuple(
+            seg if seg.name is not None else _save_segment(path, seg) for seg in self.segments
+        )
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "total_len": self.total_len,
+            "segments": [seg.name for seg in self.segments]
+        }
+
+    @classmethod
+    def load(cls, path, meta, dead=(), mapped=None):
+        """
+        Maps an index written by save(); `meta` is what save() returned
+        and `dead` the [start, stop) ranges of rows removed since.
+        Segments in `mapped` (name -> segment, e.g. from the index of an
+        earlier version) are reused instead of mapped again.
+
+        Returns None when a segment file is missing.
+        """
+        mapped = mapped or {}
+        try:
+            segments = tuple(
+                mapped[name] if name in mapped else _load_segment(path, name)
+                for name in meta["segments"]
+            )
+        except FileNotFoundError:
+            return None
+
+        index = cls(meta["k1"], meta["b"])
+        index.segments = segments
+        index.n_rows = segments[-1].stop if segments else 0
+        index.total_len = meta["total_len"]
+        if len(dead):
+            index.dead = np.array(sorted(dead), dtype=np.intp).reshape(-1, 2)
+            index.n_dead = int((index.dead[:, 1] - index.dead[:, 0]).sum())
+        return index
+
+    # ------------------------------
+    # Build / update
+    # ------------------------------
+    def add(self, chunks):
+        if self._tail is None:
+            self._tail = _Tail(self.n_rows)
+        for chunk in chunks:
+            self.total_len += self._tail.add(chunk["text"])
+            self.n_rows += 1
+
+    def remove_range(self, start, stop):
+        """
+        Marks rows [start, stop) dead. Other rows keep their ids, so
+        this touches no postings.
+        """
+        if stop <= start:
+            return
+        self._seal()
+        for seg in self.segments:
+            if seg.start < stop and start < seg.stop:
+                lens = seg.doc_lens[max(start, seg.start) - seg.start:min(stop, seg.stop) - seg.start]
+                self.total_len -= int(lens.sum())
+
+        dead = np.vstack([self.dead, [[start, stop]]])
+        self.dead = dead[np.argsort(dead[:, 0], kind="stable")]
+        self.n_dead += stop - start
+
+    def compacted(self, keep):
+        """
+        A new index of rows `keep` (sorted row ids) only, renumbered
+        0..len(keep) - 1 in order, as one segment.
+        """
+        self._seal()
+        new_ids = np.full(self.n_rows, -1, dtype=np.intp)
+        new_ids[keep] = np.arange(len(keep))
+
+        other = BM25Index(self.k1, self.b)
+        if self.segments:
+            other.segments = (self._merged(self.segments, new_ids),)
+        other.n_rows = len(keep)
+        other.total_len = self.total_len
+        return other
+
+    def _seal(self):
+        tail, self._tail = self._tail, None
+        if tail is None or len(tail.doc_lens) == 0:
+            return
+
+        segments = self.segments + (tail.seal(),)
+        while len(segments) > 1 and _span(segments[-2]) <= MERGE_FACTOR * _span(segments[-1]):
+            segments = segments[:-2] + (self._merged(segments[-2:]),)
+        self.segments = segments
+
+    def _merged(self, segments, new_ids=None):
+        """
+        One segment with the postings of consecutive `segments`, less
+        those of dead rows. With `new_ids` (old row -> new row, -1 to
+        drop), rows are renumbered and the segment covers all new rows.
+        """
+        vocab = {}
+        term_ids, rows, tfs = [], [], []
+        for seg in segments:
+            local = np.empty(len(seg.vocab), dtype=np.intp)
+            for term, term_id in seg.vocab.items():
+                local[term_id] = vocab.setdefault(term, len(vocab))
+            term_ids.append(np.repeat(local, np.diff(seg.offsets)))
+            rows.append(seg.rows)
+            tfs.append(seg.tfs)
+
+        term_ids = np.concatenate(term_ids)
+        rows = np.concatenate(rows).astype(np.intp)
+        tfs = np.concatenate(tfs)
+        doc_lens = np.concatenate([seg.doc_lens for seg in segments])
+        start, stop = segments[0].start, segments[-1].stop
+
+        if new_ids is not None:
+            keep = new_ids[rows] >= 0
+            rows = new_ids[rows]
+            doc_lens = doc_lens[new_ids[start:stop] >= 0]
+            start, stop = 0, len(doc_lens)
+        elif self.n_dead:
+            keep = ~_in_ranges(self.dead, rows)
+        else:
+            keep = slice(None)
+        term_ids, rows, tfs = term_ids[keep], rows[keep], tfs[keep]
+
+        # Grouped by term; rows stay in increasing order within a term
+        order = np.argsort(term_ids, kind="stable")
+        counts = np.bincount(term_ids, minlength=len(vocab))
+        used = counts > 0
+        terms = [term for term, u in zip(vocab, used) if u]
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts[used], out=offsets[1:])
+        return _Segment(
+            None, start, stop, {term: i for i, term in enumerate(terms)}, offsets,
+            rows[order].astype(np.int32), tfs[order].astype(np.int32),
+            np.ascontiguousarray(doc_lens, dtype=np.int32)
+        )
+
+    # ------------------------------
+    # Search
+    # ------------------------------
+    def _postings(self, term):
+        # (rows, tfs, doc lengths) of the live rows containing `term`
+        parts = []
+        for seg in self.segments:
+            term_id = seg.vocab.get(term)
+            if term_id is not None:
+                start, stop = seg.offsets[term_id], seg.offsets[term_id + 1]
+                rows = seg.rows[start:stop]
+                parts.append((rows, seg.tfs[start:stop], seg.doc_lens[rows - seg.start]))
+        if not parts:
+            return None
+
+        rows, tfs, lens = (np.concatenate(p) for p in zip(*parts))
+        if self.n_dead:
+            live = ~_in_ranges(self.dead, rows)
+            rows, tfs, lens = rows[live], tfs[live], lens[live]
+        return rows, tfs, lens
+
+    def score(self, query_text):
+        """
+        BM25 scores for every live row matching at least one query term.
+
+        Returns:
+            (rows, scores): int array of matching rows and their scores.
+        """
+        self._seal()
+        n = self.n_rows - self.n_dead
+        terms = set(tokenize(query_text))
+        if n == 0 or not terms:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        avg_len = self.total_len / n
+
+        all_rows, all_scores = [], []
+        for term in terms:
+            postings = self._postings(term)
+            if postings is None or len(postings[0]) == 0:
+                continue
+            rows, tfs, lens = postings
+            tfs = tfs.astype(np.float32)
+
+            df = len(rows)
+            idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lens / avg_len)
+
+            all_rows.append(rows)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        if not all_rows:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        # Sum per-term contributions without a dense corpus-sized array
+        rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        return rows.astype(np.intp), scores.astype(np.float32)
+
+    def search(self, query_text, k=10):
+        """
+        Top-k rows by BM25 score, best first.
+        """
+        rows, scores = self.score(query_text)
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+
+def _span(segment):
+    return segment.stop - segment.start
+
+
+# ------------------------------
+# Segment files
+# ------------------------------
+def _segment_path(path, name, suffix):
+    return os.path.join(path, f"bm25-{name}.{suffix}")
+
+
+def _save_segment(path, segment):
+    # Unique per segment; the row span is part of it so load can read it back
+    name = f"{segment.start}-{segment.stop}-{time.time_ns()}"
+
+    terms = [None] * len(segment.vocab)
+    for term, term_id in segment.vocab.items():
+        terms[term_id] = term
+    with open(_segment_path(path, name, TERMS_SUFFIX), "w", encoding="utf-8") as f:
+        f.write("\n".join(terms))
+
+    for field, (suffix, dtype) in SEGMENT_FILES.items():
+        with open(_segment_path(path, name, suffix), "wb") as f:
+            f.write(np.ascontiguousarray(getattr(segment, field), dtype=dtype).tobytes())
+    return segment._replace(name=name)
+
+
+def _load_segment(path, name):
+    start, stop = (int(x) for x in name.split("-")[:2])
+    with open(_segment_path(path, name, TERMS_SUFFIX), "r", encoding="utf-8") as f:
+        text = f.read()
+    terms = text.split("\n") if text else []
+
+    arrays = {}
+    for field, (suffix, dtype) in SEGMENT_FILES.items():
+        file_path = _segment_path(path, name, suffix)
+        if os.path.getsize(file_path) == 0:
+            arrays[field] = np.empty(0, dtype=dtype)
+        else:
+            arrays[field] = np.memmap(file_path, dtype=dtype, mode="r")
+
+    return _Segment(
+        name, start, stop, {term: i for i, term in enumerate(terms)}, **arrays
+    )
+
+
+def remove_segments(path, names):
+    """
+    Deletes saved segments that no published version uses any more.
+    """
+    for name in names:
+        for suffix in [TERMS_SUFFIX] + [s for s, _ in SEGMENT_FILES.values()]:
+            try:
+                os.remove(_segment_path(path, name, suffix))
+            except FileNotFoundError:
+                pass
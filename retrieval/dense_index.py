@@ -0,0 +1,83 @@
+from collections import namedtuple
+
+import numpy as np
+
+from retrieval.similarity import Hit, as_matrix, top_k_indices
+from retrieval.versioned import VersionedIndex
+
+_Matrix = namedtuple("_Matrix", ["version", "source", "matrix", "chunks"])
+
+
+class DenseIndex(VersionedIndex):
+    """
+    Exact retrieval engine over one contiguous float32 embedding matrix.
+
+    Can be used directly (search / search_batch) or passed to
+    RAGPipeline as a drop-in `retriever`. Building only views the
+    matrix, so a new index version costs no copy.
+    """
+
+    def __init__(self, chunk_embeddings=None, chunks=None):
+        super().__init__()
+
+        if chunk_embeddings is not None:
+            self.build(chunk_embeddings, chunks)
+
+    @property
+    def matrix(self):
+        return self._built.matrix
+
+    @property
+    def chunks(self):
+        return self._built.chunks
+
+    def build(self, chunk_embeddings, chunks):
+        self._built = self._make(chunk_embeddings, chunks)
+
+    def _make(self, chunk_embeddings, chunks, version=None):
+        matrix = as_matrix(chunk_embeddings)
+        if matrix.shape[0] != len(chunks):
+            raise ValueError(
+                f"{matrix.shape[0]} embeddings for {len(chunks)} chunks"
+            )
+        return _Matrix(version, chunk_embeddings, matrix, chunks)
+
+    def _empty(self):
+        return _Matrix(None, None, np.empty((0, 0), dtype=np.float32), [])
+
+    def _rebuild(self, current, chunk_embeddings, chunks, snapshot):
+        return self._make(chunk_embeddings, chunks, snapshot.version if snapshot else None)
+
+    # ------------------------------
+    # Search
+    # ------------------------------
+    def _search(self, built, query_embedding, k=3, row_filter=None):
+        if not built.chunks:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if row_filter is not None:
+            # Only the filtered rows are scored
+            scores = row_filter.score(built.matrix, query)
+            rows = row_filter.rows()
+            return [Hit(scores[i], built.chunks, rows[i]) for i in top_k_indices(scores, k)]
+
+        scores = built.matrix @ query
+        return [Hit(scores[i], built.chunks, i) for i in top_k_indices(scores, k)]
+
+    def _search_batch(self, built, query_embeddings, k=3, row_filter=None):
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if not built.chunks:
+            return [[] for _ in range(queries.shape[0])]
+
+        if row_filter is not None:
+            scores = row_filter.score(built.matrix, queries)
+            rows = row_filter.rows()
+        else:
+            scores = queries @ built.matrix.T
+            rows = None
+
+        return [
+            [Hit(s[i], built.chunks, i if rows is None else rows[i]) for i in top]
+            for s, top in zip(scores, top_k_indices(scores, k))
+        ]
@@ -0,0 +1,137 @@
+import fnmatch
+
+import numpy as np
+
+
+class RowFilter:
+    """
+    Index rows selected by a metadata filter.
+
+    Documents occupy contiguous row ranges (see DocumentState.manifest),
+    so a filter is stored as sorted, disjoint [start, stop) ranges.
+    Scoring walks the ranges as matrix slices, costing O(selected rows),
+    unless they cover most rows; `mask` gives an O(1) membership bitmap
+    for arbitrary candidate rows.
+    """
+
+    def __init__(self, ranges, n_rows):
+        merged = []
+        for start, stop in sorted((int(a), int(b)) for a, b in ranges if b > a):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+
+        self.ranges = np.array(merged, dtype=np.intp).reshape(-1, 2)
+        self.n_rows = int(n_rows)
+        self._rows = None
+        self._mask = None
+
+    def __len__(self):
+        return int((self.ranges[:, 1] - self.ranges[:, 0]).sum())
+
+    def rows(self):
+        if self._rows is None:
+            self._rows = np.concatenate(
+                [np.arange(a, b) for a, b in self.ranges]
+            ) if len(self.ranges) else np.empty(0, dtype=np.intp)
+        return self._rows
+
+    def mask(self):
+        if self._mask is None:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            for a, b in self.ranges:
+                mask[a:b] = True
+            self._mask = mask
+        return self._mask
+
+    def contains(self, rows):
+        """
+        Bool array: which of `rows` pass the filter. Binary search over
+        the ranges, so it never touches a corpus-sized array.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        if len(self.ranges) == 0:
+            return np.zeros(len(rows), dtype=bool)
+        i = np.searchsorted(self.ranges[:, 0], rows, side="right") - 1
+        return (i >= 0) & (rows < self.ranges[np.maximum(i, 0), 1])
+
+    def score(self, matrix, queries):
+        """
+        Scores of one query (dim,) or a batch (q, dim) against the
+        selected rows only, in the order of `rows()`.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self.ranges) == 0:
+            return np.empty(queries.shape[:-1] + (0,), dtype=np.float32)
+        if 2 * len(self) > self.n_rows:
+            # e.g. every live row: one product beats one per document
+            return (queries @ np.asarray(matrix[:self.n_rows]).T)[..., self.rows()]
+        return np.concatenate(
+            [queries @ np.asarray(matrix[a:b]).T for a, b in self.ranges], axis=-1
+        )
+
+
+def live_filter(dead, n_rows):
+    """
+    RowFilter of the rows in [0, n_rows) outside the `dead` [start,
+    stop) ranges, or None when there are none.
+    """
+    if not len(dead):
+        return None
+    bounds = [0] + [int(x) for start_stop in sorted(map(tuple, dead)) for x in start_stop] + [n_rows]
+    return RowFilter(zip(bounds[::2], bounds[1::2]), n_rows)
+
+
+def dead_ranges(live, n_rows):
+    """
+    The [start, stop) ranges of [0, n_rows) that `live` (a live_filter
+    or None) leaves out.
+    """
+    if live is None:
+        return []
+    bounds = [0] + live.ranges.ravel().tolist() + [n_rows]
+    return [(a, b) for a, b in zip(bounds[::2], bounds[1::2]) if b > a]
+
+
+def matching_sources(manifest, sources=None, globs=None, uploaded_after=None,
+                     uploaded_before=None, tags=None):
+    """
+    Sources in `manifest` that pass every given condition.
+
+    sources / globs: named files or fnmatch patterns (either matches)
+    uploaded_*:      bounds on the upload time (unix seconds)
+    tags:            at least one of these tags
+    """
+    matched = []
+    for source, entry in manifest.items():
+        if sources is not None or globs is not None:
+            named = sources is not None and source in sources
+            globbed = globs is not None and any(fnmatch.fnmatch(source, g) for g in globs)
+            if not (named or globbed):
+                continue
+
+        uploaded = entry.get("uploaded")
+        if uploaded_after is not None and (uploaded is None or uploaded < uploaded_after):
+            continue
+        if uploaded_before is not None and (uploaded is None or uploaded >= uploaded_before):
+            continue
+
+        if tags is not None and not set(tags) & set(entry.get("tags", [])):
+            continue
+
+        matched.append(source)
+    return matched
+
+
+def build_row_filter(manifest, n_rows, filters):
+    """
+    RowFilter for a filter dict (keys as in matching_sources), or None
+    when no condition is set.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    if not filters:
+        return None
+
+    sources = matching_sources(manifest, **filters)
+    return RowFilter([manifest[s]["rows"] for s in sources], n_rows)
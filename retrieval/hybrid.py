@@ -0,0 +1,109 @@
+import numpy as np
+
+from retrieval.similarity import Hit, as_matrix, top_k_indices
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses ranked row lists: score(row) = sum over lists of 1 / (k + rank).
+
+    Returns:
+        dict: row -> fused score.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def hybrid_search(
+    query_text,
+    query_emb,
+    chunk_embeddings,
+    chunks,
+    lexical,
+    k=3,
+    mode="hybrid",
+    fusion="rrf",
+    alpha=0.5,
+    shortlist=100,
+    prefilter=True,
+    row_filter=None,
+    dense_search=None
+):
+    """
+    Lexical (BM25) + dense retrieval.
+
+    mode:
+        "bm25"   rank by BM25 only
+        "hybrid" fuse BM25 and dense rankings
+    fusion:
+        "rrf"      reciprocal rank fusion
+        "weighted" alpha * cosine + (1 - alpha) * max-normalized BM25
+
+    With `prefilter`, dense scoring only runs on the BM25 shortlist, so
+    hybrid queries cost O(shortlist) instead of O(corpus). Queries with
+    no lexical match fall back to dense search: `dense_search(query_emb,
+    k, row_filter)` when given (RAGPipeline passes its retriever, so an
+    IVF or quantized index is used), else a full scan.
+
+    Returned scores are always cosine similarities, so the answer
+    threshold means the same thing in every mode. With `row_filter`,
+    both rankings only consider the filtered rows.
+    """
+    matrix = as_matrix(chunk_embeddings)
+    query = np.asarray(query_emb, dtype=np.float32)
+
+    if row_filter is None:
+        lex_rows, lex_scores = lexical.search(query_text, shortlist)
+    else:
+        lex_rows, lex_scores = lexical.score(query_text)
+        keep = row_filter.contains(lex_rows)
+        lex_rows, lex_scores = lex_rows[keep], lex_scores[keep]
+        top = top_k_indices(lex_scores, shortlist)
+        lex_rows, lex_scores = lex_rows[top], lex_scores[top]
+
+    if mode == "bm25":
+        rows = lex_rows[:k]
+    else:
+        if prefilter and len(lex_rows):
+            candidates = lex_rows
+            dense_scores = matrix[candidates] @ query
+        elif dense_search is not None:
+            top = np.array([hit.row for hit in dense_search(query, shortlist, row_filter)],
+                           dtype=np.intp)
+            candidates = np.union1d(top, lex_rows)
+            dense_scores = matrix[candidates] @ query
+        elif row_filter is not None:
+            scoped = row_filter.rows()
+            dense_scoped = row_filter.score(matrix, query)
+            top = scoped[top_k_indices(dense_scoped, shortlist)]
+            candidates = np.union1d(top, lex_rows)
+            dense_scores = matrix[candidates] @ query
+        else:
+            dense_all = matrix @ query
+            top = top_k_indices(dense_all, shortlist)
+            candidates = np.union1d(top, lex_rows)
+            dense_scores = dense_all[candidates]
+
+        if fusion == "weighted":
+            lex_by_row = dict(zip(lex_rows.tolist(), lex_scores.tolist()))
+            max_lex = float(lex_scores[0]) if len(lex_scores) else 1.0
+            lex_part = np.array(
+                [lex_by_row.get(int(r), 0.0) / max_lex for r in candidates],
+                dtype=np.float32
+            )
+            combined = alpha * dense_scores + (1 - alpha) * lex_part
+        else:
+            dense_rank = candidates[np.argsort(-dense_scores, kind="stable")]
+            fused = reciprocal_rank_fusion([lex_rows, dense_rank])
+            combined = np.array([fused.get(int(r), 0.0) for r in candidates])
+
+        rows = candidates[top_k_indices(combined, k)]
+
+    if len(rows) == 0:
+        return []
+
+    cosine = matrix[rows] @ query
+    return [Hit(score, chunks, row) for score, row in zip(cosine, rows)]
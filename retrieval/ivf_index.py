@@ -0,0 +1,272 @@
+from collections import namedtuple
+
+import numpy as np
+
+from retrieval.similarity import Hit, as_matrix, top_k_indices
+from retrieval.versioned import VersionedIndex, row_origins
+
+
+def spherical_kmeans(x, n_clusters, n_iter=10, seed=0, batch_size=65536):
+    """
+    k-means on unit vectors using cosine similarity.
+
+    Returns:
+        np.ndarray: (n_clusters, dim) normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, min(n_clusters, x.shape[0]))
+    centroids = x[rng.choice(x.shape[0], n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = assign_lists(x, centroids, batch_size)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=n_clusters)
+
+        # Re-seed empty clusters from random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = x[rng.choice(x.shape[0], len(empty))]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    return centroids
+
+
+def assign_lists(x, centroids, batch_size=65536):
+    """
+    Nearest centroid per row, computed in batches to bound memory.
+    """
+    assign = np.empty(x.shape[0], dtype=np.intp)
+    for start in range(0, x.shape[0], batch_size):
+        block = x[start:start + batch_size]
+        assign[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _grouped(assign, n_lists, rows=None):
+    """
+    Row ids per list for a row -> list assignment, in row order.
+    """
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(n_lists + 1))
+    if rows is not None:
+        order = rows[order]
+    return [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+
+
+_Cells = namedtuple(
+    "_Cells", ["version", "source", "matrix", "chunks", "centroids", "lists", "trained_on"]
+)
+
+
+class IVFIndex(VersionedIndex):
+    """
+    Inverted-file approximate nearest neighbour index.
+
+    Vectors are grouped into `nlist` k-means cells. A query only scores
+    the rows in its `nprobe` closest cells, trading recall for latency:
+    nprobe == nlist is exact search.
+
+    Has the same search / retriever API as DenseIndex, so it can be
+    passed to RAGPipeline as `retriever`. Index updates that come with a
+    delta (see backend.state.IndexSnapshot) only assign the new rows to
+    their cells; the cells are retrained once the corpus has halved or
+    doubled since training.
+
+    Deltas only apply forward. A request still holding a snapshot older
+    than the two versions kept is answered by an exact scan of its rows
+    instead: O(rows * dim) for that one request, with no training, no
+    reassignment and no lock.
+    """
+
+    def __init__(self, nlist=None, nprobe=8, n_iter=10, train_size=256, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.train_size = train_size  # training points per list
+        self.seed = seed
+        super().__init__()
+
+    @property
+    def matrix(self):
+        return self._built.matrix
+
+    @property
+    def chunks(self):
+        return self._built.chunks
+
+    @property
+    def centroids(self):
+        return self._built.centroids
+
+    @property
+    def lists(self):
+        return self._built.lists
+
+    # ------------------------------
+    # Build / update
+    # ------------------------------
+    def build(self, chunk_embeddings, chunks):
+        self._built = self._trained(None, chunk_embeddings, as_matrix(chunk_embeddings), chunks)
+
+    def train(self):
+        built = self._built
+        self._built = self._trained(built.version, built.source, built.matrix, built.chunks)
+
+    def _trained(self, version, source, matrix, chunks):
+        n = matrix.shape[0]
+        if n == 0:
+            return _Cells(version, source, matrix, chunks, None, [], 0)
+
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(n, nlist * self.train_size)
+        sample = matrix[np.sort(rng.choice(n, sample_size, replace=False))]
+
+        centroids = spherical_kmeans(sample, nlist, self.n_iter, self.seed)
+        lists = _grouped(assign_lists(matrix, centroids), len(centroids))
+        return _Cells(version, source, matrix, chunks, centroids, lists, n)
+
+    def _needs_training(self, built):
+        n = built.matrix.shape[0]
+        return (
+            built.centroids is None
+            or built.centroids.shape[1] != built.matrix.shape[1]
+            or not (built.trained_on / 2 <= n <= built.trained_on * 2)
+        )
+
+    def _extended(self, built, new_rows):
+        """
+        `built` with rows `new_rows` of its matrix added to their cells,
+        or retrained when the corpus size left the trained range.
+        """
+        if self._needs_training(built):
+            return self._trained(built.version, built.source, built.matrix, built.chunks)
+        if len(new_rows) == 0:
+            return built
+
+        added = _grouped(
+            assign_lists(built.matrix[new_rows], built.centroids), len(built.centroids), new_rows
+        )
+        lists = [
+            np.concatenate([lst, extra]) if len(extra) else lst
+            for lst, extra in zip(built.lists, added)
+        ]
+        return built._replace(lists=lists)
+
+    def add(self, embeddings, chunks):
+        built = self._built
+        embeddings = as_matrix(embeddings)
+        start = built.matrix.shape[0]
+
+        matrix = embeddings if start == 0 else np.concatenate([built.matrix, embeddings])
+        built = built._replace(source=None, matrix=matrix, chunks=built.chunks + list(chunks))
+        self._built = self._extended(built, np.arange(start, matrix.shape[0]))
+
+    def remove(self, rows):
+        built = self._built
+        keep = np.ones(built.matrix.shape[0], dtype=bool)
+        keep[np.asarray(rows, dtype=np.intp)] = False
+
+        # Old row id -> new row id after compaction
+        new_ids = np.cumsum(keep) - 1
+        lists = [new_ids[lst[keep[lst]]] for lst in built.lists]
+
+        self._built = self._extended(built._replace(
+            source=None,
+            matrix=built.matrix[keep],
+            chunks=[c for c, k in zip(built.chunks, keep) if k],
+            lists=lists
+        ), np.empty(0, dtype=np.intp))
+
+    def _rebuild(self, current, chunk_embeddings, chunks, snapshot):
+        version = snapshot.version if snapshot is not None else None
+        built = current._replace(
+            version=version, source=chunk_embeddings,
+            matrix=as_matrix(chunk_embeddings), chunks=chunks
+        )
+
+        delta = snapshot.delta if snapshot is not None else None
+        if delta is not None and delta[0] == current.version and current.centroids is not None:
+            # Carry the cells over: surviving rows keep theirs, new
+            # rows are assigned to the nearest centroid
+            origins = row_origins(current.matrix.shape[0], delta[1])
+            new_ids = np.full(current.matrix.shape[0], -1, dtype=np.intp)
+            kept = np.flatnonzero(origins >= 0)
+            new_ids[origins[kept]] = kept
+
+            lists = [new_ids[lst] for lst in current.lists]
+            built = built._replace(lists=[lst[lst >= 0] for lst in lists])
+            return self._extended(built, np.flatnonzero(origins < 0))
+
+        # No delta from the version we hold: keep the trained cells when
+        # the corpus size is still in range and reassign every row
+        if self._needs_training(built):
+            return self._trained(version, chunk_embeddings, built.matrix, chunks)
+        lists = _grouped(assign_lists(built.matrix, built.centroids), len(built.centroids))
+        return built._replace(lists=lists)
+
+    def _empty(self):
+        return _Cells(None, None, np.empty((0, 0), dtype=np.float32), [], None, [], 0)
+
+    def _stale(self, current, chunk_embeddings, chunks, snapshot):
+        # No cells: _search scans every row
+        return _Cells(
+            snapshot.version, chunk_embeddings, as_matrix(chunk_embeddings), chunks, None, [], 0
+        )
+
+    # ------------------------------
+    # Search
+    # ------------------------------
+    def _candidates(self, built, query, nprobe):
+        probe = top_k_indices(built.centroids @ query, nprobe)
+        return np.concatenate([built.lists[i] for i in probe])
+
+    # Same positional order as VersionedIndex.search; nprobe by keyword only
+    def search(self, query_embedding, k=3, row_filter=None, *, nprobe=None):
+        return self._search(self._built, query_embedding, k, row_filter, nprobe)
+
+    def search_batch(self, query_embeddings, k=3, row_filter=None, *, nprobe=None):
+        return self._search_batch(self._built, query_embeddings, k, row_filter, nprobe)
+
+    def _scan(self, built, query, k, row_filter):
+        # Exact scores for every row in scope
+        if row_filter is not None:
+            scores = row_filter.score(built.matrix, query)
+            rows = row_filter.rows()
+            return [Hit(scores[i], built.chunks, rows[i]) for i in top_k_indices(scores, k)]
+        scores = built.matrix @ query
+        return [Hit(scores[i], built.chunks, i) for i in top_k_indices(scores, k)]
+
+    def _search(self, built, query_embedding, k=3, row_filter=None, nprobe=None):
+        if not built.chunks:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        nprobe = nprobe or self.nprobe
+
+        if built.centroids is None:
+            return self._scan(built, query, k, row_filter)
+
+        if row_filter is not None:
+            # Scopes smaller than what the probed cells would hold are
+            # cheaper (and exact) to scan directly
+            if len(row_filter) <= nprobe * built.matrix.shape[0] / max(1, len(built.lists)):
+                return self._scan(built, query, k, row_filter)
+
+            rows = self._candidates(built, query, nprobe)
+            rows = rows[row_filter.mask()[rows]]
+        else:
+            rows = self._candidates(built, query, nprobe)
+
+        scores = built.matrix[rows] @ query
+        return [Hit(scores[i], built.chunks, rows[i]) for i in top_k_indices(scores, k)]
+
+    def _search_batch(self, built, query_embeddings, k=3, row_filter=None, nprobe=None):
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        return [self._search(built, q, k, row_filter, nprobe) for q in queries]
@@ -0,0 +1,142 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from embeddings.index_store import load_codes
+from embeddings.quantization import quantize_blocks, score_blocks
+from retrieval.similarity import Hit, as_matrix, top_k_indices
+from retrieval.versioned import VersionedIndex
+
+_Codes = namedtuple("_Codes", ["version", "source", "full", "codes", "scales", "chunks"])
+
+
+class QuantizedIndex(VersionedIndex):
+    """
+    Two-stage retrieval over compressed embeddings.
+
+    Every row is scored against a float16 or int8 (per-vector scale)
+    copy held in memory; the best `k * rescore` candidates are then
+    rescored exactly against the float32 rows. When those come from the
+    memory-mapped index, only the candidate rows are paged in, so the
+    resident cost per chunk drops from 4 bytes/dim to 2 (float16) or
+    ~1 (int8).
+
+    Codes for a memory-mapped index are persisted next to it and
+    reused on restart.
+    """
+
+    def __init__(self, kind="int8", rescore=4):
+        self.kind = kind
+        self.rescore = rescore
+        super().__init__()
+
+    @property
+    def full(self):
+        return self._built.full
+
+    @property
+    def codes(self):
+        return self._built.codes
+
+    @property
+    def scales(self):
+        return self._built.scales
+
+    @property
+    def chunks(self):
+        return self._built.chunks
+
+    def memory_bytes(self):
+        """
+        Resident bytes of the first-stage representation.
+        """
+        built = self._built
+        if built.codes is None:
+            return 0
+        return built.codes.nbytes + (built.scales.nbytes if built.scales is not None else 0)
+
+    # ------------------------------
+    # Build
+    # ------------------------------
+    def build(self, chunk_embeddings, chunks):
+        self._built = self._make(chunk_embeddings, chunks)
+
+    def _make(self, chunk_embeddings, chunks, version=None):
+        # A memmap stays a memmap: rescoring reads rows from disk
+        full = chunk_embeddings if isinstance(chunk_embeddings, np.memmap) \
+            else as_matrix(chunk_embeddings)
+
+        if full.shape[0] != len(chunks):
+            raise ValueError(
+                f"{full.shape[0]} embeddings for {len(chunks)} chunks"
+            )
+
+        index_dir = None
+        if isinstance(chunk_embeddings, np.memmap) and chunk_embeddings.filename:
+            index_dir = os.path.dirname(chunk_embeddings.filename)
+
+        stored = None
+        if index_dir is not None:
+            stored = load_codes(index_dir, self.kind, *full.shape)
+
+        # Codes are written with each index version (backend.state);
+        # other matrices, or another kind, are quantized in memory
+        if stored is None:
+            stored = quantize_blocks(full, self.kind)
+
+        return _Codes(version, chunk_embeddings, full, *stored, chunks)
+
+    def _empty(self):
+        return _Codes(None, None, np.empty((0, 0), dtype=np.float32), None, None, [])
+
+    def _rebuild(self, current, chunk_embeddings, chunks, snapshot):
+        return self._make(chunk_embeddings, chunks, snapshot.version if snapshot else None)
+
+    # ------------------------------
+    # Search
+    # ------------------------------
+    def _approx(self, built, queries, row_filter):
+        if row_filter is None:
+            return score_blocks(built.codes, built.scales, queries), None
+
+        if 2 * len(row_filter) > row_filter.n_rows:
+            # Mostly in scope (e.g. every live row): score all of it
+            approx = score_blocks(built.codes, built.scales, queries)
+            return approx[..., row_filter.rows()], row_filter.rows()
+
+        # Only the filtered row ranges are scored
+        parts = [
+            score_blocks(
+                built.codes[a:b], built.scales[a:b] if built.scales is not None else None, queries
+            )
+            for a, b in row_filter.ranges
+        ]
+        if not parts:
+            return np.empty(np.shape(queries)[:-1] + (0,), dtype=np.float32), row_filter.rows()
+        return np.concatenate(parts, axis=-1), row_filter.rows()
+
+    def _rescore(self, built, approx, query, k, rows=None):
+        candidates = top_k_indices(approx, k * max(1, self.rescore))
+        if rows is not None:
+            candidates = rows[candidates]
+        rows = np.sort(candidates)  # sequential reads from the memmap
+
+        exact = np.asarray(built.full[rows], dtype=np.float32) @ query
+        return [Hit(exact[i], built.chunks, rows[i]) for i in top_k_indices(exact, k)]
+
+    def _search(self, built, query_embedding, k=3, row_filter=None):
+        if not built.chunks:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        approx, rows = self._approx(built, query, row_filter)
+        return self._rescore(built, approx, query, k, rows)
+
+    def _search_batch(self, built, query_embeddings, k=3, row_filter=None):
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if not built.chunks:
+            return [[] for _ in range(queries.shape[0])]
+
+        approx, rows = self._approx(built, queries, row_filter)
+        return [self._rescore(built, a, q, k, rows) for a, q in zip(approx, queries)]
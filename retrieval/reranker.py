@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+
+from rag_core.cache import LRUCache
+from retrieval.similarity import Hit
+
+DEFAULT_RERANKER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Bi-encoder candidates handed to the cross-encoder per query
+RERANK_CANDIDATES = 50
+
+
+class CrossEncoderReranker:
+    """
+    Re-orders retrieved chunks by a cross-encoder's query-chunk score.
+
+    The retriever returns a wide candidate set (`candidates`); every
+    (query, chunk) pair not already cached is scored in one batched
+    predict call and the best k are kept. Hits keep their bi-encoder
+    score, which the similarity threshold is calibrated for; the
+    cross-encoder score is attached as `rerank_score`.
+
+    Scores are cached per (query, source, chunk text), so they survive
+    reindexing as long as the chunk itself is unchanged.
+    """
+
+    def __init__(self, model_name=DEFAULT_RERANKER, candidates=RERANK_CANDIDATES,
+                 batch_size=64, cache_size=65536):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name)
+        self.cache = LRUCache(maxsize=cache_size)
+
+    def score(self, pairs):
+        """
+        Cross-encoder scores for (query, hit) pairs; uncached pairs go
+        through the model together.
+        """
+        keys = [(query, hit[2], hit[1]) for query, hit in pairs]
+        scores = np.array([self.cache.get(key, np.nan) for key in keys], dtype=np.float32)
+        missing = np.flatnonzero(np.isnan(scores))
+
+        if len(missing):
+            # Similar lengths in one batch keep padding low
+            missing = missing[np.argsort([len(keys[i][2]) for i in missing], kind="stable")]
+            fresh = self.model.predict(
+                [(keys[i][0], keys[i][2]) for i in missing],
+                batch_size=self.batch_size
+            )
+            for i, s in zip(missing, np.asarray(fresh, dtype=np.float32).reshape(-1)):
+                scores[i] = s
+                self.cache.put(keys[i], float(s))
+
+        return scores
+
+    def rerank(self, query, hits, k):
+        return self.rerank_batch([query], [hits], k)[0]
+
+    def rerank_batch(self, queries, hit_lists, k):
+        pairs = [(q, hit) for q, hits in zip(queries, hit_lists) for hit in hits]
+        scores = self.score(pairs) if pairs else np.empty(0, dtype=np.float32)
+
+        reranked, offset = [], 0
+        for hits in hit_lists:
+            own = scores[offset:offset + len(hits)]
+            offset += len(hits)
+
+            order = np.argsort(-own, kind="stable")[:k]
+            kept = []
+            for i in order:
+                hit = hits[i]
+                if isinstance(hit, Hit):
+                    hit.rerank_score = float(own[i])
+                kept.append(hit)
+            reranked.append(kept)
+        return reranked
+
+    def stats(self):
+        return self.cache.stats()
+
+
+def build_reranker(name=None, candidates=None):
+    """
+    The cross-encoder named by `name` (or $RAG_RERANKER), or None when
+    re-ranking is off. "default" picks DEFAULT_RERANKER.
+    """
+    name = name or os.getenv("RAG_RERANKER")
+    if not name or name == "off":
+        return None
+
+    return CrossEncoderReranker(
+        DEFAULT_RERANKER if name == "default" else name,
+        candidates=candidates or int(os.getenv("RAG_RERANK_CANDIDATES", str(RERANK_CANDIDATES)))
+    )
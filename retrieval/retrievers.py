@@ -0,0 +1,35 @@
+import os
+
+from retrieval.dense_index import DenseIndex
+from retrieval.ivf_index import IVFIndex
+from retrieval.quantized_index import QuantizedIndex
+
+
+def build_retriever(name=None, nprobe=None, nlist=None, rescore=None):
+    """
+    Creates the retriever named by `name` (or $RAG_RETRIEVER).
+
+    "dense":   exact search over the full embedding matrix.
+    "ivf":     approximate IVF search; nprobe / nlist tune recall vs latency.
+    "float16" / "int8":
+               score compressed embeddings, then rescore the top
+               k * rescore candidates in float32.
+    """
+    name = name or os.getenv("RAG_RETRIEVER", "dense")
+
+    if name == "dense":
+        return DenseIndex()
+    if name == "ivf":
+        nlist = nlist or os.getenv("RAG_IVF_NLIST")
+        return IVFIndex(
+            nlist=int(nlist) if nlist else None,
+            nprobe=nprobe or int(os.getenv("RAG_IVF_NPROBE", "8"))
+        )
+
+    if name in ("float16", "int8"):
+        return QuantizedIndex(
+            kind=name,
+            rescore=rescore or int(os.getenv("RAG_RESCORE", "4"))
+        )
+
+    raise ValueError(f"Unknown retriever: {name}")
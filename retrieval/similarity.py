@@ -3,17 +3,77 @@ def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
+class Hit(tuple):
+    """
+    A (score, text, source) retrieval result that also remembers the
+    chunk's row in the index, so later stages can reuse its embedding.
+    """
+
+    def __new__(cls, score, chunks, row):
+        chunk = chunks[row]
+        hit = super().__new__(cls, (float(score), chunk["text"], chunk["source"]))
+        hit.row = int(row)
+        return hit
+
+
+def as_matrix(chunk_embeddings):
+    """
+    Views chunk embeddings as one contiguous float32 (n, dim) matrix.
+    No copy is made when they already are one.
+    """
+    matrix = np.asarray(chunk_embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(0, 0) if matrix.size == 0 else matrix[None, :]
+    return np.ascontiguousarray(matrix)
+
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, best first.
+    Uses a partial selection so only the k winners get sorted.
+    """
+    n = scores.shape[-1]
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape).copy()
+
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(idx, order, axis=-1)
+
+
 
 # Retrieve Top-K Chunks
 def retrieve_top_k(query_embedding, chunk_embeddings, chunks, k=3):
-    scored = []
-
-    for emb, chunk in zip(chunk_embeddings, chunks):
-        score = cosine_similarity(query_embedding, emb)
-        scored.append((score, chunk["text"], chunk["source"]))
+    """
+    Embeddings from EmbeddingModel are normalized, so a single
+    matrix-vector product gives the cosine scores for every chunk.
+    """
+    matrix = as_matrix(chunk_embeddings)
+    if matrix.shape[0] == 0:
+        return []
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return scored[:k]
+    scores = matrix @ np.asarray(query_embedding, dtype=np.float32)
+    return [Hit(scores[i], chunks, i) for i in top_k_indices(scores, k)]
 
 
+def retrieve_top_k_batch(query_embeddings, chunk_embeddings, chunks, k=3):
+    """
+    Scores a batch of queries with one matrix-matrix product.
+    Returns one top-k list per query.
+    """
+    matrix = as_matrix(chunk_embeddings)
+    queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+    if matrix.shape[0] == 0:
+        return [[] for _ in range(queries.shape[0])]
 
+    scores = queries @ matrix.T
+    top = top_k_indices(scores, k)
+    return [
+        [Hit(row_scores[i], chunks, i) for i in row_top]
+        for row_scores, row_top in zip(scores, top)
+    ]
@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+
+
+def row_origins(n_rows, ops):
+    """
+    Where each row of an updated index came from.
+
+    ops are the edits from one version to the next, in order:
+    ("drop", start, stop) removes rows [start, stop) and shifts later
+    rows down; ("add", start, stop) appends new rows at the end.
+
+    Returns:
+        np.ndarray: previous row id per updated row, -1 for added rows.
+    """
+    origins = np.arange(n_rows, dtype=np.intp)
+    for op, start, stop in ops:
+        if op == "drop":
+            origins = np.delete(origins, np.s_[start:stop])
+        else:
+            origins = np.concatenate([origins, np.full(stop - start, -1, dtype=np.intp)])
+    return origins
+
+
+class VersionedIndex:
+    """
+    Retriever whose search structures are built per index version.
+
+    Everything one search reads lives in a single immutable value with
+    `version` and `source` fields. When the caller's index snapshot (see
+    backend.state.IndexSnapshot) has a new version, the value is rebuilt
+    once, under a lock, and swapped in with one assignment. Without a
+    snapshot, a different embeddings object means a new version.
+
+    Without a row filter, a search is scoped to the snapshot's `live`
+    rows, so rows it marks dead are never returned.
+
+    The value for the previous version is kept too, so requests that
+    took their snapshot before an update still search the rows they
+    hold. A request on an even older version gets a one-off value from
+    _stale, built outside the lock and never installed; by default that
+    is a _rebuild. Subclasses implement _empty, _rebuild, _search and
+    _search_batch.
+    """
+
+    def __init__(self):
+        self._built = self._empty()
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._built.chunks)
+
+    def _matches(self, built, chunk_embeddings, snapshot):
+        if snapshot is not None:
+            return built.version == snapshot.version
+        return chunk_embeddings is built.source
+
+    def _sync(self, chunk_embeddings, chunks, snapshot=None):
+        current = self._built
+        for built in (current, self._previous):
+            if built is not None and self._matches(built, chunk_embeddings, snapshot):
+                return built
+
+        if snapshot is not None and current.version is not None \
+                and snapshot.version < current.version:
+            return self._stale(current, chunk_embeddings, chunks, snapshot)
+
+        with self._lock:
+            current = self._built
+            if self._matches(current, chunk_embeddings, snapshot):
+                return current
+
+            built = self._rebuild(current, chunk_embeddings, chunks, snapshot)
+            if snapshot is None or current.version is None or snapshot.version > current.version:
+                self._previous, self._built = current, built
+            return built
+
+    def _stale(self, current, chunk_embeddings, chunks, snapshot):
+        return self._rebuild(current, chunk_embeddings, chunks, snapshot)
+
+    def search(self, query_embedding, k=3, row_filter=None):
+        return self._search(self._built, query_embedding, k, row_filter)
+
+    def search_batch(self, query_embeddings, k=3, row_filter=None):
+        return self._search_batch(self._built, query_embeddings, k, row_filter)
+
+    # ------------------------------
+    # Retriever protocol
+    # ------------------------------
+    def __call__(self, query_embedding, chunk_embeddings, chunks, k=3, row_filter=None,
+                 snapshot=None):
+        built = self._sync(chunk_embeddings, chunks, snapshot)
+        return self._search(built, query_embedding, k, _scope(row_filter, snapshot))
+
+    def batch(self, query_embeddings, chunk_embeddings, chunks, k=3, row_filter=None,
+              snapshot=None):
+        built = self._sync(chunk_embeddings, chunks, snapshot)
+        return self._search_batch(built, query_embeddings, k, _scope(row_filter, snapshot))
+
+
+def _scope(row_filter, snapshot):
+    if row_filter is None and snapshot is not None:
+        return snapshot.live
+    return row_filter
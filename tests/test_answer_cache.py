@@ -0,0 +1,33 @@
+import numpy as np
+
+from rag_core.answer_cache import SemanticAnswerCache, chunk_set_key
+
+HITS = [(0.9, "Ravens are clever birds.", "birds.txt")]
+
+
+def unit(*values):
+    v = np.array(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_near_duplicate_question_hits():
+    cache = SemanticAnswerCache(max_distance=0.05)
+    key = chunk_set_key(HITS)
+    cache.store(unit(1, 0), key, "yes", version=1)
+
+    assert cache.lookup(unit(1, 0.01), key, version=1) == "yes"
+    assert cache.lookup(unit(0, 1), key, version=1) is None
+
+
+def test_versions_do_not_evict_each_other():
+    cache = SemanticAnswerCache()
+    key = chunk_set_key(HITS)
+    cache.store(unit(1, 0), key, "old", version=1)
+    cache.store(unit(1, 0), key, "new", version=2)
+
+    # Requests on both snapshots interleave during an update
+    for _ in range(3):
+        assert cache.lookup(unit(1, 0), key, version=1) == "old"
+        assert cache.lookup(unit(1, 0), key, version=2) == "new"
+    assert cache.lookup(unit(1, 0), key, version=3) is None
+    assert cache.stats()["size"] == 2
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from backend.rag_service import answer_questions
+from backend.schemas import BatchQueryRequest
+from benchmarks.standins import HashEmbedder
+from llm.llm_model import StubLLM
+from rag_core.cache import LRUCache
+from rag_core.pipeline import RAGPipeline
+from retrieval.dense_index import DenseIndex
+
+CHUNKS = [
+    {"text": "Ravens are clever birds.", "source": "birds.txt"},
+    {"text": "Transformers use attention.", "source": "ml.txt"}
+]
+
+
+def make_pipeline(query_cache=None):
+    embedder = HashEmbedder(dim=32)
+    pipeline = RAGPipeline(embedder, StubLLM(), DenseIndex(), query_cache=query_cache)
+    return pipeline, embedder.encode_batch([c["text"] for c in CHUNKS])
+
+
+@pytest.mark.parametrize("query_cache", [None, LRUCache(maxsize=8)])
+def test_embed_no_queries(query_cache):
+    pipeline, _ = make_pipeline(query_cache)
+
+    assert pipeline.embed_queries([]).shape == (0, 32)
+
+
+@pytest.mark.parametrize("query_cache", [None, LRUCache(maxsize=8)])
+def test_answer_no_questions(query_cache):
+    pipeline, matrix = make_pipeline(query_cache)
+
+    assert answer_questions([], 3, 0.0, pipeline, matrix, CHUNKS, pipeline.embedding_model) == []
+
+
+def test_answer_questions_in_order():
+    pipeline, matrix = make_pipeline(LRUCache(maxsize=8))
+
+    results = answer_questions(
+        ["are ravens clever", "what do transformers use"], 1, 0.0, pipeline, matrix, CHUNKS,
+        pipeline.embedding_model, metrics=[]
+    )
+
+    assert [r["sources"] for r in results] == [["birds.txt"], ["ml.txt"]]
+
+
+def test_batch_request_needs_questions():
+    with pytest.raises(ValidationError):
+        BatchQueryRequest(questions=[])
@@ -0,0 +1,26 @@
+import pytest
+
+from llm.batcher import BatchingLLM
+from llm.llm_model import StubLLM
+
+
+class ShortLLM:
+    # A backend that drops the last result of every batch
+    def generate_batch(self, prompts):
+        return [f"answer to {p}" for p in prompts][:-1]
+
+
+def test_results_match_prompts():
+    llm = BatchingLLM(StubLLM(), max_batch_size=4)
+    prompts = [f"Context: item {i}.\nQuestion: item {i}?" for i in range(6)]
+
+    assert llm.generate_batch(prompts) == [f"item {i}." for i in range(6)]
+
+
+def test_missing_results_fail_every_caller():
+    llm = BatchingLLM(ShortLLM(), max_batch_size=4, max_wait_ms=50)
+    futures = [llm.submit(p) for p in "abc"]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="results for"):
+            future.result(timeout=5)
@@ -0,0 +1,30 @@
+from ingestion.chunking import chunk_document, chunker_id, tokenizer_id
+
+
+class FakeTokenizer:
+    def __init__(self, name_or_path, vocab):
+        self.name_or_path = name_or_path
+        self.vocab = vocab
+
+    def get_vocab(self):
+        return dict(self.vocab)
+
+
+def test_tokenizer_id_ignores_where_it_was_loaded_from():
+    vocab = {"[PAD]": 0, "raven": 1, "##s": 2}
+    cached = FakeTokenizer("/home/a/.cache/huggingface/x", vocab)
+    moved = FakeTokenizer("/mnt/models/x", vocab)
+    other = FakeTokenizer("/home/a/.cache/huggingface/x", {**vocab, "crow": 3})
+
+    assert tokenizer_id(cached) == tokenizer_id(moved)
+    assert tokenizer_id(cached) != tokenizer_id(other)
+    assert chunker_id(254, tokenizer_id(cached)) == chunker_id(254, tokenizer_id(moved))
+
+
+def test_repeated_chunks_are_kept_once():
+    text = "Header line.\n\nRavens are clever.\n\nHeader line.\n\nCrows are too."
+    record = chunk_document({"source": "a.txt", "text": text}, max_tokens=4)
+
+    texts = [c["text"].strip() for c in record["chunks"]]
+    assert texts.count("Header line.") == 1
+    assert len(record["chunk_hashes"]) == len(set(record["chunk_hashes"])) == len(texts)
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend.executor import ModelExecutor, Overloaded
+
+
+def events(n, closed=None):
+    try:
+        for i in range(n):
+            yield i
+    finally:
+        if closed is not None:
+            closed.set()
+
+
+async def settle():
+    # Lets asyncio finalize dropped async generators
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_stream_releases_after_exhaustion():
+    async def main():
+        executor = ModelExecutor(max_workers=1)
+        items, waits = await executor.stream(events, 3)
+        assert [i async for i in items] == [0, 1, 2]
+        assert set(waits) == {"admission_wait_sec", "executor_wait_sec"}
+        return executor.stats()
+
+    stats = run(main())
+    assert stats["in_flight"] == 0 and stats["completed"] == 1
+
+
+def test_stream_releases_when_closed_early():
+    closed = threading.Event()
+
+    async def main():
+        executor = ModelExecutor(max_workers=1)
+        items, _ = await executor.stream(events, 10, closed)
+        async for _ in items:
+            break
+        await items.aclose()
+        return executor.stats()
+
+    assert run(main())["in_flight"] == 0
+    assert closed.is_set()
+
+
+def test_stream_releases_when_dropped_unstarted():
+    # A client that disconnects before the body is iterated
+    async def main():
+        executor = ModelExecutor(max_workers=1, max_in_flight=1)
+        for _ in range(3):
+            items, _ = await executor.stream(events, 10)
+            del items
+            await settle()
+        return executor.stats()
+
+    assert run(main())["in_flight"] == 0
+
+
+def test_stream_error_before_first_item_releases():
+    def failing():
+        raise RuntimeError("boom")
+        yield
+
+    async def main():
+        executor = ModelExecutor(max_workers=1)
+        with pytest.raises(RuntimeError):
+            await executor.stream(failing)
+        return executor.stats()
+
+    assert run(main())["in_flight"] == 0
+
+
+def test_overloaded_before_streaming():
+    async def main():
+        executor = ModelExecutor(max_workers=1, max_in_flight=1, max_queue=1)
+        items, _ = await executor.stream(events, 2)
+        queued = asyncio.create_task(executor.stream(events, 2))
+        await settle()
+
+        with pytest.raises(Overloaded):
+            await executor.stream(events, 2)
+
+        await items.aclose()
+        second, _ = await queued
+        assert [i async for i in second] == [0, 1]
+        return executor.stats()
+
+    stats = run(main())
+    assert stats["rejected"] == 1 and stats["in_flight"] == 0
+
+
+def test_run_releases_on_error():
+    def failing():
+        raise ValueError("bad input")
+
+    async def main():
+        executor = ModelExecutor(max_workers=1)
+        with pytest.raises(ValueError):
+            await executor.run(failing)
+        result, waits = await executor.run(sum, [1, 2])
+        return result, executor.stats()
+
+    result, stats = run(main())
+    assert result == 3 and stats["in_flight"] == 0
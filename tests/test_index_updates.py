@@ -0,0 +1,223 @@
+import os
+
+import numpy as np
+import pytest
+
+import backend.state as state_module
+from backend.state import DocumentState
+from benchmarks.standins import HashEmbedder
+from embeddings.index_store import KEEP_VERSIONS, current_version
+from retrieval.dense_index import DenseIndex
+from retrieval.ivf_index import IVFIndex
+from retrieval.quantized_index import QuantizedIndex
+
+EMBEDDER = HashEmbedder(dim=32)
+QUERIES = ["ravens clever birds", "zebras stripes", "attention transformers layers"]
+
+
+def sentences(topic, n):
+    return " ".join(f"{topic} fact number {i} about {topic} habits." for i in range(n))
+
+
+def make_state(tmp_path, name="index", **kwargs):
+    os.makedirs(tmp_path / "docs", exist_ok=True)
+    kwargs.setdefault("compact_ratio", None)
+    return DocumentState(
+        str(tmp_path / "docs"), str(tmp_path / name), embedding_model=EMBEDDER,
+        code_kinds=["int8"], **kwargs
+    )
+
+
+def write(state, name, text, tags=None):
+    with open(os.path.join(state.data_dir, name), "w", encoding="utf-8") as f:
+        f.write(text)
+    return state.index_document(name, tags)
+
+
+def remove(state, name):
+    os.remove(os.path.join(state.data_dir, name))
+    return state.remove_document(name)
+
+
+def populate(state):
+    write(state, "birds.txt", sentences("Ravens", 6), tags=["animals"])
+    write(state, "zebras.txt", sentences("Zebras", 4), tags=["animals"])
+    write(state, "ml.txt", sentences("Transformers", 5))
+    write(state, "empty.txt", "")
+    write(state, "birds.txt", sentences("Ravens", 8))  # edit
+    remove(state, "zebras.txt")
+    remove(state, "empty.txt")
+    write(state, "cats.txt", sentences("Cats", 3), tags=["animals"])
+
+
+def live_texts(snapshot):
+    rows = range(len(snapshot.chunks)) if snapshot.live is None else snapshot.live.rows()
+    return sorted(snapshot.chunks[row]["text"] for row in rows)
+
+
+def bm25_scores(snapshot, query):
+    rows, scores = snapshot.lexical.score(query)
+    return sorted((snapshot.chunks[r]["text"], round(float(s), 4)) for r, s in zip(rows, scores))
+
+
+def search(retriever, snapshot, query, k=5, row_filter=None):
+    hits = retriever(
+        EMBEDDER(query), snapshot.chunk_embeddings, snapshot.chunks, k,
+        row_filter=row_filter, snapshot=snapshot
+    )
+    # Sorted, so rows with equal scores compare equal in any order
+    return sorted((round(hit[0], 4), hit[1]) for hit in hits)
+
+
+def test_incremental_updates_match_a_rebuild(tmp_path):
+    state = make_state(tmp_path)
+    populate(state)
+    snapshot = state.snapshot
+    fresh = make_state(tmp_path, "fresh").snapshot
+
+    assert snapshot.live is not None  # the edit and deletes only marked rows dead
+    assert snapshot.chunk_count == fresh.chunk_count < len(snapshot.chunks)
+    assert live_texts(snapshot) == live_texts(fresh)
+    for query in QUERIES:
+        assert bm25_scores(snapshot, query) == bm25_scores(fresh, query)
+        expected = search(DenseIndex(), fresh, query, k=50)
+        assert search(DenseIndex(), snapshot, query, k=50) == expected
+
+
+def test_removed_rows_are_never_returned(tmp_path):
+    state = make_state(tmp_path)
+    populate(state)
+    snapshot = state.snapshot
+
+    for retriever in (DenseIndex(), IVFIndex(nlist=4, nprobe=4), QuantizedIndex("int8")):
+        texts = [text for _, text in search(retriever, snapshot, "zebras stripes", k=50)]
+        assert len(texts) == snapshot.chunk_count
+        assert not any("Zebras" in text for text in texts)
+
+
+def test_approximate_retrievers_match_exact_after_each_update(tmp_path):
+    state = make_state(tmp_path)
+    exact = DenseIndex()
+    # Every cell probed, every candidate rescored: results must be exact
+    approximate = [IVFIndex(nlist=4, nprobe=4), QuantizedIndex("int8", rescore=100)]
+
+    steps = [
+        lambda: write(state, "birds.txt", sentences("Ravens", 6)),
+        lambda: write(state, "zebras.txt", sentences("Zebras", 4)),
+        lambda: write(state, "birds.txt", sentences("Ravens", 9)),
+        lambda: remove(state, "zebras.txt"),
+        lambda: write(state, "ml.txt", sentences("Transformers", 3)),
+        state.compact
+    ]
+    for step in steps:
+        step()
+        snapshot = state.snapshot
+        for query in QUERIES:
+            expected = search(exact, snapshot, query)
+            for retriever in approximate:
+                assert search(retriever, snapshot, query) == expected
+
+    # The retrievers patched their structures instead of rebuilding
+    assert snapshot.delta is not None and approximate[0]._built.version == snapshot.version
+
+
+def test_filters_cover_live_rows_only(tmp_path):
+    state = make_state(tmp_path)
+    populate(state)
+    snapshot = state.snapshot
+
+    assert state.row_filter(None) is snapshot.live
+    scope = state.row_filter({"tags": ["animals"]})
+    texts = sorted(snapshot.chunks[row]["text"] for row in scope.rows())
+    assert texts == sorted(
+        c["text"] for c in make_state(tmp_path, "fresh").snapshot.chunks
+        if c["source"] in ("birds.txt", "cats.txt")  # an edit keeps the tags
+    )
+
+    hits = search(DenseIndex(), snapshot, "ravens", k=50, row_filter=scope)
+    assert sorted(text for _, text in hits) == texts
+
+
+def test_compaction_drops_dead_rows(tmp_path):
+    state = make_state(tmp_path)
+    populate(state)
+    before = state.snapshot
+    results = [search(DenseIndex(), before, query) for query in QUERIES]
+
+    assert state.compact()
+    after = state.snapshot
+    assert after.live is None and len(after.chunks) == after.chunk_count == before.chunk_count
+    assert [op[0] for op in after.delta[1]] == ["drop"] * len(after.delta[1])
+    assert [search(DenseIndex(), after, query) for query in QUERIES] == results
+    for source, entry in after.manifest.items():
+        start, stop = entry["rows"]
+        assert {after.chunks[row]["source"] for row in range(start, stop)} <= {source}
+    assert not state.compact()
+
+
+def test_compaction_runs_in_the_background(tmp_path):
+    state = make_state(tmp_path, compact_ratio=0.25)
+    compacted = []
+    state.on_compacted = lambda: compacted.append(state.snapshot.version)
+
+    write(state, "birds.txt", sentences("Ravens", 6))
+    write(state, "ml.txt", sentences("Transformers", 2))
+    remove(state, "birds.txt")
+    state._compactor.join()
+
+    assert compacted and state.snapshot.live is None
+    assert live_texts(state.snapshot) == live_texts(make_state(tmp_path, "fresh").snapshot)
+
+
+def test_readers_see_each_published_version(tmp_path):
+    state = make_state(tmp_path)
+    reader = make_state(tmp_path)
+
+    for step in range(4):
+        version = current_version(state.index_dir)
+        write(state, f"doc{step}.txt", sentences(f"Topic{step}", step + 1))
+        if step == 2:
+            remove(state, "doc0.txt")
+        assert current_version(state.index_dir) != version
+
+        assert reader.load()
+        assert reader.snapshot.manifest == state.snapshot.manifest
+        assert live_texts(reader.snapshot) == live_texts(state.snapshot)
+        assert reader.snapshot.delta is not None
+
+
+def test_superseded_generations_are_pruned(tmp_path):
+    state = make_state(tmp_path)
+    reader = make_state(tmp_path)
+    write(state, "birds.txt", sentences("Ravens", 3))
+    reader.load()
+
+    for _ in range(KEEP_VERSIONS + 2):
+        state.reload()
+
+    generations = [name for name in os.listdir(state.index_dir) if name.startswith("g")]
+    assert len(generations) == KEEP_VERSIONS + 1
+    # A reader keeps the version it mapped until it loads the new one
+    assert live_texts(reader.snapshot) == live_texts(state.snapshot)
+    assert reader.load() and reader.snapshot.manifest == state.snapshot.manifest
+
+
+def test_failed_write_publishes_nothing(tmp_path, monkeypatch):
+    state = make_state(tmp_path)
+    write(state, "birds.txt", sentences("Ravens", 3))
+    snapshot, version = state.snapshot, current_version(state.index_dir)
+
+    def failing(*args, **kwargs):
+        raise RuntimeError("embedding failed")
+
+    monkeypatch.setattr(state_module, "embed_texts", failing)
+    with pytest.raises(RuntimeError):
+        write(state, "zebras.txt", sentences("Zebras", 2))
+    assert state.snapshot is snapshot and current_version(state.index_dir) == version
+
+    monkeypatch.undo()
+    assert state.index_document("zebras.txt")
+    assert live_texts(state.snapshot) == live_texts(make_state(tmp_path, "fresh").snapshot)
+    assert np.array_equal(
+        make_state(tmp_path).snapshot.chunk_embeddings, state.snapshot.chunk_embeddings
+    )
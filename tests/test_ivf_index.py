@@ -0,0 +1,54 @@
+import numpy as np
+
+from backend.state import IndexSnapshot
+from retrieval.dense_index import DenseIndex
+from retrieval.filters import RowFilter
+from retrieval.ivf_index import IVFIndex
+
+
+def corpus(n=400, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x, [{"text": str(i), "source": f"doc{i // 10}"} for i in range(n)]
+
+
+def rows(hits):
+    return [hit.row for hit in hits]
+
+
+def test_row_filter_is_the_third_positional_argument():
+    x, chunks = corpus()
+    ivf = IVFIndex(nlist=8, nprobe=8)
+    ivf.build(x, chunks)
+    scope = RowFilter([(0, 50)], len(chunks))
+
+    hits = ivf.search(x[3], 5, scope)
+
+    assert all(row < 50 for row in rows(hits))
+    assert rows(hits) == rows(DenseIndex(x, chunks).search(x[3], 5, scope))
+
+
+def test_all_cells_probed_matches_exact():
+    x, chunks = corpus()
+    ivf = IVFIndex(nlist=8)
+    ivf.build(x, chunks)
+    exact = DenseIndex(x, chunks)
+
+    for q in x[:20]:
+        assert rows(ivf.search(q, 5, nprobe=8)) == rows(exact.search(q, 5))
+
+
+def test_older_snapshot_is_scanned_exactly_and_not_installed():
+    x, chunks = corpus()
+    ivf = IVFIndex(nlist=8, nprobe=1)
+    exact = DenseIndex(x, chunks)
+
+    snapshots = [IndexSnapshot(v, chunks, x.copy(), None, {}) for v in (1, 2, 3)]
+    ivf(x[0], snapshots[1].chunk_embeddings, chunks, 3, snapshot=snapshots[1])
+    ivf(x[0], snapshots[2].chunk_embeddings, chunks, 3, snapshot=snapshots[2])
+
+    old = snapshots[0]
+    for q in x[:20]:
+        assert rows(ivf(q, old.chunk_embeddings, chunks, 5, snapshot=old)) == rows(exact.search(q, 5))
+    assert ivf._built.version == 3 and ivf._previous.version == 2
@@ -0,0 +1,50 @@
+from llm.llm_model import LLM
+
+
+class FakePipe:
+    """
+    Stands in for the text2text-generation pipeline: a list input gives
+    a flat list of dicts, a single prompt a one-element list.
+    """
+
+    def __init__(self, nested=False):
+        self.nested = nested
+        self.calls = []
+
+    def __call__(self, inputs, **kwargs):
+        self.calls.append((inputs, kwargs))
+        if isinstance(inputs, str):
+            return [{"generated_text": f"answer to {inputs}"}]
+
+        outputs = [{"generated_text": f"answer to {p}"} for p in inputs]
+        if self.nested:
+            return [[output] for output in outputs]
+        return outputs
+
+
+def make_llm(pipe):
+    # Skips __init__, which would load a model
+    llm = object.__new__(LLM)
+    llm.pipe = pipe
+    llm.max_new_tokens = 16
+    return llm
+
+
+def test_generate_batch_flat_outputs():
+    pipe = FakePipe()
+    llm = make_llm(pipe)
+
+    answers = llm.generate_batch(["a", "b", "c"])
+
+    assert answers == ["answer to a", "answer to b", "answer to c"]
+    assert pipe.calls[0][1] == {"max_new_tokens": 16, "batch_size": 3}
+
+
+def test_generate_batch_nested_outputs():
+    llm = make_llm(FakePipe(nested=True))
+
+    assert llm.generate_batch(("a", "b")) == ["answer to a", "answer to b"]
+
+
+def test_single_prompt():
+    assert make_llm(FakePipe())("q") == "answer to q"
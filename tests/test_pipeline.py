@@ -0,0 +1,60 @@
+from llm.llm_model import NO_ANSWER, StubLLM
+from rag_core.pipeline import RAGPipeline
+
+
+class RecordingLLM(StubLLM):
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def generate_batch(self, prompts):
+        self.prompts.extend(prompts)
+        return super().generate_batch(prompts)
+
+
+RELEVANT = (0.8, "Ravens are clever birds.", "birds.txt")
+NOISE = (0.1, "Quarterly revenue grew slightly.", "report.txt")
+
+
+def make_pipeline(threshold=0.3):
+    llm = RecordingLLM()
+    return RAGPipeline(None, llm, None, threshold=threshold), llm
+
+
+def test_answer_skips_chunks_below_threshold():
+    pipeline, llm = make_pipeline()
+
+    assert pipeline.answer("are ravens clever", [RELEVANT, NOISE]) == "Ravens are clever birds."
+    assert "Quarterly" not in llm.prompts[0]
+
+
+def test_answer_without_passing_chunks_refuses():
+    pipeline, llm = make_pipeline()
+
+    assert pipeline.answer("revenue", [NOISE]) == NO_ANSWER
+    assert "".join(pipeline.stream_answer("revenue", [NOISE])) == NO_ANSWER
+    assert llm.prompts == []
+
+
+def test_answer_batch_thresholds_each_question():
+    pipeline, llm = make_pipeline()
+
+    answers = pipeline.answer_batch(["revenue", "are ravens clever"], [[NOISE], [RELEVANT, NOISE]])
+
+    assert answers == [NO_ANSWER, "Ravens are clever birds."]
+    assert len(llm.prompts) == 1
+
+
+def test_threshold_argument_overrides_default():
+    pipeline, llm = make_pipeline()
+
+    pipeline.answer("revenue", [NOISE], threshold=0.0)
+    assert "Quarterly" in llm.prompts[0]
+
+
+def test_stream_answer_uses_threshold():
+    pipeline, llm = make_pipeline()
+
+    pieces = list(pipeline.stream_answer("are ravens clever", [NOISE, RELEVANT]))
+
+    assert "".join(pieces).split() == ["Ravens", "are", "clever", "birds."]
@@ -0,0 +1,51 @@
+import threading
+import time
+
+from rag_core.telemetry import Registry, Trace
+
+
+def hot_spot(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def stream(traces):
+    # Like rag_service.stream_question: the trace starts in the first step
+    trace = Trace("stream", registry=Registry())
+    traces.append(trace)
+    with trace.paused():
+        yield "retrieval"
+    hot_spot(0.2)
+    profiler = trace.profiler
+    trace.finish()
+    yield profiler
+
+
+def test_profiler_follows_the_thread_that_resumes_a_stream(monkeypatch):
+    monkeypatch.setenv("RAG_PROFILE_SLOW_MS", "1")
+    monkeypatch.setenv("RAG_PROFILE_INTERVAL_MS", "1")
+    steps = stream([])
+
+    # Like the executor: each step on a different pool thread, while
+    # the thread that ran the first one idles
+    results = []
+    for _ in range(2):
+        worker = threading.Thread(target=lambda: results.append(next(steps)))
+        worker.start()
+        while worker.is_alive():
+            time.sleep(0.001)
+
+    functions = {frame.rsplit(" ", 1)[-1] for stack in results[1].samples for frame in stack}
+    assert "hot_spot" in functions
+    assert "test_profiler_follows_the_thread_that_resumes_a_stream" not in functions
+
+
+def test_finish_records_outcome_once():
+    registry = Registry()
+    trace = Trace("query", registry=registry)
+    trace.finish("answered")
+    trace.close()
+
+    assert registry.counters[("rag_requests_total", (("endpoint", "query"), ("outcome", "answered")))] == 1
+    assert sum(registry.counters.values()) == 1